@@ -0,0 +1,145 @@
+import dataclasses
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from ..services.name_index import NameIndexRow
+from ..services.pantry_service import DurablePantry, LedgerEvent, LineItem, PantryEntry, UsageTotal, UseOutcome, UseStatus
+
+@dataclasses.dataclass
+class PantryReadCacheStats:
+    hits: int = 0
+    loads: int = 0 # full reloads from the underlying pantry
+    write_throughs: int = 0
+    invalidations: int = 0
+    version_checks: int = 0
+
+class PantryReadCache:
+    """Process-wide snapshot of the pantry, shared by the per-session CachingDurablePantry wrappers.
+
+    The snapshot is a tuple that is replaced, never modified, so readers can hold on to it without
+    locking. `version` is the store's write counter the snapshot was loaded at, None if the store
+    keeps no counter.
+    """
+    def __init__(self, version_check_interval_seconds: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        # 0 asks the store for its version on every read; larger values trade freshness across workers for fewer queries
+        self.version_check_interval_seconds = version_check_interval_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.snapshot: Tuple[PantryEntry, ...] = ()
+        self.by_name: Dict[str, PantryEntry] = {}
+        self.version: Optional[int] = None
+        self.valid = False
+        self.checked_at = float("-inf")
+        self._stats = PantryReadCacheStats()
+
+    def install(self, entries: List[PantryEntry], version: Optional[int]):
+        self.snapshot = tuple(entries)
+        self.by_name = {entry.name: entry for entry in self.snapshot}
+        self.version = version
+        self.valid = True
+        self.checked_at = self.clock()
+
+    def invalidate(self):
+        with self.lock:
+            self._invalidate()
+
+    def _invalidate(self):
+        self.valid = False
+        self._stats.invalidations += 1
+
+    def stats(self) -> PantryReadCacheStats:
+        with self.lock:
+            return dataclasses.replace(self._stats)
+
+class CachingDurablePantry(DurablePantry):
+    """Read-through, write-through cache around another DurablePantry.
+
+    Reads are served from the shared PantryReadCache: name lookups are dictionary hits and
+    `find_all` copies the cached tuple. The cached entries are shared, so every read hands out
+    copies; PantryService updates entries in place before saving them. Writes from this process
+    update the snapshot directly; writes from other workers are picked up through the store's
+    version counter.
+    """
+    def __init__(self, delegate: DurablePantry, cache: PantryReadCache):
+        self.delegate = delegate
+        self.cache = cache
+
+    def _fresh_snapshot(self) -> PantryReadCache:
+        cache = self.cache
+        with cache.lock:
+            if cache.valid and cache.clock() - cache.checked_at < cache.version_check_interval_seconds:
+                cache._stats.hits += 1
+                return cache
+        version = self.delegate.current_version()
+        with cache.lock:
+            cache._stats.version_checks += 1
+            if cache.valid and version == cache.version:
+                cache.checked_at = cache.clock()
+                cache._stats.hits += 1
+                return cache
+        # Version first: a write landing during the reload leaves the snapshot marked as older, never newer
+        entries = self.delegate.find_all()
+        with cache.lock:
+            cache.install(entries, version)
+            cache._stats.loads += 1
+        return cache
+
+    def find_all(self) -> List[PantryEntry]:
+        return [dataclasses.replace(entry) for entry in self._fresh_snapshot().snapshot]
+
+    def find_all_where_names_exist(self, names: List[str]) -> List[PantryEntry]:
+        by_name = self._fresh_snapshot().by_name
+        found = []
+        for name in dict.fromkeys(names):
+            entry = by_name.get(name)
+            if entry is not None:
+                found.append(dataclasses.replace(entry))
+        return found
+
+    def current_version(self) -> Optional[int]:
+        return self.delegate.current_version()
+
+    def find_name_index_rows(self, since_version: Optional[int] = None) -> List[NameIndexRow]:
+        return self.delegate.find_name_index_rows(since_version)
+
+    def usage(self, start: datetime, end: datetime) -> List[UsageTotal]:
+        return self.delegate.usage(start, end)
+
+    def history(self, name: str, start: datetime, end: datetime) -> List[LedgerEvent]:
+        return self.delegate.history(name, start, end)
+
+    def save_all(self, entries: List[PantryEntry]) -> List[PantryEntry]:
+        return self._write_through(lambda: self.delegate.save_all(entries), lambda saved: saved)
+
+    def use_all(self, items: List[LineItem], all_or_nothing: bool = True) -> List[UseOutcome]:
+        return self._write_through(
+            lambda: self.delegate.use_all(items, all_or_nothing),
+            lambda outcomes: [outcome.entry for outcome in outcomes if outcome.status is UseStatus.USED]
+        )
+
+    def _write_through(self, write: Callable[[], List], written_entries: Callable[[List], List[PantryEntry]]) -> List:
+        cache = self.cache
+        with cache.lock:
+            valid_before, version_before = cache.valid, cache.version
+        try:
+            result = write()
+        except Exception:
+            self.cache.invalidate()
+            raise
+        saved = written_entries(result)
+        if not saved:
+            return result
+        version_after = self.delegate.current_version()
+        with cache.lock:
+            # Write through only if ours was the one write since the snapshot was taken
+            expected = None if version_before is None else version_before + 1
+            unchanged = cache.valid and valid_before and cache.version == version_before
+            if unchanged and version_after == expected:
+                by_id = {entry.id: entry for entry in cache.snapshot}
+                by_id.update((entry.id, dataclasses.replace(entry)) for entry in saved)
+                cache.install(list(by_id.values()), version_after)
+                cache._stats.write_throughs += 1
+            else:
+                cache._invalidate()
+        return result
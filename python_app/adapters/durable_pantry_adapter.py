@@ -1,34 +1,306 @@
-from typing import List
+import time
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional
 import uuid # Required for PantryEntry id type hint if not already imported by PantryEntry
+from sqlalchemy import String, select, type_coerce, update
 from sqlalchemy.orm import Session
-from ..models.pantry_model import PantryModel
-from ..services.pantry_service import DurablePantry, PantryEntry
+from sqlalchemy.orm.exc import StaleDataError
+from ..metrics import timed
+from ..models.pantry_model import PantryModel, PantryNameIndexModel, PantryVersionModel
+from ..services.name_index import NameIndexRow, normalize_name
+from ..services.pantry_service import (ConcurrentModificationError, DurablePantry, LedgerEvent, LedgerKind,
+                                       LedgerUnavailable, LineItem, PantryEntry, UsageTotal, UseOutcome, UseStatus)
+from ..services.pantry_batch import PantryBatch, ids_from_values
+from .pantry_ledger import _UPSERT_INSERTS, SqlAlchemyPantryLedger
 
 class SqlAlchemyDurablePantryAdapter(DurablePantry):
-    def __init__(self, session: Session):
+    # Four bound parameters per row; keeps each statement below SQLite's 32766-variable limit
+    UPSERT_CHUNK_SIZE = 2000
+
+    def __init__(self, session: Session, bulk_upsert: bool = True, upsert_chunk_size: int = UPSERT_CHUNK_SIZE,
+                 ledger: bool = False, clock: Callable[[], float] = time.time):
         self.session = session
+        self.bulk_upsert = bulk_upsert
+        self.upsert_chunk_size = upsert_chunk_size
+        # With the ledger on, every save and use is also appended to it, in the same transaction
+        self.ledger = SqlAlchemyPantryLedger(session, clock) if ledger else None
 
     def _to_domain(self, model: PantryModel) -> PantryEntry:
-        """Helper method to convert SQLAlchemy model to domain object."""
-        return PantryEntry(id=model.id, name=model.name, amount=model.quantity, unit=model.unit)
+        """Helper method to convert SQLAlchemy model (or a Core row of the same table) to domain object."""
+        return PantryEntry(id=model.id, name=model.name, amount=model.quantity, unit=model.unit, version=model.version)
 
+    @timed("pantry_store")
     def find_all(self) -> List[PantryEntry]:
         all_models = self.session.query(PantryModel).all()
         return [self._to_domain(model) for model in all_models]
 
+    def stream_all(self, batch_size: int = 1000) -> Iterator[PantryEntry]:
+        """Yields every entry, fetching `batch_size` rows at a time from a server-side cursor."""
+        table = PantryModel.__table__
+        statement = select(table).order_by(table.c.name).execution_options(yield_per=batch_size)
+        for row in self.session.execute(statement):
+            yield self._to_domain(row)
+
+    @timed("pantry_store")
+    def find_all_batch(self) -> PantryBatch:
+        """Fills the batch columns straight from the result rows, without a PantryEntry or UUID object per row."""
+        table = PantryModel.__table__
+        entry_id = table.c.id
+        if not self.session.get_bind().dialect.supports_native_uuid:
+            # Read the stored hex digits as they are; they become the id column in one bytes.fromhex
+            entry_id = type_coerce(table.c.id, String)
+        rows = self.session.execute(select(entry_id, table.c.name, table.c.quantity, table.c.unit, table.c.version)).all()
+        if not rows:
+            return PantryBatch.from_columns([], [], [])
+        ids, names, amounts, units, versions = zip(*rows)
+        return PantryBatch.from_columns(names, amounts, units, ids=ids_from_values(ids), versions=versions)
+
+    @timed("pantry_store")
     def find_all_where_names_exist(self, names: List[str]) -> List[PantryEntry]:
         if not names: # Handle empty list of names to avoid issues with IN clause
             return []
         models = self.session.query(PantryModel).filter(PantryModel.name.in_(names)).all()
         return [self._to_domain(model) for model in models]
 
+    def current_version(self) -> Optional[int]:
+        return self.session.execute(select(PantryVersionModel.version).where(PantryVersionModel.id == 1)).scalar() or 0
+
+    def _bump_version(self) -> int:
+        # Runs in the same transaction as the write, so readers never see new rows with an old version
+        upsert_insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if upsert_insert is not None:
+            # One statement creates the row or bumps it, so two workers' first writes cannot both try to create it
+            table = PantryVersionModel.__table__
+            statement = upsert_insert(table).values(id=1, version=1)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.id], set_={"version": table.c.version + 1}
+            ).returning(table.c.version)
+            return self.session.execute(statement).scalar_one()
+        bumped = self.session.execute(
+            update(PantryVersionModel).where(PantryVersionModel.id == 1).values(version=PantryVersionModel.version + 1)
+        )
+        if bumped.rowcount == 0:
+            self.session.add(PantryVersionModel(id=1, version=1))
+            return 1
+        return self.current_version()
+
+    def _index_names(self, entries: List[PantryEntry], version: int):
+        """Upserts the normalized names of freshly written entries, tagged with the write's version."""
+        rows = {}
+        for entry in entries:
+            rows[entry.id] = {"entry_id": entry.id, "normalized_name": normalize_name(entry.name), "updated_version": version}
+        if not rows:
+            return
+        upsert_insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if upsert_insert is None:
+            for row in rows.values():
+                self.session.merge(PantryNameIndexModel(**row))
+            return
+        table = PantryNameIndexModel.__table__
+        statement = upsert_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.entry_id],
+            set_={"normalized_name": statement.excluded.normalized_name, "updated_version": statement.excluded.updated_version}
+        )
+        self.session.execute(statement, list(rows.values()))
+
+    def find_name_index_rows(self, since_version: Optional[int] = None) -> List[NameIndexRow]:
+        index, entries = PantryNameIndexModel.__table__, PantryModel.__table__
+        statement = select(index.c.entry_id, entries.c.name, index.c.normalized_name).join(
+            entries, entries.c.id == index.c.entry_id
+        )
+        if since_version is not None:
+            statement = statement.where(index.c.updated_version > since_version)
+        return [NameIndexRow(*row) for row in self.session.execute(statement)]
+
+    def _require_ledger(self) -> SqlAlchemyPantryLedger:
+        if self.ledger is None:
+            raise LedgerUnavailable("This pantry adapter was created without a ledger")
+        return self.ledger
+
+    def usage(self, start: datetime, end: datetime) -> List[UsageTotal]:
+        return self._require_ledger().usage(start, end)
+
+    def history(self, name: str, start: datetime, end: datetime) -> List[LedgerEvent]:
+        return self._require_ledger().history(name, start, end)
+
+    def compact_ledger(self, before: datetime) -> int:
+        return self._require_ledger().compact(before)
+
+    def rebuild_snapshot(self) -> int:
+        """Recomputes pantry_entry from the ledger (see SqlAlchemyPantryLedger.rebuild_snapshot); commits."""
+        ledger = self._require_ledger()
+        try:
+            changed = ledger.rebuild_snapshot()
+            if changed:
+                self._bump_version()
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return changed
+
+    @timed("pantry_store")
     def save_all(self, entries: List[PantryEntry]) -> List[PantryEntry]:
+        upsert_insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if self.bulk_upsert and upsert_insert is not None:
+            return self._upsert_all(entries, upsert_insert)
+        return self._save_all_orm(entries)
+
+    def _upsert_all(self, entries: List[PantryEntry], upsert_insert) -> List[PantryEntry]:
+        """Bulk save without a re-fetch; the returned entries reflect what was written.
+
+        Entries without a version go through one INSERT ... ON CONFLICT DO UPDATE ... RETURNING,
+        chunked. Versioned entries go through the same statement with the update made conditional
+        on the version they were read at (compare-and-swap); if any of them misses, the whole call
+        is rolled back. The update also sets `last_delta` from the row it replaces, so RETURNING
+        carries each write's ledger delta.
+        """
+        # A statement may touch each row only once, so the last write for an id wins, as with the ORM path
+        latest = {}
+        for entry in entries:
+            entry_id = entry.id if isinstance(entry.id, uuid.UUID) else uuid.UUID(str(entry.id))
+            latest[entry_id] = entry
+        if not latest:
+            return []
+        new_rows = [
+            {"id": entry_id, "name": entry.name, "quantity": entry.amount, "unit": entry.unit, "last_delta": entry.amount}
+            for entry_id, entry in latest.items() if entry.version is None
+        ]
+        versioned_rows = [
+            {"id": entry_id, "name": entry.name, "quantity": entry.amount, "unit": entry.unit, "last_delta": entry.amount,
+             "version": entry.version}
+            for entry_id, entry in latest.items() if entry.version is not None
+        ]
+
+        written = []
+        try:
+            if versioned_rows:
+                swapped = self._upsert_rows(versioned_rows, upsert_insert, compare_and_swap=True)
+                # A row deleted since it was read comes back inserted, at the version it was read at
+                if sum(row.version == latest[row.id].version + 1 for row in swapped) != len(versioned_rows):
+                    self.session.rollback()
+                    raise ConcurrentModificationError(self._conflicts(versioned_rows, latest))
+                written.extend(swapped)
+            if new_rows:
+                written.extend(self._upsert_rows(new_rows, upsert_insert))
+            saved_domain_entries = [self._to_domain(row) for row in written]
+            if self.ledger is not None:
+                self.ledger.record_changes(
+                    (entry, LedgerKind.SET, row.last_delta) for entry, row in zip(saved_domain_entries, written)
+                )
+            self._index_names(saved_domain_entries, self._bump_version())
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return saved_domain_entries
+
+    def _upsert_rows(self, rows: List[dict], upsert_insert, compare_and_swap: bool = False) -> list:
+        table = PantryModel.__table__
+        statement = upsert_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={
+                "name": statement.excluded.name,
+                "quantity": statement.excluded.quantity,
+                "unit": statement.excluded.unit,
+                "version": table.c.version + 1,
+                # Reads the quantity being replaced, so no pre-image SELECT is needed for the ledger
+                "last_delta": statement.excluded.quantity - table.c.quantity,
+            },
+            where=(table.c.version == statement.excluded.version) if compare_and_swap else None,
+        ).returning(*table.c)
+        # Executed as "insertmanyvalues": the statement is compiled once and sent as multi-row
+        # INSERTs of upsert_chunk_size rows each, with RETURNING rows gathered across chunks
+        return self.session.connection().execution_options(
+            insertmanyvalues_page_size=self.upsert_chunk_size
+        ).execute(statement, rows).all()
+
+    def _conflicts(self, rows: List[dict], latest: dict) -> List[PantryEntry]:
+        # Only runs after a failed swap, to name the entries that were changed or deleted meanwhile
+        table = PantryModel.__table__
+        stored = {}
+        for start in range(0, len(rows), self.upsert_chunk_size):
+            ids = [row["id"] for row in rows[start:start + self.upsert_chunk_size]]
+            stored.update(self.session.execute(select(table.c.id, table.c.version).where(table.c.id.in_(ids))).all())
+        return [latest[row["id"]] for row in rows if stored.get(row["id"]) != row["version"]]
+
+    @timed("pantry_store")
+    def use_all(self, items: List[LineItem], all_or_nothing: bool = True) -> List[UseOutcome]:
+        """One conditional UPDATE per item, all in a single transaction.
+
+        Name and unit aren't unique, so each UPDATE targets one row by id: the first row with that
+        name and unit that holds enough. The stock check is repeated in the UPDATE's WHERE clause, so
+        the database serializes concurrent decrements of the same row and an item is never used past
+        zero. Only refused items cost an extra SELECT, to tell "not found" from "wrong unit" from
+        "not enough".
+        """
+        table = PantryModel.__table__
+        returning = self.session.get_bind().dialect.update_returning
+        outcomes = []
+        try:
+            for item in items:
+                enough = table.c.quantity >= item.amount
+                candidate = select(table.c.id).where(
+                    (table.c.name == item.name) & (table.c.unit == item.unit) & enough
+                ).order_by(table.c.id).limit(1)
+                if returning:
+                    statement = update(table).where((table.c.id == candidate.scalar_subquery()) & enough)
+                    row = self.session.execute(statement.values(
+                        quantity=table.c.quantity - item.amount, version=table.c.version + 1, last_delta=-item.amount
+                    ).returning(*table.c)).first()
+                else:
+                    # Without RETURNING the candidate is picked first and the row read back by its id
+                    entry_id = self.session.execute(candidate).scalar()
+                    statement = update(table).where((table.c.id == entry_id) & enough).values(
+                        quantity=table.c.quantity - item.amount, version=table.c.version + 1, last_delta=-item.amount
+                    )
+                    used = entry_id is not None and self.session.execute(statement).rowcount > 0
+                    row = self.session.execute(select(table).where(table.c.id == entry_id)).first() if used else None
+                if row is not None:
+                    entry = self._to_domain(row)
+                    outcomes.append(UseOutcome(item=item, status=UseStatus.USED, entry=entry))
+                else:
+                    outcomes.append(self._refusal(item))
+
+            if all_or_nothing and any(outcome.refused for outcome in outcomes):
+                self.session.rollback()
+                return [
+                    UseOutcome(item=outcome.item, status=UseStatus.ROLLED_BACK) if outcome.status is UseStatus.USED else outcome
+                    for outcome in outcomes
+                ]
+            used = [outcome for outcome in outcomes if outcome.status is UseStatus.USED]
+            if used:
+                if self.ledger is not None:
+                    self.ledger.record_changes((outcome.entry, LedgerKind.USE, -outcome.item.amount) for outcome in used)
+                self._bump_version()
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return outcomes
+
+    def _refusal(self, item: LineItem) -> UseOutcome:
+        # Core rows rather than ORM objects: the session's identity map hasn't seen the UPDATEs above
+        table = PantryModel.__table__
+        rows = self.session.execute(select(table).where(table.c.name == item.name)).all()
+        if not rows:
+            return UseOutcome(item=item, status=UseStatus.NOT_FOUND)
+        row = next((row for row in rows if row.unit == item.unit), rows[0])
+        status = UseStatus.INSUFFICIENT if row.unit == item.unit else UseStatus.UNIT_MISMATCH
+        return UseOutcome(item=item, status=status,
+                          entry=self._to_domain(row))
+
+    def _save_all_orm(self, entries: List[PantryEntry]) -> List[PantryEntry]:
         saved_domain_entries = []
         
         # Process entries to update existing or add new ones
         # It's more efficient to fetch all potentially existing models in one query
         entry_ids = [entry.id for entry in entries if entry.id is not None]
         existing_models_map = {}
+        conflicts = []
+        changes = []
         if entry_ids:
             existing_models = self.session.query(PantryModel).filter(PantryModel.id.in_(entry_ids)).all()
             existing_models_map = {model.id: model for model in existing_models}
@@ -37,10 +309,17 @@ class SqlAlchemyDurablePantryAdapter(DurablePantry):
             model = existing_models_map.get(entry_data.id)
             
             if model:
-                # Update existing model
+                if entry_data.version is not None and entry_data.version != model.version:
+                    conflicts.append(entry_data)
+                    continue
+                # Update existing model; the mapper's version_id_col makes the UPDATE check the version too
+                model.last_delta = entry_data.amount - model.quantity
+                changes.append((entry_data, LedgerKind.SET, model.last_delta))
                 model.name = entry_data.name
                 model.quantity = entry_data.amount
                 model.unit = entry_data.unit
+            elif entry_data.version is not None:
+                conflicts.append(entry_data) # deleted since it was read
             else:
                 # Create new model instance
                 # Ensure id is a UUID object if it's coming as a string
@@ -49,13 +328,26 @@ class SqlAlchemyDurablePantryAdapter(DurablePantry):
                     id=model_id, 
                     name=entry_data.name, 
                     quantity=entry_data.amount, 
-                    unit=entry_data.unit
+                    unit=entry_data.unit,
+                    last_delta=entry_data.amount
                 )
                 self.session.add(model)
+                changes.append((entry_data, LedgerKind.SET, entry_data.amount))
             # The model added or updated will be part of the session's transaction.
             # We will convert back to domain object after commit.
         
-        self.session.commit()
+        if conflicts:
+            self.session.rollback()
+            raise ConcurrentModificationError(conflicts)
+        if self.ledger is not None:
+            self.ledger.record_changes(changes)
+        self._index_names(entries, self._bump_version())
+        try:
+            self.session.commit()
+        except StaleDataError:
+            # A row changed between our SELECT and the versioned UPDATE
+            self.session.rollback()
+            raise ConcurrentModificationError(list(entries))
 
         # After commit, IDs are finalized (especially for new entries if not client-generated).
         # Re-fetch or use the current model instances to convert back to domain objects.
@@ -0,0 +1,201 @@
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Tuple
+from sqlalchemy import and_, bindparam, case, delete, func, insert, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from ..models.pantry_model import PantryLedgerModel, PantryLedgerRollupModel, PantryModel
+from ..services.pantry_service import LedgerEvent, LedgerKind, PantryEntry, UsageTotal
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def _timestamp(moment: datetime) -> float:
+    # Naive datetimes are taken as UTC, like the timestamps the app writes
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _day(timestamp: float) -> int:
+    return math.floor(timestamp / SECONDS_PER_DAY)
+
+class SqlAlchemyPantryLedger:
+    """Append-only change log of the pantry, with per-day rollups for compacted history.
+
+    record_changes only adds to the caller's transaction, so each change commits or rolls back
+    together with the stock update it describes. pantry_entry is the snapshot of the ledger: it is
+    updated in the same transaction as each append, and rebuild_snapshot recomputes it from the
+    ledger alone. Queries read whole `day` partitions through the ledger indexes.
+    """
+    def __init__(self, session: Session, clock: Callable[[], float] = time.time):
+        self.session = session
+        self.clock = clock
+
+    def _stamp(self) -> Tuple[float, int]:
+        now = self.clock()
+        return now, _day(now)
+
+    def record_changes(self, changes: Iterable[Tuple[PantryEntry, LedgerKind, float]]):
+        """Logs (entry after the change, kind, delta) triples with plain multi-row INSERTs.
+
+        The deltas come from the writes themselves (pantry_entry.last_delta), so nothing is read here.
+        """
+        now, day = self._stamp()
+        rows = [
+            {"entry_id": entry.id, "name": entry.name, "unit": entry.unit, "kind": kind.value, "delta": delta,
+             "quantity_after": entry.amount, "occurred_at": now, "day": day}
+            for entry, kind, delta in changes
+        ]
+        if rows:
+            self.session.connection().execute(insert(PantryLedgerModel.__table__), rows)
+
+    def rebuild_snapshot(self) -> int:
+        """Rewrites pantry_entry rows to the state the ledger records for them; returns how many changed.
+
+        Each entry gets the stock after its latest event, or, when all its events were compacted, the
+        closing stock of its last rolled-up day. Entries the ledger never saw (written while it was
+        off) are left alone. Adds to the caller's transaction.
+        """
+        ledger, rollup, stock = PantryLedgerModel.__table__, PantryLedgerRollupModel.__table__, PantryModel.__table__
+        last_day = select(rollup.c.entry_id, func.max(rollup.c.day).label("day")).group_by(rollup.c.entry_id).subquery()
+        compacted = select(rollup.c.entry_id, rollup.c.name, rollup.c.unit, rollup.c.quantity_end).join(
+            last_day, and_(rollup.c.entry_id == last_day.c.entry_id, rollup.c.day == last_day.c.day)
+        )
+        last_event = select(func.max(ledger.c.id).label("id")).group_by(ledger.c.entry_id).subquery()
+        recent = select(ledger.c.entry_id, ledger.c.name, ledger.c.unit, ledger.c.quantity_after).join(
+            last_event, ledger.c.id == last_event.c.id
+        )
+        recorded = {}
+        # Events still in the ledger are newer than any compacted day, so they are applied last
+        for statement in (compacted, recent):
+            for entry_id, name, unit, quantity in self.session.execute(statement):
+                recorded[entry_id] = (name, unit, quantity)
+        current = {row.id: row for row in self.session.execute(select(stock.c.id, stock.c.name, stock.c.unit, stock.c.quantity))}
+        inserts, updates = [], []
+        for entry_id, (name, unit, quantity) in recorded.items():
+            row = current.get(entry_id)
+            if row is None:
+                inserts.append({"id": entry_id, "name": name, "unit": unit, "quantity": quantity, "last_delta": quantity})
+            elif (row.name, row.unit, row.quantity) != (name, unit, quantity):
+                updates.append({"b_id": entry_id, "b_name": name, "b_unit": unit, "b_quantity": quantity,
+                                "b_last_delta": quantity - row.quantity})
+        if inserts:
+            self.session.execute(insert(stock), inserts)
+        if updates:
+            self.session.execute(update(stock).where(stock.c.id == bindparam("b_id")).values(
+                name=bindparam("b_name"), unit=bindparam("b_unit"), quantity=bindparam("b_quantity"),
+                last_delta=bindparam("b_last_delta"), version=stock.c.version + 1
+            ), updates)
+        changed = len(inserts) + len(updates)
+        if changed:
+            logger.info(f"Rebuilt {changed} pantry entries from the ledger")
+        return changed
+
+    def usage(self, start: datetime, end: datetime) -> List[UsageTotal]:
+        """Totals per name and unit. Compacted days are counted whole if they overlap [start, end)."""
+        start_ts, end_ts = _timestamp(start), _timestamp(end)
+        first_day, last_day = _day(start_ts), _day(math.nextafter(end_ts, -math.inf))
+        ledger, rollup = PantryLedgerModel.__table__, PantryLedgerRollupModel.__table__
+        added = func.sum(case((and_(ledger.c.kind == LedgerKind.SET.value, ledger.c.delta > 0), ledger.c.delta), else_=0.0))
+        used = func.sum(case((ledger.c.kind == LedgerKind.USE.value, -ledger.c.delta), else_=0.0))
+        recent = select(ledger.c.name, ledger.c.unit, added, used, func.count()).where(
+            ledger.c.day.between(first_day, last_day), ledger.c.occurred_at >= start_ts, ledger.c.occurred_at < end_ts
+        ).group_by(ledger.c.name, ledger.c.unit)
+        compacted = select(
+            rollup.c.name, rollup.c.unit, func.sum(rollup.c.added), func.sum(rollup.c.used), func.sum(rollup.c.events)
+        ).where(rollup.c.day.between(first_day, last_day)).group_by(rollup.c.name, rollup.c.unit)
+
+        totals: Dict[Tuple[str, str], UsageTotal] = {}
+        for statement in (compacted, recent):
+            for name, unit, added_total, used_total, events in self.session.execute(statement):
+                total = totals.setdefault((name, unit), UsageTotal(name=name, unit=unit))
+                total.added += added_total or 0.0
+                total.used += used_total or 0.0
+                total.events += events
+        return sorted(totals.values(), key=lambda total: (total.name, total.unit))
+
+    def history(self, name: str, start: datetime, end: datetime) -> List[LedgerEvent]:
+        """Individual events; days that were compacted only survive as totals in `usage`."""
+        ledger = PantryLedgerModel.__table__
+        statement = select(ledger).where(
+            ledger.c.name == name, ledger.c.occurred_at >= _timestamp(start), ledger.c.occurred_at < _timestamp(end)
+        ).order_by(ledger.c.id)
+        return [
+            LedgerEvent(entry_id=row.entry_id, name=row.name, unit=row.unit, kind=LedgerKind(row.kind), delta=row.delta,
+                        quantity_after=row.quantity_after,
+                        occurred_at=datetime.fromtimestamp(row.occurred_at, timezone.utc))
+            for row in self.session.execute(statement)
+        ]
+
+    def _fold_into_rollups(self, folded):
+        rollup = PantryLedgerRollupModel.__table__
+        upsert_insert = _UPSERT_INSERTS.get(self.session.get_bind().dialect.name)
+        if upsert_insert is None:
+            for row in self.session.execute(folded).all():
+                existing = self.session.get(PantryLedgerRollupModel, (row.day, row.entry_id))
+                if existing is None:
+                    self.session.add(PantryLedgerRollupModel(**row._mapping))
+                    continue
+                existing.name, existing.unit, existing.quantity_end = row.name, row.unit, row.quantity_end
+                existing.added += row.added
+                existing.used += row.used
+                existing.events += row.events
+            self.session.flush()
+            return
+        # WHERE true keeps SQLite from reading the upsert's ON CONFLICT as the join's ON
+        statement = upsert_insert(rollup).from_select(
+            ["day", "entry_id", "name", "unit", "added", "used", "events", "quantity_end"], folded.where(true())
+        )
+        # The late events were logged after the ones already folded, so their closing stock replaces the old one
+        statement = statement.on_conflict_do_update(
+            index_elements=[rollup.c.day, rollup.c.entry_id],
+            set_={
+                "name": statement.excluded.name,
+                "unit": statement.excluded.unit,
+                "added": rollup.c.added + statement.excluded.added,
+                "used": rollup.c.used + statement.excluded.used,
+                "events": rollup.c.events + statement.excluded.events,
+                "quantity_end": statement.excluded.quantity_end,
+            }
+        )
+        self.session.execute(statement)
+
+    def compact(self, before: datetime) -> int:
+        """Folds the events of every whole day before `before` into per-entry daily rollups and deletes them.
+
+        The rollup keeps each entry's stock at the end of the day, so the daily snapshots stay
+        available after the individual events are gone. Events that commit after their day was
+        compacted are added to the day's rollup row. Commits; returns the number of events folded.
+        """
+        cutoff_day = _day(_timestamp(before))
+        ledger, rollup = PantryLedgerModel.__table__, PantryLedgerRollupModel.__table__
+        per_day = select(
+            ledger.c.day, ledger.c.entry_id, func.max(ledger.c.id).label("last_id"),
+            func.sum(case((and_(ledger.c.kind == LedgerKind.SET.value, ledger.c.delta > 0), ledger.c.delta), else_=0.0)).label("added"),
+            func.sum(case((ledger.c.kind == LedgerKind.USE.value, -ledger.c.delta), else_=0.0)).label("used"),
+            func.count().label("events"),
+        ).where(ledger.c.day < cutoff_day).group_by(ledger.c.day, ledger.c.entry_id).subquery()
+        # The day's last event supplies the name, unit and closing stock
+        last = ledger.alias("last_event")
+        folded = select(
+            per_day.c.day, per_day.c.entry_id, last.c.name, last.c.unit, per_day.c.added, per_day.c.used,
+            per_day.c.events, last.c.quantity_after.label("quantity_end")
+        ).join(last, last.c.id == per_day.c.last_id)
+        try:
+            self._fold_into_rollups(folded)
+            deleted = self.session.execute(delete(ledger).where(ledger.c.day < cutoff_day)).rowcount
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        logger.info(f"Compacted {deleted} pantry ledger events before day {cutoff_day}")
+        return deleted
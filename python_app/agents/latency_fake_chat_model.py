@@ -0,0 +1,37 @@
+import asyncio
+import time
+from typing import Any, List, Optional
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+class LatencyFakeListChatModel(FakeListChatModel):
+    """FakeListChatModel that waits `latency` seconds before answering, like a slow upstream would.
+
+    The sync path blocks its thread with time.sleep, the async path awaits asyncio.sleep,
+    which is exactly the difference the async serving stack is meant to exploit.
+    """
+    latency: float = 0.0
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        time.sleep(self.latency)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # SimpleChatModel would push the sync _call onto a thread; await the latency instead
+        await asyncio.sleep(self.latency)
+        output_str = super()._call(messages, stop, None, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=output_str))])
@@ -1,20 +1,179 @@
-from langchain_core.chat_models.base import BaseChatModel # Updated to langchain_core
+import asyncio
+from typing import AsyncIterator, Iterator, List, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel # Updated to langchain_core
 from langchain_community.chat_models.fake import FakeListChatModel
-from langchain_core.messages import SystemMessage, HumanMessage # Updated to langchain_core
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, HumanMessage # Updated to langchain_core
+from python_app.llm.batching import MicroBatcher
+from python_app.llm.context_window import ContextWindowManager, Tokenizer, default_tokenizer
+from python_app.llm.response_cache import ResponseCache
+from python_app.metrics import current_timings, stage_timer, timed
+
+def _to_langchain_message(message: dict) -> BaseMessage:
+    if message["role"] in ("assistant", "ai"):
+        return AIMessage(content=message["content"])
+    if message["role"] == "system":
+        return SystemMessage(content=message["content"])
+    return HumanMessage(content=message["content"])
 
 class PythonStorageAgent:
     SYSTEM_PROMPT = "If prompted, tell the user that you're confused and don't quite know who or what you are. They should help you understand that better by providing you with a proper system prompt."
 
-    def __init__(self, chat_model: BaseChatModel):
+    def __init__(self, chat_model: BaseChatModel, response_cache: Optional[ResponseCache] = None,
+                 batcher: Optional[MicroBatcher] = None, chat_memory=None,
+                 context_window: Optional[ContextWindowManager] = None, tokenizer: Optional[Tokenizer] = None):
         self.chat_model = chat_model
+        self.response_cache = response_cache
+        # When set, non-streaming model calls are grouped with concurrent ones into a single batch call
+        self.batcher = batcher
+        # History for requests that carry a memory_id; anything with get_messages/append_messages works
+        self.chat_memory = chat_memory
+        # Keeps that history within a token budget; without it the whole history is sent
+        self.context_window = context_window
+        # Counts prompt and reply tokens for the Ollama response fields of timed requests
+        self.tokenizer = tokenizer or (context_window.tokenizer if context_window is not None else default_tokenizer())
+
+    @property
+    def model_name(self) -> str:
+        # OpenAI-style models expose model_name, others at least identify their type
+        return getattr(self.chat_model, 'model_name', None) or self.chat_model._llm_type
+
+    @property
+    def temperature(self) -> float:
+        # Models without a temperature (like the fake ones) answer deterministically
+        return getattr(self.chat_model, 'temperature', None) or 0.0
+
+    def _cached_reply(self, messages: List[BaseMessage]) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self.SYSTEM_PROMPT, self.model_name, self.temperature, messages)
+
+    def _remember_reply(self, messages: List[BaseMessage], reply: str):
+        if self.response_cache is not None:
+            self.response_cache.put(self.SYSTEM_PROMPT, self.model_name, self.temperature, messages, reply)
+
+    @timed("message_build")
+    def build_messages(self, user_message: str, history: Sequence[dict] = (), summary: str = "") -> List[BaseMessage]:
+        messages = [SystemMessage(content=self.SYSTEM_PROMPT)]
+        if summary:
+            messages.append(SystemMessage(content=ContextWindowManager.SUMMARY_PREFIX + summary))
+        messages.extend(_to_langchain_message(message) for message in history)
+        messages.append(HumanMessage(content=user_message))
+        return messages
+
+    def _note_tokens(self, messages: Optional[List[BaseMessage]] = None, reply: Optional[str] = None):
+        """Records token counts on the current request's timings; skipped (and free) outside a timed request."""
+        timings = current_timings()
+        if timings is None:
+            return
+        if messages is not None:
+            timings.prompt_tokens = sum(self.tokenizer.count(message.content) for message in messages)
+        if reply is not None:
+            timings.completion_tokens = self.tokenizer.count(reply)
+
+    def prepare_messages(self, user_message: str, memory_id: Optional[str] = None) -> List[BaseMessage]:
+        """Builds the prompt, including the conversation so far when a memory_id is given."""
+        with stage_timer("prompt_build"):
+            messages = self._prepare_messages(user_message, memory_id)
+        self._note_tokens(messages)
+        return messages
 
-    def chat(self, user_message: str) -> str:
-        messages = [
-            SystemMessage(content=self.SYSTEM_PROMPT),
-            HumanMessage(content=user_message)
-        ]
-        # .invoke is for LCEL, for older model API, it might be .predict_messages or similar
-        # For FakeListChatModel, .invoke should work with a list of messages.
-        # Or using .generate([messages])
-        response = self.chat_model.invoke(messages) 
+    def _prepare_messages(self, user_message: str, memory_id: Optional[str]) -> List[BaseMessage]:
+        if memory_id is None or self.chat_memory is None:
+            return self.build_messages(user_message)
+        history = self.chat_memory.get_messages(memory_id)
+        if self.context_window is None:
+            return self.build_messages(user_message, history)
+        window = self.context_window.build(memory_id, self.SYSTEM_PROMPT, history, user_message)
+        return self.build_messages(user_message, window.messages, window.summary)
+
+    def _record_turn(self, memory_id: Optional[str], user_message: str, reply: str):
+        if memory_id is not None and self.chat_memory is not None:
+            self.chat_memory.append_messages(memory_id, [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": reply}
+            ])
+
+    def chat(self, user_message: str, memory_id: Optional[str] = None) -> str:
+        messages = self.prepare_messages(user_message, memory_id)
+        cached = self._cached_reply(messages)
+        if cached is not None:
+            self._note_tokens(reply=cached)
+            self._record_turn(memory_id, user_message, cached)
+            return cached
+        with stage_timer("model_call"):
+            if self.batcher is not None:
+                response = self.batcher.submit(messages).result()
+            else:
+                # .invoke is for LCEL, for older model API, it might be .predict_messages or similar
+                # For FakeListChatModel, .invoke should work with a list of messages.
+                # Or using .generate([messages])
+                response = self.chat_model.invoke(messages) 
+        self._note_tokens(reply=response.content)
+        self._remember_reply(messages, response.content)
+        self._record_turn(memory_id, user_message, response.content)
+        return response.content
+
+    def stream(self, user_message: str, memory_id: Optional[str] = None) -> Iterator[str]:
+        """Yields the reply piece by piece as the model produces it."""
+        messages = self.prepare_messages(user_message, memory_id)
+        cached = self._cached_reply(messages)
+        if cached is not None:
+            self._record_turn(memory_id, user_message, cached)
+            yield cached
+            return
+        # Models without native streaming support fall back to a single chunk
+        # holding the whole completion, so callers never need to special-case them.
+        pieces = []
+        with stage_timer("model_call"):
+            for chunk in self.chat_model.stream(messages):
+                if chunk.content:
+                    pieces.append(chunk.content)
+                    yield chunk.content
+        self._remember_reply(messages, "".join(pieces))
+        self._record_turn(memory_id, user_message, "".join(pieces))
+
+    async def _aprepare_messages(self, user_message: str, memory_id: Optional[str]) -> List[BaseMessage]:
+        if memory_id is None:
+            with stage_timer("prompt_build"):
+                messages = self.build_messages(user_message)
+            self._note_tokens(messages)
+            return messages
+        # History reads (and summarization) block, so keep them off the event loop
+        return await asyncio.to_thread(self.prepare_messages, user_message, memory_id)
+
+    async def _arecord_turn(self, memory_id: Optional[str], user_message: str, reply: str):
+        if memory_id is not None:
+            await asyncio.to_thread(self._record_turn, memory_id, user_message, reply)
+
+    async def achat(self, user_message: str, memory_id: Optional[str] = None) -> str:
+        messages = await self._aprepare_messages(user_message, memory_id)
+        cached = self._cached_reply(messages)
+        if cached is not None:
+            self._note_tokens(reply=cached)
+            await self._arecord_turn(memory_id, user_message, cached)
+            return cached
+        with stage_timer("model_call"):
+            if self.batcher is not None:
+                response = await self.batcher.asubmit(messages)
+            else:
+                response = await self.chat_model.ainvoke(messages)
+        self._note_tokens(reply=response.content)
+        self._remember_reply(messages, response.content)
+        await self._arecord_turn(memory_id, user_message, response.content)
         return response.content
+
+    async def astream(self, user_message: str, memory_id: Optional[str] = None) -> AsyncIterator[str]:
+        messages = await self._aprepare_messages(user_message, memory_id)
+        cached = self._cached_reply(messages)
+        if cached is not None:
+            await self._arecord_turn(memory_id, user_message, cached)
+            yield cached
+            return
+        pieces = []
+        with stage_timer("model_call"):
+            async for chunk in self.chat_model.astream(messages):
+                if chunk.content:
+                    pieces.append(chunk.content)
+                    yield chunk.content
+        self._remember_reply(messages, "".join(pieces))
+        await self._arecord_turn(memory_id, user_message, "".join(pieces))
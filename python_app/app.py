@@ -1,4 +1,7 @@
-from flask import Flask, g
+import functools
+import time
+from flask import Flask, g, request
+from flask.logging import default_handler
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from python_app.models import Base
@@ -6,26 +9,55 @@ from python_app.models import Base
 # but they don't hurt. They are needed if you were to directly use the models in this file.
 from python_app.models.chat_memory_model import ChatMemoryModel
 from python_app.models.pantry_model import PantryModel
+from python_app.models.migrations import (add_pantry_entry_last_delta_column, add_pantry_entry_version_column,
+                                         backfill_pantry_name_index, migrate_chat_memory_blobs)
 
 # Import Blueprints
 from python_app.routes.curl_routes import curl_bp
 from python_app.routes.ollama_routes import ollama_bp
+from python_app.routes.pantry_routes import pantry_bp
+from python_app.routes.metrics_routes import metrics_bp
+from python_app.routes.admin_routes import admin_bp
+from python_app.routes.admission import AdmissionController
+from python_app.routes.validation import RequestLimits
+from python_app.cli import pantry_cli
 
 # LLM Imports
-from langchain_community.chat_models.fake import FakeListChatModel
 from python_app.agents.storage_agent import PythonStorageAgent
 from python_app.llm_orchestrator import PythonLLMOrchestrator
+from python_app.llm.backends import build_chat_model
+from python_app.llm.batching import MicroBatcher
+from python_app.llm.context_window import ContextWindowManager, LLMSummarizer
+from python_app.llm.response_cache import ResponseCache
+from python_app.llm.semantic_cache import HashingEmbedder, SemanticCache
+from python_app.llm.single_flight import SingleFlight
 from python_app.config import settings # Import settings
+from python_app.metrics import HTTP_REQUEST_SECONDS, REGISTRY, instrument_engine
+from python_app.profiling import Profiler
+from python_app import tracing
+from python_app.services.cached_chat_memory_store import CachedChatMemoryStore
+from python_app.services.pantry_service import PantryContention, PantryService
+from python_app.services.name_index import PantryNameIndex
+from python_app.services.units import UnitConverter
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.adapters.caching_durable_pantry import CachingDurablePantry, PantryReadCache
 
+import atexit
 import logging # For logging configuration
 
 DATABASE_URL = "sqlite:///./app.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine)
 
 def init_db():
     # Ensure all models are imported so Base has them registered
     Base.metadata.create_all(bind=engine)
+    add_pantry_entry_version_column(engine)
+    add_pantry_entry_last_delta_column(engine)
+    with SessionLocal() as session:
+        migrate_chat_memory_blobs(session)
+        backfill_pantry_name_index(session)
 
 app = Flask(__name__)
 
@@ -45,8 +77,9 @@ if not app.logger.handlers: # Check if handlers are configured
 
 app.logger.info(f"Application Name: {settings.APP_NAME}")
 app.logger.info(f"Attempting to load OpenAI API Key: {'present' if settings.OPENAI_API_KEY != 'dummy_openai_api_key' else 'not present (default will be used)'}") # Changed German to English
-app.logger.info(f"Using OpenAI Model: {settings.OPENAI_MODEL_NAME}")
-app.logger.info(f"Using OpenAI Temperature: {settings.OPENAI_TEMPERATURE}")
+app.logger.info(f"Using chat model backend: {settings.CHAT_MODEL_BACKEND}")
+app.logger.info(f"Using Model: {settings.CHAT_MODEL_NAME}")
+app.logger.info(f"Using Temperature: {settings.OPENAI_TEMPERATURE}")
 
 
 # Initialize LLM components
@@ -56,26 +89,198 @@ fake_llm_responses = [
     "You asked about chat. I am still a fake LLM, and quite confused.",
     "Regarding your query: As a confused LLM, I can only offer generic advice."
 ]
-# Initialize the chat model with a list of responses
-chat_model = FakeListChatModel(responses=fake_llm_responses)
-storage_agent = PythonStorageAgent(chat_model=chat_model)
-llm_orchestrator_instance = PythonLLMOrchestrator(storage_agent=storage_agent)
+# The fake backend answers with these responses in turn; the HTTP backends ignore them
+chat_model = build_chat_model(settings, fake_responses=fake_llm_responses)
+response_cache = None
+if settings.RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        capacity=settings.RESPONSE_CACHE_SIZE,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        sqlite_path=settings.RESPONSE_CACHE_SQLITE_PATH or None
+    )
+micro_batcher = None
+if settings.MICRO_BATCH_ENABLED:
+    micro_batcher = MicroBatcher.for_chat_model(
+        chat_model,
+        max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+        max_batch_size=settings.MICRO_BATCH_MAX_SIZE
+    )
+context_window = ContextWindowManager(
+    summarizer=LLMSummarizer(chat_model),
+    token_budget=settings.CONTEXT_WINDOW_TOKEN_BUDGET,
+    summary_token_budget=settings.CONTEXT_WINDOW_SUMMARY_TOKEN_BUDGET,
+    capacity=settings.CONTEXT_WINDOW_SUMMARY_CACHE_SIZE
+)
+# Chat memory outlives individual requests, so it gets its own sessions rather than g.db_session
+chat_memory_store = CachedChatMemoryStore(
+    session_factory=SessionLocal,
+    capacity=settings.CHAT_MEMORY_CACHE_SIZE,
+    flush_interval_seconds=settings.CHAT_MEMORY_FLUSH_INTERVAL_SECONDS,
+    flush_threshold=settings.CHAT_MEMORY_FLUSH_THRESHOLD,
+    max_flush_attempts=settings.CHAT_MEMORY_FLUSH_MAX_ATTEMPTS,
+    on_delete=context_window.forget
+)
+storage_agent = PythonStorageAgent(
+    chat_model=chat_model,
+    response_cache=response_cache,
+    batcher=micro_batcher,
+    chat_memory=chat_memory_store,
+    context_window=context_window
+)
+semantic_cache = None
+if settings.SEMANTIC_CACHE_ENABLED:
+    semantic_cache = SemanticCache(
+        embedder=HashingEmbedder(),
+        capacity=settings.SEMANTIC_CACHE_CAPACITY,
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+    )
+single_flight = SingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+llm_orchestrator_instance = PythonLLMOrchestrator(
+    storage_agent=storage_agent,
+    semantic_cache=semantic_cache,
+    single_flight=single_flight
+)
 
 # Make the orchestrator instance available to routes via app.config
 app.config['LLM_ORCHESTRATOR'] = llm_orchestrator_instance
+# Exposed so the hit/miss/eviction counters can be inspected while tuning size and TTL
+app.config['RESPONSE_CACHE'] = response_cache
+app.config['SEMANTIC_CACHE'] = semantic_cache
+app.config['SINGLE_FLIGHT'] = single_flight
+app.config['MICRO_BATCHER'] = micro_batcher
+app.config['CHAT_MEMORY_STORE'] = chat_memory_store
+app.config['CONTEXT_WINDOW'] = context_window
+app.config['REQUEST_LIMITS'] = RequestLimits(
+    max_body_bytes=settings.REQUEST_MAX_BODY_BYTES,
+    max_messages=settings.REQUEST_MAX_MESSAGES,
+    max_content_chars=settings.REQUEST_MAX_CONTENT_CHARS
+)
+# Shared by the Flask routes and the ASGI chat handlers; its stats() show queue depth, waits and rejections
+app.config['ADMISSION_CONTROLLER'] = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_queue_wait_seconds=settings.ADMISSION_MAX_QUEUE_WAIT_SECONDS,
+    global_rate=settings.ADMISSION_GLOBAL_RATE,
+    global_burst=settings.ADMISSION_GLOBAL_BURST,
+    client_rate=settings.ADMISSION_CLIENT_RATE,
+    client_burst=settings.ADMISSION_CLIENT_BURST
+) if settings.ADMISSION_ENABLED else None
+app.config['ADMISSION_CLIENT_HEADER'] = settings.ADMISSION_CLIENT_HEADER
+app.config['ADMISSION_TRUSTED_PROXY_HOPS'] = settings.ADMISSION_TRUSTED_PROXY_HOPS
+app.config['TRACING_ENABLED'] = settings.TRACING_ENABLED
+app.config['TRACE_SLOW_REQUEST_MS'] = settings.TRACE_SLOW_REQUEST_MS
+# /admin/profile arms it; until then the request hooks only check that no session is set
+app.config['PROFILER'] = Profiler(
+    interval_seconds=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+    max_seconds=settings.PROFILE_MAX_SECONDS
+)
+app.config['ADMIN_TOKEN'] = settings.ADMIN_TOKEN
+
+pantry_read_cache = PantryReadCache(
+    version_check_interval_seconds=settings.PANTRY_CACHE_VERSION_CHECK_SECONDS
+) if settings.PANTRY_CACHE_ENABLED else None
+
+# Conflict counters per item name, shared across requests to spot hot items
+pantry_contention = PantryContention()
+pantry_name_index = PantryNameIndex(
+    auto_merge_threshold=settings.NAME_AUTO_MERGE_THRESHOLD
+) if settings.NAME_INDEX_ENABLED else None
+unit_converter = UnitConverter(densities=settings.UNIT_DENSITIES)
+
+def pantry_service_factory(session, cached: bool = True) -> PantryService:
+    """Builds a PantryService on the given (usually per-request) session, sharing the process-wide read cache."""
+    durable_pantry = SqlAlchemyDurablePantryAdapter(session, ledger=settings.PANTRY_LEDGER_ENABLED)
+    if cached and pantry_read_cache is not None:
+        durable_pantry = CachingDurablePantry(durable_pantry, pantry_read_cache)
+    return PantryService(durable_pantry, contention=pantry_contention, max_attempts=settings.PANTRY_WRITE_MAX_ATTEMPTS,
+                         name_index=pantry_name_index, unit_converter=unit_converter)
+
+app.config['PANTRY_READ_CACHE'] = pantry_read_cache
+app.config['PANTRY_SERVICE_FACTORY'] = pantry_service_factory
+app.config['PANTRY_CONTENTION'] = pantry_contention
+app.config['PANTRY_NAME_INDEX'] = pantry_name_index
+app.config['UNIT_CONVERTER'] = unit_converter
+app.config['PANTRY_IMPORT_CHUNK_SIZE'] = settings.PANTRY_IMPORT_CHUNK_SIZE
+app.config['PANTRY_EXPORT_BATCH_SIZE'] = settings.PANTRY_EXPORT_BATCH_SIZE
+app.config['PANTRY_LEDGER_RETENTION_DAYS'] = settings.PANTRY_LEDGER_RETENTION_DAYS
+# For code that runs outside a request, like the CLI
+app.config['SESSION_FACTORY'] = SessionLocal
+
+# Counters the components already keep, read on every /metrics scrape
+REGISTRY.stats_gauges("stift_chat_memory", "Chat memory cache", chat_memory_store.stats)
+REGISTRY.stats_gauges("stift_pantry_contention", "Pantry write conflicts", pantry_contention.stats)
+for prefix, help, component in (
+    ("stift_admission", "Admission control", app.config['ADMISSION_CONTROLLER']),
+    ("stift_response_cache", "Exact response cache", response_cache),
+    ("stift_semantic_cache", "Semantic response cache", semantic_cache),
+    ("stift_single_flight", "Coalesced identical prompts", single_flight),
+    ("stift_micro_batcher", "Model call micro-batching", micro_batcher),
+    ("stift_context_window", "Context window trimming", context_window),
+    ("stift_pantry_read_cache", "Pantry read cache", pantry_read_cache),
+    ("stift_router", "Model replica routing", chat_model if hasattr(chat_model, 'stats') else None),
+):
+    if component is not None:
+        REGISTRY.stats_gauges(prefix, help, component.stats)
+
+def shutdown():
+    """Flushes write-behind state and stops background workers. Safe to call more than once."""
+    chat_memory_store.close()
+    if micro_batcher is not None:
+        micro_batcher.close()
+    if hasattr(chat_model, 'close'):
+        chat_model.close()
+
+atexit.register(shutdown)
 
 # Configure logging
 app.logger.setLevel(logging.INFO) # Set default logging level for the app
+# Every app log line names the trace of the request it was logged in
+default_handler.addFilter(tracing.TraceIdFilter())
+default_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s [trace %(trace_id)s]: %(message)s"))
 
 # Register Blueprints
 app.register_blueprint(curl_bp)
 app.register_blueprint(ollama_bp)
+app.register_blueprint(pantry_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(admin_bp)
+
+app.cli.add_command(pantry_cli)
 
 @app.before_request
 def before_request_hook():
-    g.db_session = SessionLocal()
+    g.request_started = time.perf_counter()
+    if app.config['TRACING_ENABLED']:
+        g.trace = tracing.Trace(tracing.incoming_trace_id(request.headers))
+        g.trace_tokens = tracing.activate(g.trace)
+    # The profiling request itself waits for the others, so it isn't one of them
+    if request.blueprint != admin_bp.name:
+        g.profiling_done = app.config['PROFILER'].request_started()
+    with tracing.span("session_setup"):
+        g.db_session = SessionLocal()
     app.logger.debug("DB Session created for request.")
 
+def _request_finished(trace, profiling_done, description: str):
+    if profiling_done is not None:
+        profiling_done()
+    if trace is not None:
+        tracing.log_if_slow(trace, app.config['TRACE_SLOW_REQUEST_MS'], description, app.logger)
+
+@app.after_request
+def after_request_hook(response):
+    # The rule, not the path, so an id in the URL doesn't make a new series per pantry item
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(endpoint, request.method, str(response.status_code)).observe(
+        time.perf_counter() - g.get('request_started', time.perf_counter()))
+    trace = g.pop('trace', None)
+    if trace is not None:
+        response.headers[tracing.TRACE_HEADER] = trace.trace_id
+    # Once the response is closed, so a streamed body is included
+    response.call_on_close(functools.partial(_request_finished, trace, g.pop('profiling_done', None),
+                                             f"{request.method} {request.path}"))
+    return response
+
 @app.teardown_request
 def teardown_request_hook(exception=None):
     db_session = g.pop('db_session', None)
@@ -84,6 +289,12 @@ def teardown_request_hook(exception=None):
         app.logger.debug("DB Session closed for request.")
     if exception:
         app.logger.error(f"Exception during request: {exception}")
+    # Still here if after_request didn't run
+    if 'trace' in g or 'profiling_done' in g:
+        _request_finished(g.pop('trace', None), g.pop('profiling_done', None), f"{request.method} {request.path}")
+    trace_tokens = g.pop('trace_tokens', None)
+    if trace_tokens is not None:
+        tracing.deactivate(trace_tokens)
 
 
 @app.route('/')
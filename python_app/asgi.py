@@ -0,0 +1,231 @@
+"""ASGI entry point, e.g. `uvicorn python_app.asgi:application`.
+
+The chat endpoints are served natively async: the model call is awaited through
+PythonLLMOrchestrator.acall/astream, so one process keeps many upstream completions in flight
+without parking a thread on each of them. Every other route is handed to the Flask app unchanged.
+"""
+import contextlib
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+from asgiref.wsgi import WsgiToAsgi
+from python_app.app import app as flask_app, shutdown
+from python_app.llm_orchestrator import PythonLLMOrchestrator
+from python_app import tracing
+from python_app.metrics import HTTP_REQUEST_SECONDS, RequestTimings, track_request
+from python_app.profiling import Profiler
+from python_app.routes.ollama_routes import chunk_line, final_chunk_line, timing_fields, OLLAMA_MODEL_NAME
+from python_app.routes.admission import AdmissionController, Rejected, client_id
+from python_app.routes.request_models import CurlChatRequest, OllamaChatRequest, OllamaChatResponse, OllamaMessage
+from python_app.routes.serialization import dumps, to_json, to_ndjson_line
+from python_app.routes.validation import MissingField, PayloadTooLarge, RequestLimits, ValidationError, parse_json
+
+Scope = dict
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+class AsyncChatApplication:
+    def __init__(self, orchestrator: PythonLLMOrchestrator, fallback_app, on_shutdown=None,
+                 limits: RequestLimits = RequestLimits(), admission: Optional[AdmissionController] = None,
+                 client_header: str = "", trusted_proxy_hops: int = 1, tracing_enabled: bool = True, slow_request_ms: float = 0.0,
+                 profiler: Optional[Profiler] = None, logger: Optional[logging.Logger] = None):
+        self.orchestrator = orchestrator
+        self.fallback_app = fallback_app
+        self.on_shutdown = on_shutdown
+        self.limits = limits
+        self.admission = admission
+        self.client_header = client_header
+        self.trusted_proxy_hops = trusted_proxy_hops
+        self.tracing_enabled = tracing_enabled
+        self.slow_request_ms = slow_request_ms
+        self.profiler = profiler
+        self.logger = logger or logging.getLogger(__name__)
+        self.routes = {
+            '/curl/chat': self.curl_chat,
+            '/ollama/api/chat': self.ollama_chat,
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        handler = self.routes.get(scope.get('path'))
+        if scope['type'] == 'http' and scope['method'] == 'POST' and handler is not None:
+            await self.observed(handler, scope, receive, send)
+            return
+        await self.fallback_app(scope, receive, send)
+
+    async def lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown is not None:
+                    self.on_shutdown()
+                # Pooled async HTTP connections belong to this loop, so they are closed here
+                aclose = getattr(self.orchestrator.storage_agent.chat_model, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def observed(self, handler, scope: Scope, receive: Receive, send: Send):
+        """Times, traces and (when a session is armed) profiles a chat request, as the Flask app's hooks do for the rest."""
+        started = time.perf_counter()
+        trace = None
+        if self.tracing_enabled:
+            headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+            trace = tracing.Trace(tracing.incoming_trace_id(headers))
+
+        async def observed_send(message: dict):
+            if message['type'] == 'http.response.start':
+                HTTP_REQUEST_SECONDS.labels(scope['path'], scope['method'], str(message['status'])).observe(time.perf_counter() - started)
+                if trace is not None:
+                    message = {**message, 'headers': [*message.get('headers', []), (b'x-trace-id', trace.trace_id.encode())]}
+            await send(message)
+
+        # Samples the loop's thread, so other coroutines show up too; the profile report says so
+        profiling_done = self.profiler.request_started(event_loop=True) if self.profiler is not None else None
+        try:
+            with tracing.trace_request(trace) if trace is not None else contextlib.nullcontext():
+                await self.admitted(handler, scope, receive, observed_send)
+        finally:
+            if profiling_done is not None:
+                profiling_done()
+            if trace is not None:
+                tracing.log_if_slow(trace, self.slow_request_ms, f"{scope['method']} {scope['path']}", self.logger)
+
+    async def admitted(self, handler, scope: Scope, receive: Receive, send: Send):
+        """Runs the handler, streaming included, holding an admission permit; rejections are answered right away."""
+        if self.admission is None:
+            await handler(scope, receive, send)
+            return
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        peer = scope.get('client')
+        try:
+            permit = await self.admission.aacquire(client_id(peer[0] if peer else None, headers, self.client_header.lower(),
+                                                             self.trusted_proxy_hops))
+        except Rejected as e:
+            await self._send_body(send, e.status, dumps({"error": e.reason}), [(b'retry-after', str(e.retry_after).encode())])
+            return
+        with permit:
+            await handler(scope, receive, send)
+
+    async def curl_chat(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            chat_request = parse_json(CurlChatRequest, await self._read_body(scope, receive), self.limits)
+        except PayloadTooLarge as e:
+            await self._send_json(send, 413, {"error": str(e)})
+            return
+        except ValidationError as e:
+            if isinstance(e, MissingField) or not e.path:
+                await self._send_json(send, 400, {"error": "Missing message"})
+            else:
+                await self._send_json(send, 400, {"error": f"Invalid request format: {str(e)}"})
+            return
+        reply = await self.orchestrator.acall(chat_request.message, memory_id=chat_request.memory_id)
+        await self._send_json(send, 200, {"reply": reply})
+
+    async def ollama_chat(self, scope: Scope, receive: Receive, send: Send):
+        with track_request() as timings:
+            await self._ollama_chat(scope, receive, send, timings)
+
+    async def _ollama_chat(self, scope: Scope, receive: Receive, send: Send, timings: RequestTimings):
+        try:
+            chat_request = parse_json(OllamaChatRequest, await self._read_body(scope, receive), self.limits)
+        except PayloadTooLarge as e:
+            await self._send_json(send, 413, {"error": str(e)})
+            return
+        except ValidationError as e:
+            error = f"Request parsing error: {str(e)}" if e.path else "Invalid request structure for Ollama chat"
+            await self._send_json(send, 400, {"error": error})
+            return
+        if not chat_request.messages:
+            await self._send_json(send, 400, {"error": "Invalid request structure for Ollama chat"})
+            return
+        last_message_content = chat_request.messages[-1].content
+
+        if chat_request.stream is True:
+            await self._stream_ollama_chat(send, last_message_content, timings)
+            return
+
+        reply_content = await self.orchestrator.acall(last_message_content)
+        chat_response = OllamaChatResponse(
+            model=OLLAMA_MODEL_NAME,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            message=OllamaMessage(role="assistant", content=reply_content),
+            done=True,
+            done_reason="stop",
+            **timing_fields(timings, time.perf_counter_ns())
+        )
+        await self._send_body(send, 200, to_json(chat_response))
+
+    async def _stream_ollama_chat(self, send: Send, message_content: str, timings: RequestTimings):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson')],
+        })
+        model_started_ns = time.perf_counter_ns()
+        first_chunk_ns = None
+        eval_count = 0
+        try:
+            async for piece in self.orchestrator.astream(message_content):
+                if first_chunk_ns is None:
+                    first_chunk_ns = time.perf_counter_ns()
+                eval_count += 1
+                await send({'type': 'http.response.body', 'body': chunk_line(piece), 'more_body': True})
+        except Exception as e:
+            flask_app.logger.error(f"Ollama chat stream failed: {str(e)}")
+            await send({'type': 'http.response.body', 'body': to_ndjson_line({"error": str(e)}), 'more_body': False})
+            return
+        finished_ns = time.perf_counter_ns()
+        final_line = final_chunk_line(timings.started_ns, model_started_ns, first_chunk_ns or finished_ns, finished_ns, eval_count,
+                                      timings.prompt_tokens)
+        await send({'type': 'http.response.body', 'body': final_line, 'more_body': False})
+
+    async def _read_body(self, scope: Scope, receive: Receive) -> bytes:
+        """The request body; raises PayloadTooLarge as soon as it is known to exceed the limit, without reading the rest."""
+        limit = self.limits.max_body_bytes
+        for name, value in scope.get('headers', []):
+            if name == b'content-length' and value.isdigit() and int(value) > limit:
+                raise PayloadTooLarge(f"request body is larger than {limit} bytes")
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise PayloadTooLarge(f"request body is larger than {limit} bytes")
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    async def _send_json(self, send: Send, status: int, payload: dict):
+        await self._send_body(send, status, dumps(payload))
+
+    async def _send_body(self, send: Send, status: int, body: bytes, extra_headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *extra_headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+application = AsyncChatApplication(
+    orchestrator=flask_app.config['LLM_ORCHESTRATOR'],
+    fallback_app=WsgiToAsgi(flask_app),
+    on_shutdown=shutdown,
+    limits=flask_app.config['REQUEST_LIMITS'],
+    admission=flask_app.config['ADMISSION_CONTROLLER'],
+    client_header=flask_app.config['ADMISSION_CLIENT_HEADER'],
+    trusted_proxy_hops=flask_app.config['ADMISSION_TRUSTED_PROXY_HOPS'],
+    tracing_enabled=flask_app.config['TRACING_ENABLED'],
+    slow_request_ms=flask_app.config['TRACE_SLOW_REQUEST_MS'],
+    profiler=flask_app.config['PROFILER'],
+    logger=flask_app.logger
+)
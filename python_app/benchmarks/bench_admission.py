@@ -0,0 +1,72 @@
+"""Goodput under sustained overload, with and without admission control.
+
+Chat requests arrive at twice what the upstream can serve: it handles 32 calls at a time,
+50 ms each, so 640 per second. Callers give up after 2 s, so an answer after that counts for
+nothing. Without admission control, everyone queues at the upstream until every answer comes
+too late.
+Run with: python -m python_app.benchmarks.bench_admission [--seconds 8] [--overload 2]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from python_app.routes.admission import AdmissionController, Rejected
+
+UPSTREAM_CAPACITY = 32
+UPSTREAM_SECONDS = 0.05
+CLIENT_TIMEOUT_SECONDS = 2.0
+
+async def sustained(seconds: float, overload: float, controller):
+    upstream = asyncio.Semaphore(UPSTREAM_CAPACITY)
+    outcomes = {"ok": 0, "late": 0, "rejected": 0}
+    latencies, rejection_latencies = [], []
+
+    async def one(i: int):
+        started = time.perf_counter()
+        try:
+            permit = await controller.aacquire(f"client {i % 50}") if controller is not None else None
+        except Rejected:
+            outcomes["rejected"] += 1
+            rejection_latencies.append(time.perf_counter() - started)
+            return
+        try:
+            async with upstream:
+                await asyncio.sleep(UPSTREAM_SECONDS)
+        finally:
+            if permit is not None:
+                permit.release()
+        elapsed = time.perf_counter() - started
+        if elapsed > CLIENT_TIMEOUT_SECONDS:
+            outcomes["late"] += 1
+        else:
+            outcomes["ok"] += 1
+            latencies.append(elapsed)
+
+    arrivals_per_tick = overload * UPSTREAM_CAPACITY / UPSTREAM_SECONDS / 100
+    tasks, arrived = [], 0.0
+    for tick in range(int(seconds * 100)):
+        arrived += arrivals_per_tick
+        while len(tasks) < int(arrived):
+            tasks.append(asyncio.ensure_future(one(len(tasks))))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+    return outcomes, latencies, rejection_latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=8.0)
+    parser.add_argument('--overload', type=float, default=2.0, help="arrival rate as a multiple of upstream capacity")
+    args = parser.parse_args()
+    for label, controller in (
+        ("no admission control", None),
+        ("admission control", AdmissionController(max_concurrent=UPSTREAM_CAPACITY, max_queue=4 * UPSTREAM_CAPACITY,
+                                                  max_queue_wait_seconds=0.5)),
+    ):
+        outcomes, latencies, rejection_latencies = asyncio.run(sustained(args.seconds, args.overload, controller))
+        p99 = statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else float("nan")
+        rejected_ms = statistics.median(rejection_latencies) * 1000 if rejection_latencies else float("nan")
+        print(f"{label:>22}: {outcomes['ok']:>5} answered in time (p99 {p99:6.0f} ms), {outcomes['late']:>5} too late, "
+              f"{outcomes['rejected']:>5} rejected (median {rejected_ms:.1f} ms)")
+
+if __name__ == '__main__':
+    main()
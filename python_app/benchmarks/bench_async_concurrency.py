@@ -0,0 +1,68 @@
+"""Compares the threaded WSGI path with the async ASGI path against a slow fake model.
+
+Run with: python -m python_app.benchmarks.bench_async_concurrency [--requests 200] [--latency 0.5]
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from python_app.agents.latency_fake_chat_model import LatencyFakeListChatModel
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.app import app
+from python_app.asgi import AsyncChatApplication
+from python_app.llm_orchestrator import PythonLLMOrchestrator
+
+def bench_threaded(orchestrator: PythonLLMOrchestrator, requests: int, workers: int) -> float:
+    app.config['LLM_ORCHESTRATOR'] = orchestrator
+
+    def one_request(i: int):
+        with app.test_client() as client:
+            response = client.post('/curl/chat', json={"message": f"request {i}"})
+            assert response.status_code == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one_request, range(requests)))
+    return time.perf_counter() - started
+
+async def bench_async(orchestrator: PythonLLMOrchestrator, requests: int) -> float:
+    application = AsyncChatApplication(orchestrator=orchestrator, fallback_app=None)
+
+    async def one_request(i: int):
+        body = json.dumps({"message": f"request {i}"}).encode()
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await application({'type': 'http', 'method': 'POST', 'path': '/curl/chat', 'headers': []}, receive, send)
+        assert sent[0]['status'] == 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one_request(i) for i in range(requests)])
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help='Injected model latency in seconds')
+    parser.add_argument('--workers', type=int, default=16, help='Thread count for the WSGI path')
+    args = parser.parse_args()
+
+    chat_model = LatencyFakeListChatModel(responses=["benchmark reply"], latency=args.latency)
+    orchestrator = PythonLLMOrchestrator(storage_agent=PythonStorageAgent(chat_model=chat_model))
+
+    threaded = bench_threaded(orchestrator, args.requests, args.workers)
+    concurrent = asyncio.run(bench_async(orchestrator, args.requests))
+
+    print(f"{args.requests} requests, {args.latency * 1000:.0f} ms model latency")
+    print(f"  threaded WSGI ({args.workers} workers): {threaded:8.2f} s  {args.requests / threaded:8.1f} req/s")
+    print(f"  async ASGI (single event loop):   {concurrent:8.2f} s  {args.requests / concurrent:8.1f} req/s")
+    print(f"  speed-up: {threaded / concurrent:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Per-call latency of HttpChatModel against the stand-in server: pooled keep-alive connection versus one connection per call.
+
+Run with: python -m python_app.benchmarks.bench_http_backend [--calls 2000] [--latency 0]
+"""
+import argparse
+import statistics
+import time
+import httpx
+from langchain_core.messages import HumanMessage
+from python_app.llm.http_chat_model import HttpChatModel
+from python_app.llm.stand_in_server import StandInModelServer
+
+MESSAGES = [HumanMessage(content="what can I cook tonight?")]
+
+def timed_calls(call, calls: int):
+    durations = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the stand-in waits before answering")
+    args = parser.parse_args()
+    with StandInModelServer(latency=args.latency) as server:
+        pooled = HttpChatModel(base_url=f"{server.url}/v1", model_name="stand-in")
+
+        # What a client without a shared pool pays: a new TCP connection for every call
+        unpooled = HttpChatModel(base_url=f"{server.url}/v1", model_name="stand-in")
+        unpooled._client = httpx.Client(**{**unpooled._client_options(), "limits": httpx.Limits(max_keepalive_connections=0)})
+
+        for label, call in (("new connection", lambda: unpooled.invoke(MESSAGES)), ("pooled", lambda: pooled.invoke(MESSAGES))):
+            connections_before = server.connections
+            durations = timed_calls(call, args.calls)
+            print(f"{label:>15}: p50 {statistics.median(durations):6.3f} ms, "
+                  f"p99 {statistics.quantiles(durations, n=100)[98]:6.3f} ms, {server.connections - connections_before} connections")
+        pooled.close()
+        unpooled.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Throughput of PythonStorageAgent with and without micro-batching against a backend with per-call overhead.
+
+The fake backend serves a limited number of calls at once and charges a fixed overhead per call
+plus a small cost per prompt, which is how batched inference servers behave.
+Run with: python -m python_app.benchmarks.bench_micro_batching
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.messages import AIMessage
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.batching import MicroBatcher
+
+# Concurrent calls the fake backend accepts, like the slots of an inference server
+backend_slots = threading.BoundedSemaphore(4)
+
+class OverheadFakeChatModel(FakeListChatModel):
+    overhead: float = 0.05
+    per_item_latency: float = 0.002
+
+    def _call(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        with backend_slots:
+            time.sleep(self.overhead + self.per_item_latency)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+    def batch(self, inputs: List[Any], config=None, *, return_exceptions: bool = False, **kwargs) -> List[Any]:
+        with backend_slots:
+            time.sleep(self.overhead + self.per_item_latency * len(inputs))
+        return [AIMessage(content=super(OverheadFakeChatModel, self)._call(messages)) for messages in inputs]
+
+def run(agent: PythonStorageAgent, requests: int, concurrency: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: agent.chat(f"request {i}"), range(requests)))
+    return time.perf_counter() - started
+
+def main():
+    global backend_slots
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--slots', type=int, default=4, help='Concurrent calls the backend accepts')
+    parser.add_argument('--overhead', type=float, default=0.05, help='Per-call overhead in seconds')
+    parser.add_argument('--per-item', type=float, default=0.002, help='Per-prompt cost in seconds')
+    args = parser.parse_args()
+    backend_slots = threading.BoundedSemaphore(args.slots)
+
+    chat_model = OverheadFakeChatModel(responses=["reply"], overhead=args.overhead, per_item_latency=args.per_item)
+    unbatched = run(PythonStorageAgent(chat_model=chat_model), args.requests, args.concurrency)
+
+    batcher = MicroBatcher.for_chat_model(chat_model, max_wait_ms=5, max_batch_size=16, max_concurrent_batches=args.slots)
+    try:
+        batched = run(PythonStorageAgent(chat_model=chat_model, batcher=batcher), args.requests, args.concurrency)
+        stats = batcher.stats()
+    finally:
+        batcher.close()
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent callers, {args.slots} backend slots")
+    print(f"  one invoke per request: {args.requests / unbatched:8.1f} req/s")
+    print(f"  micro-batched:          {args.requests / batched:8.1f} req/s")
+    print(f"  mean batch size {stats.mean_batch_size:.1f}, mean queued {stats.mean_queued_seconds * 1000:.2f} ms")
+    print(f"  batch size distribution: {dict(sorted(stats.batch_sizes.items()))}")
+
+if __name__ == '__main__':
+    main()
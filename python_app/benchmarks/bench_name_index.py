@@ -0,0 +1,62 @@
+"""Build time and batched lookup latency of TrigramNameIndex at pantry sizes well past a household's.
+
+Names are random two-word combinations of a grocery vocabulary plus a random suffix; queries are
+misspelled or pluralised variants of stored names.
+Run with: python -m python_app.benchmarks.bench_name_index [--names 100000]
+"""
+import argparse
+import random
+import time
+import uuid
+import numpy as np
+from python_app.services.name_index import NameIndexRow, TrigramNameIndex, normalize_name
+
+WORDS = ["tomato", "onion", "garlic", "flour", "sugar", "rice", "pasta", "milk", "butter", "cheese",
+         "apple", "banana", "carrot", "potato", "pepper", "bean", "lentil", "oat", "honey", "salt",
+         "roma", "whole", "brown", "red", "green", "smoked", "dried", "fresh", "wholegrain", "organic"]
+
+def random_name(rng: random.Random) -> str:
+    return f"{rng.choice(WORDS)} {rng.choice(WORDS)} {''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=5))}"
+
+def misspell(rng: random.Random, name: str) -> str:
+    position = rng.randrange(len(name))
+    return (name[:position] + name[position + 1:]).title() + "s"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--names', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--min-score', type=float, default=0.6)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    names = [random_name(rng) for _ in range(args.names)]
+    rows = [NameIndexRow(uuid.uuid4(), name, normalize_name(name)) for name in names]
+    index = TrigramNameIndex()
+    started = time.perf_counter()
+    index.add(rows)
+    print(f"built index of {len(index)} names in {time.perf_counter() - started:.2f}s")
+
+    targets = [rng.randrange(args.names) for _ in range(args.queries)]
+    queries = [misspell(rng, names[target]) for target in targets]
+    latencies, found = [], 0
+    for start in range(0, len(queries), args.batch):
+        batch = queries[start:start + args.batch]
+        began = time.perf_counter()
+        results = index.lookup_batch(batch, k=5)
+        latencies.append((time.perf_counter() - began) / len(batch))
+        found += sum(1 for result, target in zip(results, targets[start:start + args.batch])
+                     if any(match.entry_id == rows[target].entry_id for match in result))
+    latencies = np.array(latencies) * 1000
+    print(f"lookup per name: p50 {np.percentile(latencies, 50):.3f} ms, p99 {np.percentile(latencies, 99):.3f} ms")
+    print(f"misspelled name in top 5: {found / len(queries):.1%}")
+
+    # The auto-merge path only wants candidates above the threshold, which prunes most of the work
+    began = time.perf_counter()
+    for start in range(0, len(queries), args.batch):
+        index.lookup_batch(queries[start:start + args.batch], k=1, min_score=args.min_score)
+    print(f"top-1 lookup with min_score {args.min_score}: {(time.perf_counter() - began) / len(queries) * 1000:.3f} ms per name")
+
+if __name__ == '__main__':
+    main()
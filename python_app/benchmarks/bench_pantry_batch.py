@@ -0,0 +1,106 @@
+"""Memory and throughput of pantry entries as objects versus PantryBatch columns.
+
+Compares, at each size: the previous dict-backed dataclass, the slotted PantryEntry and a
+PantryBatch, for building them, their retained memory and a per-unit total; then reading a
+SQLite pantry of that size through find_all versus find_all_batch.
+Run with: python -m python_app.benchmarks.bench_pantry_batch [--sizes 1000000] [--skip-database]
+"""
+import argparse
+import dataclasses
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Optional
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.models.pantry_model import PantryModel
+from python_app.services.pantry_batch import PantryBatch
+from python_app.services.pantry_service import PantryEntry
+
+UNITS = ("g", "kg", "ml", "l", "pcs")
+
+@dataclasses.dataclass
+class DictPantryEntry:
+    """PantryEntry as it was before it got slots, for comparison."""
+    id: uuid.UUID = dataclasses.field(default_factory=uuid.uuid4, kw_only=True)
+    name: str
+    amount: float
+    unit: str
+    version: Optional[int] = dataclasses.field(default=None, kw_only=True, compare=False)
+
+def measured(build):
+    """(result, seconds, retained MiB) for build(); timed on an untraced run since tracemalloc slows allocation."""
+    gc.collect()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained / 2 ** 20
+
+def totals_by_unit(entries):
+    totals = {}
+    for entry in entries:
+        totals[entry.unit] = totals.get(entry.unit, 0.0) + entry.amount
+    return totals
+
+def in_memory(size: int):
+    names = [f"item {i}" for i in range(size)]
+    amounts = [float(i % 1000) for i in range(size)]
+    units = [UNITS[i % len(UNITS)] for i in range(size)]
+    print(f"{'':>14} {'build s':>8} {'MiB':>8} {'total s':>8}")
+    for label, build in (
+        ("dataclass", lambda: [DictPantryEntry(name=n, amount=a, unit=u) for n, a, u in zip(names, amounts, units)]),
+        ("slots", lambda: [PantryEntry(name=n, amount=a, unit=u) for n, a, u in zip(names, amounts, units)]),
+        ("batch", lambda: PantryBatch.from_columns(names, amounts, units)),
+    ):
+        built, elapsed, retained = measured(build)
+        started = time.perf_counter()
+        built.totals_by_unit() if isinstance(built, PantryBatch) else totals_by_unit(built)
+        print(f"{label:>14} {elapsed:>8.3f} {retained:>8.1f} {time.perf_counter() - started:>8.3f}")
+        del built
+
+def from_database(size: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            # Seeded through Core so the benchmark doesn't wait on the ledger and name index upkeep
+            for start in range(0, size, 50_000):
+                connection.execute(insert(PantryModel.__table__), [
+                    {"id": uuid.uuid4(), "name": f"item {i}", "quantity": float(i % 1000), "unit": UNITS[i % len(UNITS)], "version": 1}
+                    for i in range(start, min(start + 50_000, size))
+                ])
+        session_factory = sessionmaker(bind=engine)
+        for label, read in (("find_all", lambda adapter: adapter.find_all()),
+                            ("find_all_batch", lambda adapter: adapter.find_all_batch())):
+            with session_factory() as session:
+                adapter = SqlAlchemyDurablePantryAdapter(session)
+                loaded, elapsed, retained = measured(lambda: read(adapter))
+                print(f"{label:>14} {elapsed:>8.3f} {retained:>8.1f}")
+                del loaded
+        engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--skip-database', action='store_true')
+    args = parser.parse_args()
+    for size in args.sizes:
+        print(f"{size} entries in memory")
+        in_memory(size)
+        if not args.skip_database:
+            print(f"{size} entries read from SQLite (read s, MiB)")
+            from_database(size)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""save_all throughput of SqlAlchemyDurablePantryAdapter: bulk upsert versus the ORM path.
+
+Each size is measured twice per mode: inserting fresh entries, then updating all of them.
+With --ledger every save is also appended to the pantry ledger, as with PANTRY_LEDGER_ENABLED.
+Run with: python -m python_app.benchmarks.bench_pantry_save_all [--sizes 10000 100000] [--ledger] [--database-url ...]
+"""
+import argparse
+import dataclasses
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.services.pantry_service import PantryEntry
+
+def measure(session_factory, size: int, bulk_upsert: bool, ledger: bool = False):
+    entries = [PantryEntry(name=f"item {i}", amount=float(i), unit="g") for i in range(size)]
+    with session_factory() as session:
+        adapter = SqlAlchemyDurablePantryAdapter(session, bulk_upsert=bulk_upsert, ledger=ledger)
+        started = time.perf_counter()
+        adapter.save_all(entries)
+        inserted = time.perf_counter() - started
+
+    updates = [dataclasses.replace(entry, amount=entry.amount + 1) for entry in entries]
+    with session_factory() as session:
+        adapter = SqlAlchemyDurablePantryAdapter(session, bulk_upsert=bulk_upsert, ledger=ledger)
+        started = time.perf_counter()
+        adapter.save_all(updates)
+        updated = time.perf_counter() - started
+    return inserted, updated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--ledger', action='store_true', help='Also append every save to the pantry ledger')
+    parser.add_argument('--database-url', default=None, help='Defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        engine = create_engine(url)
+        session_factory = sessionmaker(bind=engine)
+        print(f"{'items':>8} {'mode':>5} {'insert s':>9} {'update s':>9}")
+        for size in args.sizes:
+            for bulk_upsert, mode in ((False, "orm"), (True, "bulk")):
+                Base.metadata.drop_all(engine)
+                Base.metadata.create_all(engine)
+                inserted, updated = measure(session_factory, size, bulk_upsert, args.ledger)
+                print(f"{size:>8} {mode:>5} {inserted:>9.3f} {updated:>9.3f}")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Tail latency across three replicas when one of them is slow: round robin versus the router, with and without hedging.
+
+The slow replica answers in 40 ms usually and 400 ms one time in five; the others take 10 ms
+with a 2% chance of 100 ms.
+Run with: python -m python_app.benchmarks.bench_router [--calls 500] [--concurrency 8]
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage
+from python_app.agents.latency_fake_chat_model import LatencyFakeListChatModel
+from python_app.llm.router import RoutedChatModel
+
+MESSAGES = [HumanMessage(content="what can I cook tonight?")]
+
+class TailLatencyChatModel(LatencyFakeListChatModel):
+    slow_latency: float = 0.0
+    slow_share: float = 0.0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.slow_latency if random.random() < self.slow_share else self.latency)
+        return self.responses[0]
+
+def replicas():
+    return [
+        TailLatencyChatModel(responses=["slow"], latency=0.04, slow_latency=0.4, slow_share=0.2),
+        TailLatencyChatModel(responses=["a"], latency=0.01, slow_latency=0.1, slow_share=0.02),
+        TailLatencyChatModel(responses=["b"], latency=0.01, slow_latency=0.1, slow_share=0.02),
+    ]
+
+def run(call, calls: int, concurrency: int):
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return (time.perf_counter() - started) * 1000
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        durations = list(pool.map(timed, range(calls)))
+    percentiles = statistics.quantiles(durations, n=100)
+    return statistics.median(durations), percentiles[94], percentiles[98]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+    round_robin = itertools.cycle(replicas())
+    router = RoutedChatModel(endpoints=replicas())
+    hedging_router = RoutedChatModel(endpoints=replicas(), hedge=True)
+    configurations = (
+        ("round robin", lambda: next(round_robin).invoke(MESSAGES)),
+        ("router", lambda: router.invoke(MESSAGES)),
+        ("router + hedge p95", lambda: hedging_router.invoke(MESSAGES)),
+    )
+    print(f"{'':>20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, call in configurations:
+        p50, p95, p99 = run(call, args.calls, args.concurrency)
+        print(f"{label:>20} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+if __name__ == '__main__':
+    main()
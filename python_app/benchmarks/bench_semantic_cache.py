@@ -0,0 +1,54 @@
+"""Measures SemanticCache lookup latency and recall as the number of cached prompts grows.
+
+Run with: python -m python_app.benchmarks.bench_semantic_cache [--entries 100000] [--dimension 256]
+"""
+import argparse
+import time
+import numpy as np
+from python_app.llm.semantic_cache import HashingEmbedder, SemanticCache
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--noise', type=float, default=0.02, help='Per-component noise added to form near-duplicates')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((args.entries, args.dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # The random vectors go in through put_embedding/lookup_embeddings; the embedder only sets the dimension
+    cache = SemanticCache(HashingEmbedder(args.dimension), capacity=args.entries, threshold=0.9)
+    started = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        cache.put_embedding(f"prompt {i}", vector, f"reply {i}")
+    fill_seconds = time.perf_counter() - started
+
+    targets = rng.integers(0, args.entries, args.queries)
+    queries = vectors[targets] + rng.standard_normal((args.queries, args.dimension)).astype(np.float32) * args.noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    similarity = float(np.mean(np.sum(queries * vectors[targets], axis=1)))
+
+    latencies = []
+    found = 0
+    for target, query in zip(targets, queries):
+        started = time.perf_counter()
+        hit = cache.lookup_embeddings(query[np.newaxis, :])[0]
+        latencies.append(time.perf_counter() - started)
+        if hit is not None and hit.response == f"reply {target}":
+            found += 1
+
+    started = time.perf_counter()
+    cache.lookup_embeddings(queries)
+    batch_seconds = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{args.entries} entries x {args.dimension} dims, filled in {fill_seconds:.1f} s")
+    print(f"near-duplicate queries (mean cosine {similarity:.3f}): recall {found / args.queries:.1%}")
+    print(f"single lookup: p50 {np.percentile(latencies_ms, 50):.3f} ms  p99 {np.percentile(latencies_ms, 99):.3f} ms")
+    print(f"batched lookup of {args.queries}: {batch_seconds * 1000 / args.queries:.3f} ms per query")
+
+if __name__ == '__main__':
+    main()
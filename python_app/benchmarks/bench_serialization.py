@@ -0,0 +1,36 @@
+"""Per-chunk cost of encoding Ollama streaming chunks: asdict + json.dumps versus the compiled serializers.
+
+Run with: python -m python_app.benchmarks.bench_serialization [--chunks 200000]
+"""
+import argparse
+import dataclasses
+import json
+import time
+from python_app.routes import serialization
+from python_app.routes.request_models import OllamaChatResponse, OllamaMessage
+
+def per_chunk_us(encode, chunks: int) -> float:
+    chunk = OllamaChatResponse(model="workshop_py_converted", created_at="2026-10-18T10:00:00.000000+00:00",
+                               message=OllamaMessage(role="assistant", content="token"), done=False)
+    started = time.perf_counter()
+    for _ in range(chunks):
+        encode(chunk)
+    return (time.perf_counter() - started) / chunks * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chunks', type=int, default=200_000)
+    args = parser.parse_args()
+    to_dict = serialization.serializer_for(OllamaChatResponse)
+    for label, encode in (
+        ("asdict + json.dumps", lambda chunk: (json.dumps(dataclasses.asdict(chunk)) + "\n").encode()),
+        ("compiled + json", lambda chunk: serialization._stdlib_dumps(to_dict(chunk)) + b"\n"),
+        ("compiled + orjson", serialization.to_ndjson_line if serialization.orjson is not None else None),
+    ):
+        if encode is None:
+            print(f"{label:>20}: orjson not installed")
+            continue
+        print(f"{label:>20}: {per_chunk_us(encode, args.chunks):6.2f} us per chunk")
+
+if __name__ == '__main__':
+    main()
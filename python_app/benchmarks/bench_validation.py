@@ -0,0 +1,36 @@
+"""Cost of turning an Ollama chat body into an OllamaChatRequest, and of rejecting bad ones.
+
+Run with: python -m python_app.benchmarks.bench_validation [--iterations 100000]
+"""
+import argparse
+import json
+import time
+from python_app.routes.request_models import OllamaChatRequest
+from python_app.routes.validation import RequestLimits, ValidationError, parse_json
+
+LIMITS = RequestLimits()
+
+def per_call_us(body: bytes, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            parse_json(OllamaChatRequest, body, LIMITS)
+        except ValidationError:
+            pass
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100_000)
+    args = parser.parse_args()
+    conversation = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " * 20} for i in range(8)]
+    for label, payload in (
+        ("valid, 8 messages", json.dumps({"model": "m", "messages": conversation, "stream": True}).encode()),
+        ("bad type, message 7", json.dumps({"model": "m", "messages": conversation[:7] + [{"role": "user", "content": 1}]}).encode()),
+        ("too many messages", json.dumps({"model": "m", "messages": [{"role": "user"}] * (LIMITS.max_messages + 1)}).encode()),
+        ("oversized body", b" " * (LIMITS.max_body_bytes + 1)),
+    ):
+        print(f"{label:>20}: {per_call_us(payload, args.iterations):7.2f} us")
+
+if __name__ == '__main__':
+    main()
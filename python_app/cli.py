@@ -0,0 +1,69 @@
+"""Flask CLI commands, e.g. `flask --app python_app.app pantry import pantry.csv`."""
+import contextlib
+import sys
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.services import pantry_transfer
+
+pantry_cli = AppGroup('pantry', help="Bulk import and export of pantry data, and ledger upkeep.")
+
+def _format_for(path: str, format: str) -> str:
+    if format:
+        return format
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+def _open(path: str, mode: str):
+    # newline='' lets the csv module see quoted newlines as they are
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    return open(path, mode, encoding='utf-8', newline='')
+
+@pantry_cli.command('import')
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', type=click.Choice(pantry_transfer.FORMATS), help="Defaults to csv for *.csv files, ndjson otherwise.")
+@click.option('--chunk-size', type=int, default=None, help="Rows per committed chunk.")
+def import_command(path, format, chunk_size):
+    """Imports pantry items from PATH ('-' for stdin)."""
+    chunk_size = chunk_size or current_app.config['PANTRY_IMPORT_CHUNK_SIZE']
+    with _open(path, 'r') as source:
+        with current_app.config['SESSION_FACTORY']() as session:
+            pantry_service = current_app.config['PANTRY_SERVICE_FACTORY'](session, cached=False)
+            items = pantry_transfer.parse(source, _format_for(path, format))
+            progress = pantry_transfer.ImportProgress()
+            try:
+                for progress in pantry_transfer.import_items(pantry_service, items, chunk_size):
+                    click.echo(f"{progress.rows_saved} rows saved ({progress.chunks} chunks)", err=True)
+            except ValueError as e:
+                raise click.ClickException(f"{e} ({progress.rows_saved} rows were saved before the error)")
+    click.echo(f"Imported {progress.rows_saved} rows from {progress.rows_read} read", err=True)
+
+@pantry_cli.command('export')
+@click.argument('path', type=click.Path(allow_dash=True), default='-')
+@click.option('--format', type=click.Choice(pantry_transfer.FORMATS), help="Defaults to csv for *.csv files, ndjson otherwise.")
+def export_command(path, format):
+    """Writes every pantry entry to PATH (stdout by default)."""
+    with _open(path, 'w') as target:
+        with current_app.config['SESSION_FACTORY']() as session:
+            entries = SqlAlchemyDurablePantryAdapter(session).stream_all(current_app.config['PANTRY_EXPORT_BATCH_SIZE'])
+            for line in pantry_transfer.serialize(entries, _format_for(path, format)):
+                target.write(line)
+
+@pantry_cli.command('compact-ledger')
+@click.option('--keep-days', type=int, default=None, help="Days of individual events to keep; older ones become daily totals.")
+def compact_ledger_command(keep_days):
+    """Folds old ledger events into per-day rollups. Meant to run periodically, e.g. from cron."""
+    keep_days = current_app.config['PANTRY_LEDGER_RETENTION_DAYS'] if keep_days is None else keep_days
+    before = datetime.now(timezone.utc) - timedelta(days=keep_days)
+    with current_app.config['SESSION_FACTORY']() as session:
+        compacted = SqlAlchemyDurablePantryAdapter(session, ledger=True).compact_ledger(before)
+    click.echo(f"Compacted {compacted} ledger events older than {before.date().isoformat()}", err=True)
+
+@pantry_cli.command('rebuild-snapshot')
+def rebuild_snapshot_command():
+    """Recomputes current stock in pantry_entry from the ledger, e.g. after restoring the ledger from a backup."""
+    with current_app.config['SESSION_FACTORY']() as session:
+        changed = SqlAlchemyDurablePantryAdapter(session, ledger=True).rebuild_snapshot()
+    click.echo(f"Rebuilt {changed} pantry entries from the ledger", err=True)
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -20,6 +21,90 @@ class Settings:
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "dummy_openai_api_key") # Default if not set
     OPENAI_MODEL_NAME: str = os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
     OPENAI_TEMPERATURE: float = float(os.getenv("OPENAI_TEMPERATURE", "0.0"))
+    # Which chat model serves requests: "fake" (canned replies), "openai" or "ollama" (any compatible HTTP endpoint)
+    CHAT_MODEL_BACKEND: str = os.getenv("CHAT_MODEL_BACKEND", "fake")
+    # Empty uses the backend's public default; several comma-separated replicas are load-balanced by the router
+    CHAT_MODEL_BASE_URL: str = os.getenv("CHAT_MODEL_BASE_URL", "")
+    CHAT_MODEL_NAME: str = os.getenv("CHAT_MODEL_NAME", OPENAI_MODEL_NAME)
+    # Keep-alive connection pool and retries for the HTTP backends
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "20"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "2"))
+    HTTP_READ_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "60"))
+    HTTP_MAX_RETRIES: int = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+    HTTP_RETRY_BACKOFF_SECONDS: float = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.2"))
+    # Routing across replicas: latency EWMA weight, circuit breaker, and hedged duplicates for slow calls
+    ROUTER_EWMA_ALPHA: float = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+    ROUTER_BREAKER_FAILURES: int = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+    ROUTER_BREAKER_RESET_SECONDS: float = float(os.getenv("ROUTER_BREAKER_RESET_SECONDS", "10"))
+    ROUTER_HEDGE_ENABLED: bool = os.getenv("ROUTER_HEDGE_ENABLED", "false").lower() == "true"
+    ROUTER_HEDGE_PERCENTILE: float = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "95"))
+    ROUTER_HEDGE_DELAY_MS: float = float(os.getenv("ROUTER_HEDGE_DELAY_MS", "0")) # 0 derives it from the percentile
+    ROUTER_HEDGE_MAX_WORKERS: int = int(os.getenv("ROUTER_HEDGE_MAX_WORKERS", "64")) # sync calls hedged at once; the rest run unhedged
+    # Exact-match response cache in front of the model; an empty path disables the SQLite tier
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+    RESPONSE_CACHE_SQLITE_PATH: str = os.getenv("RESPONSE_CACHE_SQLITE_PATH", "")
+    # Semantic cache for paraphrased prompts; off by default since the bundled embedder is purely lexical
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_CAPACITY: int = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "10000"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_TTL_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "300"))
+    # Share one upstream generation between concurrent identical requests
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    # Micro-batching of concurrent model calls; only pays off with backends that amortise per-call overhead
+    MICRO_BATCH_ENABLED: bool = os.getenv("MICRO_BATCH_ENABLED", "false").lower() == "true"
+    MICRO_BATCH_MAX_WAIT_MS: float = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+    MICRO_BATCH_MAX_SIZE: int = int(os.getenv("MICRO_BATCH_MAX_SIZE", "16"))
+    # Write-behind cache in front of the chat memory tables
+    CHAT_MEMORY_CACHE_SIZE: int = int(os.getenv("CHAT_MEMORY_CACHE_SIZE", "256"))
+    CHAT_MEMORY_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("CHAT_MEMORY_FLUSH_INTERVAL_SECONDS", "1.0"))
+    CHAT_MEMORY_FLUSH_THRESHOLD: int = int(os.getenv("CHAT_MEMORY_FLUSH_THRESHOLD", "100"))
+    CHAT_MEMORY_FLUSH_MAX_ATTEMPTS: int = int(os.getenv("CHAT_MEMORY_FLUSH_MAX_ATTEMPTS", "5"))
+    # Prompt budget for conversations with history; older turns are folded into a rolling summary
+    CONTEXT_WINDOW_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_WINDOW_TOKEN_BUDGET", "3000"))
+    CONTEXT_WINDOW_SUMMARY_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_WINDOW_SUMMARY_TOKEN_BUDGET", "400"))
+    CONTEXT_WINDOW_SUMMARY_CACHE_SIZE: int = int(os.getenv("CONTEXT_WINDOW_SUMMARY_CACHE_SIZE", "1024"))
+    # Shared in-memory pantry snapshot; 0 checks the database version counter on every read
+    PANTRY_CACHE_ENABLED: bool = os.getenv("PANTRY_CACHE_ENABLED", "true").lower() == "true"
+    PANTRY_CACHE_VERSION_CHECK_SECONDS: float = float(os.getenv("PANTRY_CACHE_VERSION_CHECK_SECONDS", "0"))
+    # Attempts for a pantry write that keeps hitting concurrent modifications
+    PANTRY_WRITE_MAX_ATTEMPTS: int = int(os.getenv("PANTRY_WRITE_MAX_ATTEMPTS", "5"))
+    # Rows per committed chunk for pantry imports, rows per cursor fetch for exports
+    PANTRY_IMPORT_CHUNK_SIZE: int = int(os.getenv("PANTRY_IMPORT_CHUNK_SIZE", "1000"))
+    PANTRY_EXPORT_BATCH_SIZE: int = int(os.getenv("PANTRY_EXPORT_BATCH_SIZE", "1000"))
+    # Fuzzy matching of item names onto existing pantry entries
+    NAME_INDEX_ENABLED: bool = os.getenv("NAME_INDEX_ENABLED", "true").lower() == "true"
+    NAME_AUTO_MERGE_THRESHOLD: float = float(os.getenv("NAME_AUTO_MERGE_THRESHOLD", "0.6"))
+    # Append-only log of pantry saves and uses; events older than the retention become daily rollups on compaction
+    PANTRY_LEDGER_ENABLED: bool = os.getenv("PANTRY_LEDGER_ENABLED", "false").lower() == "true"
+    PANTRY_LEDGER_RETENTION_DAYS: int = int(os.getenv("PANTRY_LEDGER_RETENTION_DAYS", "90"))
+    # Extra grams-per-millilitre densities as JSON, e.g. {"pancake mix": 0.45}; merged over the built-in table
+    UNIT_DENSITIES: dict = json.loads(os.getenv("UNIT_DENSITIES", "{}"))
+    # Requests over these limits are rejected before they are parsed or reach the model
+    REQUEST_MAX_BODY_BYTES: int = int(os.getenv("REQUEST_MAX_BODY_BYTES", str(1024 * 1024)))
+    REQUEST_MAX_MESSAGES: int = int(os.getenv("REQUEST_MAX_MESSAGES", "256"))
+    REQUEST_MAX_CONTENT_CHARS: int = int(os.getenv("REQUEST_MAX_CONTENT_CHARS", "100000"))
+    # Admission control for the chat endpoints: concurrent requests, a bounded wait queue, and rate limits (0 = off)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT", "64"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+    ADMISSION_MAX_QUEUE_WAIT_SECONDS: float = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT_SECONDS", "5"))
+    ADMISSION_GLOBAL_RATE: float = float(os.getenv("ADMISSION_GLOBAL_RATE", "0"))
+    ADMISSION_GLOBAL_BURST: float = float(os.getenv("ADMISSION_GLOBAL_BURST", "0"))
+    ADMISSION_CLIENT_RATE: float = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+    ADMISSION_CLIENT_BURST: float = float(os.getenv("ADMISSION_CLIENT_BURST", "0"))
+    # Header that names the client behind a trusted proxy, e.g. X-Forwarded-For; empty uses the peer address
+    ADMISSION_CLIENT_HEADER: str = os.getenv("ADMISSION_CLIENT_HEADER", "")
+    # Proxies in front of the app that append to that header; the client is the entry the outermost one added
+    ADMISSION_TRUSTED_PROXY_HOPS: int = int(os.getenv("ADMISSION_TRUSTED_PROXY_HOPS", "1"))
+    # Request tracing: trace IDs in X-Trace-Id headers and log lines; slower requests log their span tree (0 = never)
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_SLOW_REQUEST_MS: float = float(os.getenv("TRACE_SLOW_REQUEST_MS", "2000"))
+    # Bearer token for the /admin endpoints (on-demand profiling); empty leaves them switched off
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
     # Add other configurations as needed
     APP_NAME: str = os.getenv("APP_NAME", "Python Stift Home App")
 
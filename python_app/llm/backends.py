@@ -0,0 +1,50 @@
+"""Builds the chat model named by CHAT_MODEL_BACKEND from settings."""
+from typing import Sequence
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.language_models.chat_models import BaseChatModel
+from .http_chat_model import OLLAMA, OPENAI, HttpChatModel
+from .router import RoutedChatModel
+
+FAKE = "fake"
+
+DEFAULT_BASE_URLS = {
+    OPENAI: "https://api.openai.com/v1",
+    OLLAMA: "http://localhost:11434",
+}
+
+def build_chat_model(settings, fake_responses: Sequence[str] = ()) -> BaseChatModel:
+    backend = settings.CHAT_MODEL_BACKEND.lower()
+    if backend == FAKE:
+        return FakeListChatModel(responses=list(fake_responses))
+    if backend not in DEFAULT_BASE_URLS:
+        raise ValueError(f"Unknown CHAT_MODEL_BACKEND {settings.CHAT_MODEL_BACKEND!r}, expected one of {FAKE}, {OPENAI}, {OLLAMA}")
+    api_key = settings.OPENAI_API_KEY if backend == OPENAI and settings.OPENAI_API_KEY != "dummy_openai_api_key" else None
+    base_urls = [url.strip() for url in settings.CHAT_MODEL_BASE_URL.split(",") if url.strip()] or [DEFAULT_BASE_URLS[backend]]
+    replicas = [HttpChatModel(
+        base_url=base_url,
+        api_style=backend,
+        model_name=settings.CHAT_MODEL_NAME,
+        temperature=settings.OPENAI_TEMPERATURE,
+        api_key=api_key,
+        pool_size=settings.HTTP_POOL_SIZE,
+        connect_timeout_seconds=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        read_timeout_seconds=settings.HTTP_READ_TIMEOUT_SECONDS,
+        # Behind the router a failed call moves on to another replica instead of retrying the same one
+        max_retries=settings.HTTP_MAX_RETRIES if len(base_urls) == 1 else 0,
+        retry_backoff_seconds=settings.HTTP_RETRY_BACKOFF_SECONDS,
+    ) for base_url in base_urls]
+    if len(replicas) == 1:
+        return replicas[0]
+    return RoutedChatModel(
+        endpoints=replicas,
+        model_name=settings.CHAT_MODEL_NAME,
+        temperature=settings.OPENAI_TEMPERATURE,
+        ewma_alpha=settings.ROUTER_EWMA_ALPHA,
+        breaker_failures=settings.ROUTER_BREAKER_FAILURES,
+        breaker_reset_seconds=settings.ROUTER_BREAKER_RESET_SECONDS,
+        max_attempts=min(len(replicas), settings.HTTP_MAX_RETRIES + 1),
+        hedge=settings.ROUTER_HEDGE_ENABLED,
+        hedge_percentile=settings.ROUTER_HEDGE_PERCENTILE,
+        hedge_delay_ms=settings.ROUTER_HEDGE_DELAY_MS,
+        hedge_max_workers=settings.ROUTER_HEDGE_MAX_WORKERS,
+    )
@@ -0,0 +1,127 @@
+import asyncio
+import dataclasses
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+@dataclasses.dataclass
+class MicroBatcherStats:
+    batches: int = 0
+    items: int = 0
+    batch_sizes: Dict[int, int] = dataclasses.field(default_factory=dict) # batch size -> number of batches
+    queued_seconds_total: float = 0.0
+    queued_seconds_max: float = 0.0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    @property
+    def mean_queued_seconds(self) -> float:
+        return self.queued_seconds_total / self.items if self.items else 0.0
+
+class MicroBatcher:
+    """Collects concurrently submitted items for up to `max_wait_ms` and hands them to `batch_fn` together.
+
+    `batch_fn` receives a list of items and returns one result per item, in order; an exception
+    in a result slot fails only that item's future. If `batch_fn` itself raises, every item in
+    the batch fails with that error. Batches are dispatched on a small pool, so a slow batch does
+    not hold up the collection of the next one.
+    """
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_wait_ms: float = 5.0,
+                 max_batch_size: int = 16, max_concurrent_batches: int = 4):
+        self.batch_fn = batch_fn
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="micro-batch")
+        self._stats = MicroBatcherStats()
+        self._stats_lock = threading.Lock()
+        # Held to check _closed and enqueue in one step, so nothing can be queued behind close()'s sentinel
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._collector = threading.Thread(target=self._collect, name="micro-batch-collector", daemon=True)
+        self._collector.start()
+
+    @classmethod
+    def for_chat_model(cls, chat_model: BaseChatModel, **kwargs) -> "MicroBatcher":
+        # return_exceptions keeps one bad prompt from failing its batch neighbours
+        return cls(lambda batch: chat_model.batch(batch, return_exceptions=True), **kwargs)
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    async def asubmit(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if pending is None:
+                    self._queue.put(None) # Finish this batch, then stop on the next loop
+                    break
+                batch.append(pending)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[tuple]):
+        dispatched_at = time.perf_counter()
+        queued_seconds = [dispatched_at - enqueued_at for _, _, enqueued_at in batch]
+        with self._stats_lock:
+            self._stats.batches += 1
+            self._stats.items += len(batch)
+            self._stats.batch_sizes[len(batch)] = self._stats.batch_sizes.get(len(batch), 0) + 1
+            self._stats.queued_seconds_total += sum(queued_seconds)
+            self._stats.queued_seconds_max = max(self._stats.queued_seconds_max, max(queued_seconds))
+
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> MicroBatcherStats:
+        with self._stats_lock:
+            return dataclasses.replace(self._stats, batch_sizes=dict(self._stats.batch_sizes))
+
+    def close(self, timeout: Optional[float] = None):
+        """Dispatches whatever is still queued, then stops the collector and waits for running batches."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._collector.join(timeout)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,210 @@
+import abc
+import collections
+import contextlib
+import dataclasses
+import logging
+import math
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+# Role/formatting tokens a chat API adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class Tokenizer(abc.ABC):
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        pass
+
+class ApproximateTokenizer(Tokenizer):
+    """Roughly four characters per token, which is close for English text on BPE vocabularies."""
+    def __init__(self, chars_per_token: float = 4.0):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+class TiktokenTokenizer(Tokenizer):
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+def default_tokenizer() -> Tokenizer:
+    """Exact counts when tiktoken is installed, the character estimate otherwise."""
+    try:
+        return TiktokenTokenizer()
+    except Exception:
+        return ApproximateTokenizer()
+
+# Folds newly evicted messages into the previous summary: (previous_summary, evicted) -> summary
+Summarizer = Callable[[str, List[dict]], str]
+
+class LLMSummarizer:
+    PROMPT = ("Update the running summary of a conversation with the new messages below. "
+              "Keep facts, names, quantities and open questions; drop pleasantries. "
+              "Answer with the updated summary only, in at most {max_words} words.")
+
+    def __init__(self, chat_model: BaseChatModel, max_words: int = 150):
+        self.chat_model = chat_model
+        self.max_words = max_words
+
+    def __call__(self, previous_summary: str, evicted: List[dict]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in evicted)
+        response = self.chat_model.invoke([
+            SystemMessage(content=self.PROMPT.format(max_words=self.max_words)),
+            HumanMessage(content=f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}")
+        ])
+        return response.content
+
+class TruncatingSummarizer:
+    """Offline summarizer that keeps the most recent `max_chars` of the folded transcript."""
+    def __init__(self, max_chars: int = 1000):
+        self.max_chars = max_chars
+
+    def __call__(self, previous_summary: str, evicted: List[dict]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in evicted)
+        combined = f"{previous_summary}\n{transcript}" if previous_summary else transcript
+        return combined[-self.max_chars:]
+
+@dataclasses.dataclass
+class ContextWindow:
+    messages: List[dict] # the recent history that is sent verbatim, oldest first
+    summary: str # rolling summary of everything older, empty if nothing was folded yet
+    prompt_tokens: int # what the prompt costs with the window applied
+    full_prompt_tokens: int # what it would cost with the whole history sent
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.full_prompt_tokens - self.prompt_tokens, 0)
+
+@dataclasses.dataclass(frozen=True)
+class _SummaryState:
+    covered: int = 0 # number of leading history messages folded into the summary
+    summary: str = ""
+    covered_tokens: int = 0 # what those messages would have cost if sent verbatim
+
+@dataclasses.dataclass
+class ContextWindowStats:
+    requests: int = 0
+    summarizations: int = 0
+    evictions: int = 0
+    prompt_tokens: int = 0
+    saved_tokens: int = 0
+
+class ContextWindowManager:
+    """Keeps prompts within `token_budget`: system prompt, rolling summary and as many recent messages as fit.
+
+    Messages that fall out of the window are folded into a per-conversation summary exactly
+    once; the summary and the number of messages it covers are cached, so each turn only
+    summarizes what was newly evicted. At most `capacity` summaries are kept (least recently
+    used first out; an evicted conversation is summarized afresh on its next turn), and builds
+    for the same conversation run one at a time so a span is never summarized twice.
+    """
+    SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+    def __init__(self, summarizer: Summarizer, tokenizer: Optional[Tokenizer] = None,
+                 token_budget: int = 3000, summary_token_budget: int = 400, capacity: int = 1024):
+        self.summarizer = summarizer
+        self.tokenizer = tokenizer or default_tokenizer()
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.capacity = capacity
+        self._summaries = collections.OrderedDict() # memory_id -> _SummaryState
+        # memory_id -> (lock, number of builds holding or waiting for it); dropped when unused
+        self._build_locks: Dict[str, Tuple[threading.Lock, int]] = {}
+        self._lock = threading.Lock()
+        self._stats = ContextWindowStats()
+
+    def message_tokens(self, content: str) -> int:
+        return self.tokenizer.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, memory_id: str, system_prompt: str, history: List[dict], new_message: str) -> ContextWindow:
+        with self._conversation_lock(memory_id):
+            return self._build(memory_id, system_prompt, history, new_message)
+
+    def _build(self, memory_id: str, system_prompt: str, history: List[dict], new_message: str) -> ContextWindow:
+        with self._lock:
+            summarized = self._summaries.get(memory_id, _SummaryState())
+        if summarized.covered > len(history):
+            # The stored conversation was replaced or deleted; the cached summary no longer applies
+            summarized = _SummaryState()
+
+        # Only the not-yet-summarized tail is tokenized; the summarized prefix is a cached total
+        unsummarized = history[summarized.covered:]
+        unsummarized_tokens = [self.message_tokens(message["content"]) for message in unsummarized]
+        fixed_tokens = self.message_tokens(system_prompt) + self.message_tokens(new_message)
+        full_prompt_tokens = fixed_tokens + summarized.covered_tokens + sum(unsummarized_tokens)
+
+        # Walk back from the newest message, reserving room for the summary
+        available = self.token_budget - fixed_tokens - self.summary_token_budget
+        keep_from = len(unsummarized)
+        for index in range(len(unsummarized) - 1, -1, -1):
+            if unsummarized_tokens[index] > available:
+                break
+            available -= unsummarized_tokens[index]
+            keep_from = index
+
+        if keep_from > 0:
+            summary = self._fit_summary(self.summarizer(summarized.summary, unsummarized[:keep_from]))
+            summarized = _SummaryState(
+                covered=summarized.covered + keep_from,
+                summary=summary,
+                covered_tokens=summarized.covered_tokens + sum(unsummarized_tokens[:keep_from])
+            )
+            with self._lock:
+                self._stats.summarizations += 1
+
+        prompt_tokens = fixed_tokens + sum(unsummarized_tokens[keep_from:])
+        if summarized.summary:
+            prompt_tokens += self.message_tokens(self.SUMMARY_PREFIX + summarized.summary)
+        window = ContextWindow(messages=unsummarized[keep_from:], summary=summarized.summary,
+                               prompt_tokens=prompt_tokens, full_prompt_tokens=full_prompt_tokens)
+        with self._lock:
+            self._summaries[memory_id] = summarized
+            self._summaries.move_to_end(memory_id)
+            while len(self._summaries) > self.capacity:
+                self._summaries.popitem(last=False)
+                self._stats.evictions += 1
+            self._stats.requests += 1
+            self._stats.prompt_tokens += window.prompt_tokens
+            self._stats.saved_tokens += window.saved_tokens
+        logger.info(f"Context window for {memory_id}: {window.prompt_tokens} prompt tokens, {window.saved_tokens} saved")
+        return window
+
+    def _fit_summary(self, summary: str) -> str:
+        # Summarizers are asked to stay short; this is the hard cap (prefix and overhead included) if they don't
+        while summary and self.message_tokens(self.SUMMARY_PREFIX + summary) > self.summary_token_budget:
+            summary = summary[max(len(summary) // 4, 1):]
+        return summary
+
+    @contextlib.contextmanager
+    def _conversation_lock(self, memory_id: str) -> Iterator[None]:
+        with self._lock:
+            lock, users = self._build_locks.get(memory_id) or (threading.Lock(), 0)
+            self._build_locks[memory_id] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._build_locks[memory_id]
+                if users == 1:
+                    del self._build_locks[memory_id]
+                else:
+                    self._build_locks[memory_id] = (lock, users - 1)
+
+    def forget(self, memory_id: str):
+        """Drops the conversation's summary, e.g. once the conversation is deleted; waits for a build in progress."""
+        with self._conversation_lock(memory_id):
+            with self._lock:
+                self._summaries.pop(memory_id, None)
+
+    def stats(self) -> ContextWindowStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
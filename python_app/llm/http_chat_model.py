@@ -0,0 +1,242 @@
+"""Chat model that talks to an OpenAI- or Ollama-compatible HTTP endpoint over pooled keep-alive connections.
+
+One HttpChatModel holds one sync and one async httpx client for the life of the process, so
+requests reuse open connections instead of paying for a TCP (and TLS) handshake each time.
+Connection failures, timeouts, 429s and 5xx responses are retried with exponential backoff and
+full jitter, so a burst of failing callers doesn't retry in lockstep. A streamed reply is only
+retried until its first piece has been passed on.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+from python_app import tracing
+
+OPENAI = "openai"
+OLLAMA = "ollama"
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+_RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+_RETRYABLE_ERRORS = (httpx.TransportError,) # connect/read/write errors and timeouts, not HTTP statuses
+
+class ModelBackendError(RuntimeError):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class HttpChatModel(BaseChatModel):
+    base_url: str
+    api_style: str = OPENAI # OPENAI or OLLAMA, which request and reply format the endpoint speaks
+    model_name: str
+    temperature: float = 0.0
+    api_key: Optional[str] = None
+    pool_size: int = 20
+    connect_timeout_seconds: float = 2.0
+    read_timeout_seconds: float = 60.0
+    max_retries: int = 2
+    retry_backoff_seconds: float = 0.2
+    retry_backoff_max_seconds: float = 5.0
+
+    _client: Optional[httpx.Client] = PrivateAttr(default=None)
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"http-{self.api_style}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"base_url": self.base_url, "api_style": self.api_style, "model_name": self.model_name}
+
+    def _client_options(self) -> Dict[str, Any]:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        return {
+            "base_url": self.base_url,
+            "headers": headers,
+            "timeout": httpx.Timeout(self.read_timeout_seconds, connect=self.connect_timeout_seconds),
+            "limits": httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # Bound to the event loop it is first used on, like the ASGI server's single loop
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    @property
+    def path(self) -> str:
+        return "/chat/completions" if self.api_style == OPENAI else "/api/chat"
+
+    def request_body(self, messages: List[BaseMessage], stream: bool, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "model": self.model_name,
+            "messages": [{"role": _ROLES.get(message.type, "user"), "content": message.content} for message in messages],
+            "stream": stream,
+        }
+        if self.api_style == OPENAI:
+            body["temperature"] = self.temperature
+            if stop:
+                body["stop"] = stop
+        else:
+            body["options"] = {"temperature": self.temperature, **({"stop": stop} if stop else {})}
+        return body
+
+    def reply_content(self, payload: Dict[str, Any]) -> str:
+        if self.api_style == OPENAI:
+            return payload["choices"][0]["message"].get("content") or ""
+        return payload["message"].get("content") or ""
+
+    def stream_piece(self, line: str) -> Optional[str]:
+        """The text carried by one streamed line (SSE for OpenAI, NDJSON for Ollama), if any."""
+        if self.api_style == OPENAI:
+            if not line.startswith("data:"):
+                return None
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return None
+            choices = json.loads(data).get("choices") or [{}]
+            return choices[0].get("delta", {}).get("content")
+        if not line.strip():
+            return None
+        payload = json.loads(line)
+        if "error" in payload:
+            raise ModelBackendError(f"Model backend stream failed: {payload['error']}")
+        return payload.get("message", {}).get("content")
+
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, but never sooner than a numeric Retry-After asks for."""
+        delay = random.uniform(0, min(self.retry_backoff_max_seconds, self.retry_backoff_seconds * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.retry_backoff_max_seconds))
+        return delay
+
+    def _check(self, response: httpx.Response):
+        if response.status_code >= 400:
+            raise ModelBackendError(f"Model backend returned HTTP {response.status_code}", response.status_code)
+
+    def _send(self, body: Dict[str, Any], read: bool = False) -> Iterator[httpx.Response]:
+        """Yields the open response of the first attempt that isn't retried; callers read it before resuming.
+
+        With `read`, the body is read first, so a connection that drops mid-body is retried like any other.
+        """
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                with self.client.stream("POST", self.path, json=body, headers=tracing.outgoing_headers()) as response:
+                    if response.status_code in _RETRYABLE_STATUSES and not last_attempt:
+                        response.read()
+                        delay = self.retry_delay(attempt, response)
+                    else:
+                        self._check(response)
+                        if read:
+                            response.read()
+                        yield response
+                        return
+            except _RETRYABLE_ERRORS as e:
+                if last_attempt:
+                    raise ModelBackendError(f"Model backend unreachable: {e!r}") from e
+                delay = self.retry_delay(attempt)
+            time.sleep(delay)
+
+    async def _asend(self, body: Dict[str, Any], read: bool = False) -> AsyncIterator[httpx.Response]:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with self.async_client.stream("POST", self.path, json=body, headers=tracing.outgoing_headers()) as response:
+                    if response.status_code in _RETRYABLE_STATUSES and not last_attempt:
+                        await response.aread()
+                        delay = self.retry_delay(attempt, response)
+                    else:
+                        self._check(response)
+                        if read:
+                            await response.aread()
+                        yield response
+                        return
+            except _RETRYABLE_ERRORS as e:
+                if last_attempt:
+                    raise ModelBackendError(f"Model backend unreachable: {e!r}") from e
+                delay = self.retry_delay(attempt)
+            await asyncio.sleep(delay)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for response in self._send(self.request_body(messages, stream=False, stop=stop), read=True):
+            content = self.reply_content(json.loads(response.content))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        async for response in self._asend(self.request_body(messages, stream=False, stop=stop), read=True):
+            content = self.reply_content(json.loads(response.content))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for response in self._send(self.request_body(messages, stream=True, stop=stop)):
+            try:
+                for line in response.iter_lines():
+                    piece = self.stream_piece(line)
+                    if piece:
+                        if run_manager is not None:
+                            run_manager.on_llm_new_token(piece)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            except _RETRYABLE_ERRORS as e:
+                raise ModelBackendError(f"Model backend stream broke off: {e!r}") from e
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for response in self._asend(self.request_body(messages, stream=True, stop=stop)):
+            try:
+                async for line in response.aiter_lines():
+                    piece = self.stream_piece(line)
+                    if piece:
+                        if run_manager is not None:
+                            await run_manager.on_llm_new_token(piece)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            except _RETRYABLE_ERRORS as e:
+                raise ModelBackendError(f"Model backend stream broke off: {e!r}") from e
@@ -0,0 +1,191 @@
+import abc
+import collections
+import dataclasses
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+from langchain_core.messages import BaseMessage
+
+@dataclasses.dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    bypasses: int = 0
+    persistent_hits: int = 0
+
+class ResponseCacheTier(abc.ABC):
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def put(self, key: str, response: str):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+class InMemoryLRUTier(ResponseCacheTier):
+    def __init__(self, stats: ResponseCacheStats, capacity: int = 1024, ttl_seconds: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic, stats_lock: Optional[threading.Lock] = None):
+        self.stats = stats
+        # Shared with whoever else updates `stats`, so concurrent increments aren't lost
+        self.stats_lock = stats_lock or threading.Lock()
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = collections.OrderedDict() # key -> (expires_at, response)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                with self.stats_lock:
+                    self.stats.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                with self.stats_lock:
+                    self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SqliteTier(ResponseCacheTier):
+    """Persistent tier so warm answers survive a restart. Uses wall-clock time because entries outlive the process."""
+    def __init__(self, stats: ResponseCacheStats, path: str, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.time, stats_lock: Optional[threading.Lock] = None):
+        self.stats = stats
+        self.stats_lock = stats_lock or threading.Lock()
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, expires_at = row
+            if expires_at <= self.clock():
+                self._connection.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._connection.commit()
+                with self.stats_lock:
+                    self.stats.expirations += 1
+                return None
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, self.clock() + self.ttl_seconds)
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM response_cache")
+            self._connection.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM response_cache WHERE expires_at <= ?", (self.clock(),))
+            self._connection.commit()
+            with self.stats_lock:
+                self.stats.expirations += cursor.rowcount
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class ResponseCache:
+    """Exact-match cache for model completions, keyed on everything that determines the reply.
+
+    Lookups go memory first, then the optional persistent tier (promoting hits into memory).
+    Sampled completions (temperature > 0) are never cached: repeating them would change behaviour.
+    """
+    def __init__(self, capacity: int = 1024, ttl_seconds: float = 300.0, sqlite_path: Optional[str] = None,
+                 sqlite_ttl_seconds: float = 3600.0):
+        self._stats = ResponseCacheStats()
+        self._stats_lock = threading.Lock()
+        self.memory = InMemoryLRUTier(self._stats, capacity=capacity, ttl_seconds=ttl_seconds, stats_lock=self._stats_lock)
+        self.persistent = SqliteTier(
+            self._stats, sqlite_path, ttl_seconds=sqlite_ttl_seconds, stats_lock=self._stats_lock
+        ) if sqlite_path else None
+
+    @staticmethod
+    def make_key(system_prompt: str, model_name: str, temperature: float, messages: List[BaseMessage]) -> str:
+        payload = json.dumps(
+            [system_prompt, model_name, temperature, [[message.type, message.content] for message in messages]],
+            separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, system_prompt: str, model_name: str, temperature: float, messages: List[BaseMessage]) -> Optional[str]:
+        if temperature > 0:
+            with self._stats_lock:
+                self._stats.bypasses += 1
+            return None
+        key = self.make_key(system_prompt, model_name, temperature, messages)
+        response = self.memory.get(key)
+        if response is None and self.persistent is not None:
+            response = self.persistent.get(key)
+            if response is not None:
+                self.memory.put(key, response)
+                with self._stats_lock:
+                    self._stats.persistent_hits += 1
+        with self._stats_lock:
+            if response is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return response
+
+    def put(self, system_prompt: str, model_name: str, temperature: float, messages: List[BaseMessage], response: str):
+        if temperature > 0:
+            return
+        key = self.make_key(system_prompt, model_name, temperature, messages)
+        self.memory.put(key, response)
+        if self.persistent is not None:
+            self.persistent.put(key, response)
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> ResponseCacheStats:
+        """Returns a snapshot of the counters; hit rate is hits / (hits + misses)."""
+        with self._stats_lock:
+            return dataclasses.replace(self._stats)
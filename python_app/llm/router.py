@@ -0,0 +1,435 @@
+"""Spreads chat model calls over several replicas of the same model.
+
+Each call goes to the endpoint with the lowest expected wait: its latency EWMA times one more
+than its outstanding calls. Endpoints without a latency yet count as fastest, so each gets
+tried. A circuit breaker per endpoint takes it out of rotation after consecutive failures and
+lets one trial call through once `reset_seconds` have passed. A failed call moves on to the
+next healthy endpoint.
+
+With hedging on, a call still running after the hedge delay is duplicated on a second endpoint
+and the first result wins. The delay is a fixed number of milliseconds, or the chosen percentile
+of recent latencies. The losing async call is cancelled, which closes its upstream connection. A
+losing sync call can't be interrupted; its result is dropped. Sync calls are hedged from a pool
+of `hedge_max_workers` threads that never queues: with every worker busy, a call runs unhedged in
+its caller's thread instead. Streams aren't hedged, but fail over while nothing has been yielded yet.
+
+Calls that are cancelled, lose a hedge race, or are abandoned mid-stream only give back their slot:
+they say nothing about the endpoint's health, so they never close a breaker.
+"""
+import asyncio
+import collections
+import dataclasses
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Deque, Iterator, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+class NoHealthyEndpoint(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go out; the first call after the reset period becomes the half-open trial."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_abandoned(self):
+        """A call that was cancelled or given up on: no evidence either way, so a half-open trial doesn't count."""
+        if self.state == self.HALF_OPEN:
+            # opened_at is left alone, so the next call may go out as a fresh trial straight away
+            self.state = self.OPEN
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+@dataclasses.dataclass
+class EndpointStats:
+    name: str
+    state: str
+    ewma_ms: Optional[float]
+    outstanding: int
+    calls: int
+    failures: int
+
+@dataclasses.dataclass
+class RouterStats:
+    endpoints: List[EndpointStats]
+    hedged: int = 0 # calls that got a duplicate
+    hedge_wins: int = 0 # of those, calls the duplicate answered first
+
+class _Endpoint:
+    def __init__(self, model: BaseChatModel, breaker: CircuitBreaker):
+        self.model = model
+        self.breaker = breaker
+        self.ewma_seconds: Optional[float] = None
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def name(self) -> str:
+        return getattr(self.model, 'base_url', None) or self.model._llm_type
+
+class RoutedChatModel(BaseChatModel):
+    endpoints: List[BaseChatModel]
+    model_name: str = ""
+    temperature: float = 0.0
+    ewma_alpha: float = 0.2
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 10.0
+    max_attempts: int = 2 # endpoints tried per call before giving up
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_delay_ms: float = 0.0 # fixed hedge delay; 0 derives it from `hedge_percentile` of recent latencies
+    hedge_min_samples: int = 20 # percentile-based hedging waits for this many latencies
+    hedge_max_workers: int = 64 # sync calls hedged at once; more than that run unhedged
+
+    _endpoints: List[_Endpoint] = PrivateAttr(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _latencies: Deque[float] = PrivateAttr(default_factory=lambda: collections.deque(maxlen=1000))
+    _hedge_delay: Optional[float] = PrivateAttr(default=None)
+    _samples_since_delay: int = PrivateAttr(default=0)
+    _hedged: int = PrivateAttr(default=0)
+    _hedge_wins: int = PrivateAttr(default=0)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _hedge_slots: Optional[threading.BoundedSemaphore] = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any):
+        super().model_post_init(context)
+        self._endpoints = [_Endpoint(model, CircuitBreaker(self.breaker_failures, self.breaker_reset_seconds))
+                           for model in self.endpoints]
+        self._hedge_slots = threading.BoundedSemaphore(self.hedge_max_workers)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def stats(self) -> RouterStats:
+        with self._lock:
+            return RouterStats(
+                endpoints=[EndpointStats(name=endpoint.name, state=endpoint.breaker.state,
+                                         ewma_ms=None if endpoint.ewma_seconds is None else endpoint.ewma_seconds * 1000,
+                                         outstanding=endpoint.outstanding, calls=endpoint.calls, failures=endpoint.failures)
+                           for endpoint in self._endpoints],
+                hedged=self._hedged, hedge_wins=self._hedge_wins
+            )
+
+    def close(self):
+        for model in self.endpoints:
+            if hasattr(model, 'close'):
+                model.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def aclose(self):
+        for model in self.endpoints:
+            if hasattr(model, 'aclose'):
+                await model.aclose()
+
+    def _acquire(self, exclude: List[_Endpoint]) -> Optional[_Endpoint]:
+        """Reserves the endpoint with the lowest expected wait, or None when every other one is unhealthy."""
+        with self._lock:
+            best, best_score = None, None
+            for endpoint in self._endpoints:
+                if endpoint in exclude or endpoint.breaker.state != CircuitBreaker.CLOSED and not self._may_probe(endpoint):
+                    continue
+                score = (endpoint.ewma_seconds or 0.0) * (endpoint.outstanding + 1)
+                if best is None or score < best_score or score == best_score and endpoint.outstanding < best.outstanding:
+                    best, best_score = endpoint, score
+            if best is not None:
+                if best.breaker.state != CircuitBreaker.CLOSED and not best.breaker.allow():
+                    return None
+                best.outstanding += 1
+                best.calls += 1
+            return best
+
+    def _may_probe(self, endpoint: _Endpoint) -> bool:
+        breaker = endpoint.breaker
+        return breaker.state == CircuitBreaker.OPEN and breaker.clock() - breaker.opened_at >= breaker.reset_seconds
+
+    def _release(self, endpoint: _Endpoint, elapsed: Optional[float], failed: bool):
+        """Ends a call; `elapsed` is None for calls whose duration says nothing about the endpoint's speed."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.breaker.record_failure()
+                return
+            endpoint.breaker.record_success()
+            if elapsed is None:
+                return
+            endpoint.ewma_seconds = elapsed if endpoint.ewma_seconds is None else (
+                self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * endpoint.ewma_seconds)
+            self._latencies.append(elapsed)
+            self._samples_since_delay += 1
+
+    def _abandon(self, endpoint: _Endpoint):
+        """Ends a call that was cancelled or given up on, leaving the endpoint's latency and health alone."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.breaker.record_abandoned()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or there's too little history."""
+        if not self.hedge:
+            return None
+        if self.hedge_delay_ms > 0:
+            return self.hedge_delay_ms / 1000
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            # Re-sorting a thousand samples on every call would cost more than it's worth
+            if self._hedge_delay is None or self._samples_since_delay >= 50:
+                ordered = sorted(self._latencies)
+                self._hedge_delay = ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+                self._samples_since_delay = 0
+            return self._hedge_delay
+
+    def _run(self, endpoint: _Endpoint, call: Callable[[BaseChatModel], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = call(endpoint.model)
+        except Exception:
+            self._release(endpoint, None, failed=True)
+            raise
+        except BaseException:
+            self._abandon(endpoint)
+            raise
+        self._release(endpoint, time.perf_counter() - started, failed=False)
+        return result
+
+    async def _arun(self, endpoint: _Endpoint, call) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await call(endpoint.model)
+        except asyncio.CancelledError:
+            # Lost a hedge race (or the client went away); that says nothing about the endpoint
+            self._abandon(endpoint)
+            raise
+        except Exception:
+            self._release(endpoint, None, failed=True)
+            raise
+        self._release(endpoint, time.perf_counter() - started, failed=False)
+        return result
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # Headroom over the slots, so a call never waits for the thread that just gave its slot back to go idle
+            self._executor = ThreadPoolExecutor(max_workers=2 * self.hedge_max_workers, thread_name_prefix="hedge")
+        return self._executor
+
+    def _submit(self, endpoint: _Endpoint, call: Callable[[BaseChatModel], Any]) -> Optional[Future]:
+        """Starts the call on a hedge worker right away, or returns None when every slot is taken; it never queues."""
+        if not self._hedge_slots.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                return self._run(endpoint, call)
+            finally:
+                self._hedge_slots.release()
+        return self.executor.submit(run)
+
+    def _call(self, call: Callable[[BaseChatModel], Any]) -> Any:
+        tried: List[_Endpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self.max_attempts):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            delay = self.hedge_delay()
+            if delay is None:
+                try:
+                    return self._run(endpoint, call)
+                except Exception as e:
+                    last_error = e
+                    continue
+            primary = self._submit(endpoint, call)
+            if primary is None:
+                # Every hedge worker is busy: run it here, unhedged, rather than wait in a queue
+                try:
+                    return self._run(endpoint, call)
+                except Exception as e:
+                    last_error = e
+                    continue
+            futures = {primary: endpoint}
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                hedge = self._acquire(tried)
+                if hedge is not None:
+                    future = self._submit(hedge, call)
+                    if future is None:
+                        self._abandon(hedge)
+                    else:
+                        tried.append(hedge)
+                        futures[future] = hedge
+                        with self._lock:
+                            self._hedged += 1
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        for loser in pending:
+                            loser.cancel()
+                        if futures[future] is not endpoint:
+                            with self._lock:
+                                self._hedge_wins += 1
+                        return future.result()
+                    last_error = future.exception()
+        raise last_error or NoHealthyEndpoint("No healthy model endpoint")
+
+    async def _acall(self, call) -> Any:
+        tried: List[_Endpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self.max_attempts):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            delay = self.hedge_delay()
+            if delay is None:
+                try:
+                    return await self._arun(endpoint, call)
+                except Exception as e:
+                    last_error = e
+                    continue
+            tasks = {asyncio.ensure_future(self._arun(endpoint, call)): endpoint}
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                hedge = self._acquire(tried)
+                if hedge is not None:
+                    tried.append(hedge)
+                    tasks[asyncio.ensure_future(self._arun(hedge, call))] = hedge
+                    with self._lock:
+                        self._hedged += 1
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if tasks[task] is not endpoint:
+                                with self._lock:
+                                    self._hedge_wins += 1
+                            return task.result()
+                        last_error = task.exception()
+            finally:
+                for loser in pending:
+                    loser.cancel()
+        raise last_error or NoHealthyEndpoint("No healthy model endpoint")
+
+    def _end_stream(self, endpoint: _Endpoint, failed: bool, completed: bool):
+        # Neither failed nor completed: closed early (GeneratorExit) or cancelled
+        if failed or completed:
+            self._release(endpoint, None, failed=failed)
+        else:
+            self._abandon(endpoint)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._call(lambda model: model.invoke(messages, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await self._acall(lambda model: model.ainvoke(messages, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tried: List[_Endpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self.max_attempts):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            yielded, failed, completed = False, False, False
+            try:
+                for chunk in endpoint.model.stream(messages, stop=stop, **kwargs):
+                    yielded = True
+                    yield ChatGenerationChunk(message=chunk)
+                completed = True
+                return
+            except Exception as e:
+                failed, last_error = True, e
+                if yielded:
+                    raise
+            finally:
+                self._end_stream(endpoint, failed, completed)
+        raise last_error or NoHealthyEndpoint("No healthy model endpoint")
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tried: List[_Endpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(self.max_attempts):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            yielded, failed, completed = False, False, False
+            try:
+                async for chunk in endpoint.model.astream(messages, stop=stop, **kwargs):
+                    yielded = True
+                    yield ChatGenerationChunk(message=chunk)
+                completed = True
+                return
+            except Exception as e:
+                failed, last_error = True, e
+                if yielded:
+                    raise
+            finally:
+                self._end_stream(endpoint, failed, completed)
+        raise last_error or NoHealthyEndpoint("No healthy model endpoint")
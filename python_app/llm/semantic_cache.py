@@ -0,0 +1,237 @@
+import abc
+import dataclasses
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Set
+import numpy as np
+
+class Embedder(abc.ABC):
+    dimension: int
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns a (len(texts), dimension) float32 matrix of L2-normalised rows."""
+        pass
+
+class HashingEmbedder(Embedder):
+    """Deterministic, offline embedder built from hashed word and character-trigram features.
+
+    It only captures lexical overlap, so it is meant for tests and benchmarks; plug in a real
+    embedding model (see LangChainEmbedder) to match paraphrases that share no words.
+    """
+    _TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in self._TOKEN_PATTERN.findall(text.lower()):
+            features.append(word)
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                # crc32 instead of hash() so vectors are stable across processes
+                hashed = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                matrix[row, hashed % self.dimension] += sign
+        return _normalize_rows(matrix)
+
+class LangChainEmbedder(Embedder):
+    """Adapts any langchain_core Embeddings implementation."""
+    def __init__(self, embeddings, dimension: int):
+        self.embeddings = embeddings
+        self.dimension = dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _normalize_rows(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+@dataclasses.dataclass
+class SemanticHit:
+    prompt: str
+    response: str
+    score: float
+
+@dataclasses.dataclass
+class SemanticCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+class SemanticCache:
+    """Serves cached replies for prompts whose embedding is close enough to one seen before.
+
+    Embeddings live in one preallocated float32 matrix. Small caches are searched exhaustively;
+    once more than `exact_search_limit` entries are stored, candidates come from random-hyperplane
+    LSH tables (probing each query bucket and its one-bit neighbours), and only those rows are
+    scored. That keeps lookups well under a millisecond at 100k entries while still returning the
+    exact cosine similarity for whatever it finds.
+    """
+    def __init__(self, embedder: Embedder, capacity: int = 10000, threshold: float = 0.92,
+                 ttl_seconds: Optional[float] = None, hash_tables: int = 4, hash_bits: int = 14,
+                 exact_search_limit: int = 4096, seed: int = 0, clock: Callable[[], float] = time.monotonic):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.exact_search_limit = exact_search_limit
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stats = SemanticCacheStats()
+
+        dimension = embedder.dimension
+        self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self._occupied = np.zeros(capacity, dtype=bool)
+        self._last_used = np.full(capacity, np.inf)
+        self._expires_at = np.full(capacity, np.inf)
+        self._prompts: List[Optional[str]] = [None] * capacity
+        self._responses: List[Optional[str]] = [None] * capacity
+        # Popped from the end, so slots fill from 0 upwards and [:_high_water] covers every entry
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._high_water = 0
+        self._size = 0
+
+        rng = np.random.default_rng(seed)
+        self._hash_tables = hash_tables
+        self._hash_bits = hash_bits
+        self._planes = rng.standard_normal((hash_tables * hash_bits, dimension)).astype(np.float32)
+        self._bit_weights = (1 << np.arange(hash_bits, dtype=np.int64))
+        self._probe_masks = np.array([0] + [1 << bit for bit in range(hash_bits)], dtype=np.int64)
+        self._signatures = np.zeros((capacity, hash_tables), dtype=np.int64)
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(hash_tables)]
+
+    def __len__(self):
+        return self._size
+
+    def _signature(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dimension) -> (n, hash_tables) bucket ids."""
+        bits = (vectors @ self._planes.T > 0).reshape(len(vectors), self._hash_tables, self._hash_bits)
+        return bits.astype(np.int64) @ self._bit_weights
+
+    def lookup(self, prompt: str) -> Optional[SemanticHit]:
+        return self.lookup_batch([prompt])[0]
+
+    def lookup_batch(self, prompts: List[str]) -> List[Optional[SemanticHit]]:
+        if not prompts:
+            return []
+        return self.lookup_embeddings(self.embedder.embed(prompts))
+
+    def lookup_embeddings(self, queries: np.ndarray) -> List[Optional[SemanticHit]]:
+        with self._lock:
+            if self._size == 0:
+                self._stats.misses += len(queries)
+                return [None] * len(queries)
+            if self._size <= self.exact_search_limit:
+                best_slots, best_scores = self._exact_search(queries)
+            else:
+                best_slots, best_scores = self._hashed_search(queries)
+
+            now = self.clock()
+            results = []
+            for slot, score in zip(best_slots, best_scores):
+                if slot < 0 or score < self.threshold:
+                    self._stats.misses += 1
+                    results.append(None)
+                    continue
+                if self._expires_at[slot] <= now:
+                    self._remove(slot)
+                    self._stats.expirations += 1
+                    self._stats.misses += 1
+                    results.append(None)
+                    continue
+                self._last_used[slot] = now
+                self._stats.hits += 1
+                results.append(SemanticHit(self._prompts[slot], self._responses[slot], float(score)))
+            return results
+
+    def _exact_search(self, queries: np.ndarray):
+        scores = queries @ self._vectors[:self._high_water].T
+        scores[:, ~self._occupied[:self._high_water]] = -np.inf
+        best_slots = np.argmax(scores, axis=1)
+        return best_slots, scores[np.arange(len(queries)), best_slots]
+
+    def _hashed_search(self, queries: np.ndarray):
+        signatures = self._signature(queries)
+        best_slots = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        for row, query_signature in enumerate(signatures):
+            candidates = set()
+            for table, bucket in enumerate(query_signature):
+                buckets = self._buckets[table]
+                for probe in (bucket ^ self._probe_masks).tolist():
+                    members = buckets.get(probe)
+                    if members:
+                        candidates.update(members)
+            if not candidates:
+                continue
+            candidate_slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            scores = self._vectors[candidate_slots] @ queries[row]
+            best = int(np.argmax(scores))
+            best_slots[row] = candidate_slots[best]
+            best_scores[row] = scores[best]
+        return best_slots, best_scores
+
+    def put(self, prompt: str, response: str):
+        self.put_embedding(prompt, self.embedder.embed([prompt])[0], response)
+
+    def put_embedding(self, prompt: str, embedding: np.ndarray, response: str):
+        with self._lock:
+            if not self._free_slots:
+                self._evict_least_recently_used()
+            slot = self._free_slots.pop()
+            self._high_water = max(self._high_water, slot + 1)
+            now = self.clock()
+            self._vectors[slot] = embedding
+            self._occupied[slot] = True
+            self._last_used[slot] = now
+            self._expires_at[slot] = now + self.ttl_seconds if self.ttl_seconds is not None else np.inf
+            self._prompts[slot] = prompt
+            self._responses[slot] = response
+            signature = self._signature(embedding[np.newaxis, :])[0]
+            self._signatures[slot] = signature
+            for table, bucket in enumerate(signature.tolist()):
+                self._buckets[table].setdefault(bucket, set()).add(slot)
+            self._size += 1
+
+    def _evict_least_recently_used(self):
+        slot = int(np.argmin(self._last_used))
+        self._remove(slot)
+        self._stats.evictions += 1
+
+    def _remove(self, slot: int):
+        for table, bucket in enumerate(self._signatures[slot].tolist()):
+            members = self._buckets[table].get(bucket)
+            if members is not None:
+                members.discard(slot)
+                if not members:
+                    del self._buckets[table][bucket]
+        self._vectors[slot] = 0.0
+        self._occupied[slot] = False
+        self._last_used[slot] = np.inf
+        self._expires_at[slot] = np.inf
+        self._prompts[slot] = None
+        self._responses[slot] = None
+        self._free_slots.append(slot)
+        self._size -= 1
+
+    def clear(self):
+        with self._lock:
+            for slot in np.flatnonzero(self._occupied).tolist():
+                self._remove(slot)
+
+    def stats(self) -> SemanticCacheStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
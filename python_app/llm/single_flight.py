@@ -0,0 +1,269 @@
+import asyncio
+import dataclasses
+import functools
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+def normalize_request_key(request: str) -> str:
+    """Requests that differ only in surrounding or repeated whitespace produce the same reply."""
+    return " ".join(request.split())
+
+@dataclasses.dataclass
+class SingleFlightStats:
+    executions: int = 0 # upstream calls actually started
+    shared: int = 0 # callers that joined an in-flight call instead
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class _StreamCall:
+    """Chunk buffer shared by every consumer of one upstream stream.
+
+    There is no fixed leader: whichever consumer runs past the buffer pulls the next chunk from
+    the source while the others wait. A consumer that disconnects therefore never stalls the rest,
+    and once every consumer has gone the source is closed and the call forgotten.
+    """
+    def __init__(self, source: Iterator):
+        self.source = source
+        self.condition = threading.Condition()
+        self.chunks: List[Any] = []
+        self.pulling = False
+        self.finished = False
+        self.consumers = 0
+        self.error: Optional[BaseException] = None
+
+class _AsyncStreamCall:
+    """Like _StreamCall, but each pull from the source is a task every consumer awaits.
+
+    A consumer that is cancelled while waiting leaves the pull running for the others, so one
+    client going away never ends the stream for everyone else.
+    """
+    def __init__(self, source: AsyncIterator):
+        self.source = source
+        self.chunks: List[Any] = []
+        self.pull: Optional[asyncio.Future] = None
+        self.finished = False
+        self.consumers = 0
+        self.error: Optional[BaseException] = None
+
+# What a cancelled leader hands its followers: not a result, but a cue for one of them to run fn
+_LEADER_CANCELLED = object()
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution whose result (or error) they all share."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stream_calls: Dict[str, _StreamCall] = {}
+        # Only touched from the event loop thread, so no lock is needed
+        self._async_calls: Dict[str, asyncio.Future] = {}
+        self._async_stream_calls: Dict[str, _AsyncStreamCall] = {}
+        self._stats = SingleFlightStats()
+
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
+
+    def _count(self, shared: bool):
+        with self._lock:
+            if shared:
+                self._stats.shared += 1
+            else:
+                self._stats.executions += 1
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats.executions += 1
+            else:
+                self._stats.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: str, fn: Callable[[], Iterator]) -> Iterator:
+        with self._lock:
+            call = self._stream_calls.get(key)
+            if call is None:
+                call = _StreamCall(iter(fn()))
+                self._stream_calls[key] = call
+                self._stats.executions += 1
+            else:
+                self._stats.shared += 1
+            with call.condition:
+                # Counted from here, so a consumer that hasn't started yet keeps the stream alive
+                call.consumers += 1
+        consumer = self._consume(key, call)
+        # Runs it into its try block, so a consumer closed or dropped before its first chunk still gives up its place
+        next(consumer)
+        return consumer
+
+    def _forget_stream(self, key: str, call: _StreamCall):
+        with self._lock:
+            if self._stream_calls.get(key) is call:
+                del self._stream_calls[key]
+
+    def _consume(self, key: str, call: _StreamCall) -> Iterator:
+        position = 0
+        try:
+            yield # taken by stream() itself
+            while True:
+                with call.condition:
+                    while position >= len(call.chunks) and not call.finished and call.pulling:
+                        call.condition.wait()
+                    if position < len(call.chunks):
+                        chunk = call.chunks[position]
+                        position += 1
+                    elif call.finished:
+                        if call.error is not None:
+                            raise call.error
+                        return
+                    else:
+                        call.pulling = True
+                        chunk = None
+
+                if chunk is not None:
+                    yield chunk
+                    continue
+
+                # This consumer is the one pulling from upstream right now
+                try:
+                    pulled = next(call.source)
+                except BaseException as e:
+                    with call.condition:
+                        call.finished = True
+                        call.pulling = False
+                        if not isinstance(e, StopIteration):
+                            call.error = e
+                        call.condition.notify_all()
+                    self._forget_stream(key, call)
+                    continue
+                with call.condition:
+                    call.chunks.append(pulled)
+                    call.pulling = False
+                    call.condition.notify_all()
+        finally:
+            with call.condition:
+                call.consumers -= 1
+                abandoned = call.consumers == 0 and not call.finished
+            if abandoned:
+                self._forget_stream(key, call)
+                close = getattr(call.source, "close", None)
+                if close is not None:
+                    close()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        counted = False
+        while True:
+            future = self._async_calls.get(key)
+            if future is None:
+                return await self._alead(key, fn)
+            if not counted:
+                # Once per caller, however many times a cancelled leader sends it round again
+                self._count(shared=True)
+                counted = True
+            # shield: a follower being cancelled must not cancel the shared call
+            result = await asyncio.shield(future)
+            if result is not _LEADER_CANCELLED:
+                return result
+            # The leader's caller went away; the first follower back here runs fn, the others join it
+
+    async def _alead(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._count(shared=False)
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Only this caller is cancelled; its followers are still waiting for a reply
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Marks it retrieved, so a call without followers doesn't log a warning
+            raise
+        finally:
+            del self._async_calls[key]
+
+    def astream(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        # Joins (or starts) the call on its first __anext__: an async generator can't be advanced from here,
+        # and one dropped before it started would never run the finally that gives up its place
+        return self._aconsume(key, fn)
+
+    def _forget_async_stream(self, key: str, call: _AsyncStreamCall):
+        if self._async_stream_calls.get(key) is call:
+            del self._async_stream_calls[key]
+
+    def _pulled(self, key: str, call: _AsyncStreamCall, pull: asyncio.Future):
+        # Registered before any consumer waits on the pull, so it runs before they wake up
+        call.pull = None
+        if pull.cancelled():
+            return
+        error = pull.exception()
+        if error is None:
+            call.chunks.append(pull.result())
+            return
+        call.finished = True
+        if not isinstance(error, StopAsyncIteration):
+            call.error = error
+        self._forget_async_stream(key, call)
+
+    async def _aconsume(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        call = self._async_stream_calls.get(key)
+        if call is None:
+            call = _AsyncStreamCall(fn().__aiter__())
+            self._async_stream_calls[key] = call
+            self._count(shared=False)
+        else:
+            self._count(shared=True)
+        call.consumers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(call.chunks):
+                    chunk = call.chunks[position]
+                    position += 1
+                    yield chunk
+                    continue
+                if call.finished:
+                    if call.error is not None:
+                        raise call.error
+                    return
+                if call.pull is None:
+                    call.pull = asyncio.ensure_future(call.source.__anext__())
+                    call.pull.add_done_callback(functools.partial(self._pulled, key, call))
+                # wait() doesn't cancel the pull when this consumer is cancelled, unlike awaiting it directly
+                await asyncio.wait([call.pull])
+        finally:
+            call.consumers -= 1
+            if call.consumers == 0 and not call.finished:
+                self._forget_async_stream(key, call)
+                if call.pull is not None:
+                    call.pull.cancel()
+                else:
+                    aclose = getattr(call.source, "aclose", None)
+                    if aclose is not None:
+                        asyncio.ensure_future(aclose())
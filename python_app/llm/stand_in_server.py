@@ -0,0 +1,180 @@
+"""A local stand-in for an OpenAI- or Ollama-compatible model server, for tests and load runs.
+
+It answers both POST /v1/chat/completions and POST /api/chat, streamed or not, with a canned
+reply. Latency and failures are scriptable:
+
+- `latency` is the wait before the response starts.
+- `piece_delay` is the wait between streamed pieces.
+- `failure_rate` is the share of requests answered with `failure_status`.
+- `fail_next(...)` queues specific statuses for the next requests, ahead of everything else.
+
+It counts requests and the TCP connections they arrived on, so connection reuse can be checked.
+
+Run with: python -m python_app.llm.stand_in_server [--port 11435] [--latency 0.2] [--failure-rate 0.05]
+"""
+import argparse
+import collections
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Optional
+
+class StandInModelServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, reply: str = "stand-in reply",
+                 latency: float = 0.0, piece_delay: float = 0.0, failure_rate: float = 0.0, failure_status: int = 503):
+        self.reply = reply
+        self.latency = latency
+        self.piece_delay = piece_delay
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = 0
+        self.connections = 0
+        self._scripted_failures: Deque[int] = collections.deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, *statuses: int):
+        """The next len(statuses) requests are answered with these statuses, in order."""
+        with self._lock:
+            self._scripted_failures.extend(statuses)
+
+    def start(self) -> "StandInModelServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stand-in-model-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandInModelServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_failure(self) -> Optional[int]:
+        with self._lock:
+            self.requests += 1
+            if self._scripted_failures:
+                return self._scripted_failures.popleft()
+        return self.failure_status if self.failure_rate and random.random() < self.failure_rate else None
+
+    def _connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, so clients can reuse the connection
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; without this, Nagle's algorithm and delayed ACKs add ~40 ms
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stand_in._connected()
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                failure = stand_in._next_failure()
+                time.sleep(stand_in.latency)
+                if failure is not None:
+                    self._send_json(failure, {"error": f"stand-in failure {failure}"})
+                elif self.path.endswith("/chat/completions"):
+                    self._openai(body)
+                elif self.path == "/api/chat":
+                    self._ollama(body)
+                else:
+                    self._send_json(404, {"error": f"no route {self.path}"})
+
+            def _openai(self, body: dict):
+                model = body.get("model", "stand-in")
+                if not body.get("stream"):
+                    self._send_json(200, {"object": "chat.completion", "model": model, "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": stand_in.reply}, "finish_reason": "stop"}
+                    ]})
+                    return
+                self._start_chunked("text/event-stream")
+                for piece in self._pieces():
+                    chunk = {"object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _ollama(self, body: dict):
+                model = body.get("model", "stand-in")
+                if not body.get("stream", True):
+                    self._send_json(200, {"model": model, "message": {"role": "assistant", "content": stand_in.reply}, "done": True})
+                    return
+                self._start_chunked("application/x-ndjson")
+                for piece in self._pieces():
+                    self._write_chunk(json.dumps({"model": model, "message": {"role": "assistant", "content": piece}, "done": False}).encode() + b"\n")
+                self._write_chunk(json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True}).encode() + b"\n")
+                self._write_chunk(b"")
+
+            def _pieces(self):
+                words = stand_in.reply.split(" ")
+                for index, word in enumerate(words):
+                    if index and stand_in.piece_delay:
+                        time.sleep(stand_in.piece_delay)
+                    yield word if index == len(words) - 1 else word + " "
+
+            def _send_json(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_chunked(self, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+            def _write_chunk(self, data: bytes):
+                # An empty chunk ends the body
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--reply', default="stand-in reply")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--piece-delay', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-status', type=int, default=503)
+    args = parser.parse_args()
+    server = StandInModelServer(host=args.host, port=args.port, reply=args.reply, latency=args.latency,
+                                piece_delay=args.piece_delay, failure_rate=args.failure_rate,
+                                failure_status=args.failure_status)
+    print(f"Stand-in model server on {server.url} (OpenAI: {server.url}/v1, Ollama: {server.url})")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,116 @@
+from typing import AsyncIterator, Iterator, Optional, Tuple
+import numpy as np
 from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.semantic_cache import SemanticCache
+from python_app.llm.single_flight import SingleFlight, normalize_request_key
+from python_app.metrics import stage_timer
 
 class PythonLLMOrchestrator:
-    def __init__(self, storage_agent: PythonStorageAgent):
+    def __init__(self, storage_agent: PythonStorageAgent, semantic_cache: Optional[SemanticCache] = None,
+                 single_flight: Optional[SingleFlight] = None):
         self.storage_agent = storage_agent
+        # Answers paraphrases of earlier prompts before they reach the agent at all
+        self.semantic_cache = semantic_cache
+        # Lets concurrent identical requests (retries, several tabs) share one upstream generation
+        self.single_flight = single_flight
 
-    def call(self, request: str) -> str:
-        return self.storage_agent.chat(request)
+    def _semantic_hit(self, request: str, memory_id: Optional[str]) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        # The embedding comes back too, so a miss can store its reply without embedding the request again.
+        # A reply that depends on conversation history can't be reused for another conversation
+        if self.semantic_cache is None or memory_id is not None:
+            return None, None
+        embedding = self.semantic_cache.embedder.embed([request])
+        hit = self.semantic_cache.lookup_embeddings(embedding)[0]
+        return (hit.response if hit is not None else None), embedding[0]
+
+    def _remember(self, request: str, reply: str, embedding: Optional[np.ndarray]):
+        if embedding is not None:
+            self.semantic_cache.put_embedding(request, embedding, reply)
+
+    @staticmethod
+    def _flight_key(request: str, memory_id: Optional[str]) -> str:
+        key = normalize_request_key(request)
+        return key if memory_id is None else f"{memory_id}\x00{key}"
+
+    def _generate(self, request: str, memory_id: Optional[str], embedding: Optional[np.ndarray]) -> str:
+        reply = self.storage_agent.chat(request, memory_id=memory_id)
+        self._remember(request, reply, embedding)
+        return reply
+
+    def _generate_stream(self, request: str, memory_id: Optional[str], embedding: Optional[np.ndarray]) -> Iterator[str]:
+        pieces = []
+        for piece in self.storage_agent.stream(request, memory_id=memory_id):
+            pieces.append(piece)
+            yield piece
+        self._remember(request, "".join(pieces), embedding)
+
+    async def _agenerate(self, request: str, memory_id: Optional[str], embedding: Optional[np.ndarray]) -> str:
+        reply = await self.storage_agent.achat(request, memory_id=memory_id)
+        self._remember(request, reply, embedding)
+        return reply
+
+    async def _agenerate_stream(self, request: str, memory_id: Optional[str], embedding: Optional[np.ndarray]) -> AsyncIterator[str]:
+        pieces = []
+        async for piece in self.storage_agent.astream(request, memory_id=memory_id):
+            pieces.append(piece)
+            yield piece
+        self._remember(request, "".join(pieces), embedding)
+
+    def call(self, request: str, memory_id: Optional[str] = None) -> str:
+        with stage_timer("orchestrator"):
+            return self._call(request, memory_id)
+
+    def _call(self, request: str, memory_id: Optional[str]) -> str:
+        cached, embedding = self._semantic_hit(request, memory_id)
+        if cached is not None:
+            return cached
+        if self.single_flight is None:
+            return self._generate(request, memory_id, embedding)
+        return self.single_flight.do(self._flight_key(request, memory_id), lambda: self._generate(request, memory_id, embedding))
+
+    def stream(self, request: str, memory_id: Optional[str] = None) -> Iterator[str]:
+        # Timed until the stream is exhausted (or closed by a client that went away)
+        with stage_timer("orchestrator"):
+            yield from self._stream(request, memory_id)
+
+    def _stream(self, request: str, memory_id: Optional[str]) -> Iterator[str]:
+        cached, embedding = self._semantic_hit(request, memory_id)
+        if cached is not None:
+            yield cached
+            return
+        if self.single_flight is None:
+            yield from self._generate_stream(request, memory_id, embedding)
+            return
+        yield from self.single_flight.stream(self._flight_key(request, memory_id),
+                                             lambda: self._generate_stream(request, memory_id, embedding))
+
+    async def acall(self, request: str, memory_id: Optional[str] = None) -> str:
+        with stage_timer("orchestrator"):
+            return await self._acall(request, memory_id)
+
+    async def _acall(self, request: str, memory_id: Optional[str]) -> str:
+        cached, embedding = self._semantic_hit(request, memory_id)
+        if cached is not None:
+            return cached
+        if self.single_flight is None:
+            return await self._agenerate(request, memory_id, embedding)
+        return await self.single_flight.ado(self._flight_key(request, memory_id),
+                                            lambda: self._agenerate(request, memory_id, embedding))
+
+    async def astream(self, request: str, memory_id: Optional[str] = None) -> AsyncIterator[str]:
+        with stage_timer("orchestrator"):
+            async for piece in self._astream(request, memory_id):
+                yield piece
+
+    async def _astream(self, request: str, memory_id: Optional[str]) -> AsyncIterator[str]:
+        cached, embedding = self._semantic_hit(request, memory_id)
+        if cached is not None:
+            yield cached
+            return
+        if self.single_flight is None:
+            source = self._agenerate_stream(request, memory_id, embedding)
+        else:
+            source = self.single_flight.astream(self._flight_key(request, memory_id),
+                                                lambda: self._agenerate_stream(request, memory_id, embedding))
+        async for piece in source:
+            yield piece
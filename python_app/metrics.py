@@ -0,0 +1,224 @@
+"""Process-wide latency histograms, served in Prometheus text format on /metrics.
+
+`stage_timer("model_call")` times one stage of a request into the `stift_stage_duration_seconds`
+histogram. Stages nest: prompt_build includes the chat_memory reads it does. Inside
+`track_request()` the same timer also records start and duration on the request's
+RequestTimings. The Ollama routes fill their timing fields from those. Inside a trace it also
+records a span (see python_app.tracing). An observation costs a perf_counter_ns pair, a bisect
+and a short lock, which is small next to any stage worth timing.
+
+Stats that components already keep (admission, caches, chat memory, router) aren't duplicated
+here: `stats_gauges` reads their numeric fields on each scrape.
+"""
+import bisect
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from python_app import tracing
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, _HistogramChild(self.bounds))
+        return child
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> Iterator[str]:
+        for values, child in sorted(self._children.items()):
+            with child.lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {count}"
+
+class StatsGauges:
+    """The numeric fields of a stats() dataclass, read on every scrape, one untyped metric each."""
+    kind = None
+
+    def __init__(self, prefix: str, help: str, stats: Callable[[], object]):
+        self.name = prefix
+        self.help = help
+        self.stats = stats
+
+    def render(self) -> Iterator[str]:
+        snapshot = self.stats()
+        for field in dataclasses.fields(snapshot):
+            value = getattr(snapshot, field.name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield f"# HELP {self.name}_{field.name} {self.help}: {field.name.replace('_', ' ')}"
+                yield f"# TYPE {self.name}_{field.name} untyped"
+                yield f"{self.name}_{field.name} {_format_value(value)}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering a name (an app factory run twice, a test) replaces the old one
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def stats_gauges(self, prefix: str, help: str, stats: Callable[[], object]) -> StatsGauges:
+        return self._register(StatsGauges(prefix, help, stats))
+
+    def render(self) -> str:
+        """Everything registered, in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if metric.kind is not None:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("stift_stage_duration_seconds", "Time spent in one stage of handling a request", ("stage",))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("stift_http_request_duration_seconds",
+                                          "Time from a request arriving to its response (headers, for streams)",
+                                          ("endpoint", "method", "status"))
+
+@dataclasses.dataclass
+class RequestTimings:
+    """What the stages of one request took; durations in nanoseconds, like Ollama reports them."""
+    started_ns: int = dataclasses.field(default_factory=time.perf_counter_ns)
+    stages: Dict[str, Tuple[int, int]] = dataclasses.field(default_factory=dict) # stage -> (first start, total duration)
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+    def record(self, stage: str, started_ns: int, duration_ns: int):
+        first_started, total = self.stages.get(stage, (started_ns, 0))
+        self.stages[stage] = (first_started, total + duration_ns)
+
+    def started(self, stage: str) -> Optional[int]:
+        return self.stages[stage][0] if stage in self.stages else None
+
+    def duration(self, stage: str) -> Optional[int]:
+        return self.stages[stage][1] if stage in self.stages else None
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+@contextlib.contextmanager
+def track_request(timings: Optional[RequestTimings] = None) -> Iterator[RequestTimings]:
+    """Makes stage timers in this context (and tasks started from it) also record into `timings`."""
+    timings = timings or RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+class stage_timer:
+    """Context manager (or decorator, through `timed`) that times a stage of the current request."""
+    __slots__ = ("stage", "child", "started_ns", "span")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.child = STAGE_SECONDS.labels(stage)
+
+    def __enter__(self) -> "stage_timer":
+        self.started_ns = time.perf_counter_ns()
+        self.span = tracing.start_span(self.stage, self.started_ns)
+        return self
+
+    def __exit__(self, *exc_info):
+        duration_ns = time.perf_counter_ns() - self.started_ns
+        if self.span is not None:
+            tracing.end_span(self.span, duration_ns)
+        self.child.observe(duration_ns / 1e9)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.record(self.stage, self.started_ns, duration_ns)
+
+def timed(stage: str):
+    """Decorator form of stage_timer for plain (not generator, not async) functions."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_engine(engine):
+    """Times every statement run through the SQLAlchemy engine as the "db" stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # One execution context per statement (batches of a bulk insert run one after another on it)
+        context._stift_started_ns = time.perf_counter_ns()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_ns = context._stift_started_ns
+        duration_ns = time.perf_counter_ns() - started_ns
+        STAGE_SECONDS.labels("db").observe(duration_ns / 1e9)
+        tracing.record_span("db", started_ns, duration_ns)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.record("db", started_ns, duration_ns)
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Text
+from sqlalchemy import Column, Index, Integer, String, Text
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID # For later, if we use postgres
 # Removed: from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker # Keep for example, though not used by model directly
@@ -23,6 +23,21 @@ class ChatMemoryModel(Base):
     memory_id = Column(String, unique=True, index=True, nullable=False)
     json_messages = Column(Text, nullable=False)
 
+# Legacy layout above stores a whole conversation as one JSON blob that is rewritten on every turn.
+# New conversations are stored one row per message instead, so a turn only inserts its new rows.
+class ChatMessageModel(Base):
+    __tablename__ = "chat_message"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    memory_id = Column(String, nullable=False)
+    seq = Column(Integer, nullable=False) # Position of the message within its conversation, starting at 0
+    json_message = Column(Text, nullable=False)
+
+    __table_args__ = (
+        # Serves appends (max seq), ranged reads of the last N messages and deletes by conversation
+        Index("ix_chat_message_memory_id_seq", "memory_id", "seq", unique=True),
+    )
+
 # Example of how to create an engine and session (not for direct use here but for context)
 # SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 # from sqlalchemy import create_engine # Add import for example
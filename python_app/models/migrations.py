@@ -0,0 +1,72 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .chat_memory_model import ChatMemoryModel
+from .pantry_model import PantryModel, PantryNameIndexModel, PantryVersionModel
+from ..services.name_index import normalize_name
+from ..services.chat_memory_store import migrate_legacy_entry
+
+logger = logging.getLogger(__name__)
+
+def migrate_chat_memory_blobs(session: Session, batch_size: int = 500) -> int:
+    """Moves every conversation out of the legacy `chat_memory` blob table into `chat_message` rows.
+
+    Safe to run repeatedly: migrated blobs are deleted, so a second run finds nothing to do.
+    PythonChatMemoryStore also migrates lazily per conversation until it sees the table empty.
+    """
+    migrated = 0
+    while True:
+        batch = session.query(ChatMemoryModel).limit(batch_size).all()
+        if not batch:
+            break
+        for legacy in batch:
+            migrate_legacy_entry(session, legacy)
+        session.commit()
+        migrated += len(batch)
+    if migrated:
+        logger.info(f"Migrated {migrated} chat memories to per-message rows")
+    return migrated
+
+def _add_pantry_entry_column(engine: Engine, name: str, definition: str) -> bool:
+    # create_all only creates missing tables, not missing columns
+    inspector = inspect(engine)
+    if not inspector.has_table("pantry_entry"):
+        return False
+    if any(column["name"] == name for column in inspector.get_columns("pantry_entry")):
+        return False
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE pantry_entry ADD COLUMN {name} {definition}"))
+    logger.info(f"Added {name} column to pantry_entry")
+    return True
+
+def add_pantry_entry_version_column(engine: Engine) -> bool:
+    """Adds the optimistic-locking `version` column to a `pantry_entry` table created before it existed.
+
+    Existing rows start at version 1. Returns whether the column was added.
+    """
+    return _add_pantry_entry_column(engine, "version", "INTEGER NOT NULL DEFAULT 1")
+
+def add_pantry_entry_last_delta_column(engine: Engine) -> bool:
+    """Adds the `last_delta` column the ledger reads its deltas from. Returns whether the column was added."""
+    return _add_pantry_entry_column(engine, "last_delta", "FLOAT NOT NULL DEFAULT 0")
+
+def backfill_pantry_name_index(session: Session, batch_size: int = 1000) -> int:
+    """Adds name index rows for pantry entries written before the index existed. Safe to run repeatedly."""
+    version = session.query(PantryVersionModel.version).filter(PantryVersionModel.id == 1).scalar() or 0
+    backfilled = 0
+    while True:
+        missing = session.query(PantryModel.id, PantryModel.name).outerjoin(
+            PantryNameIndexModel, PantryNameIndexModel.entry_id == PantryModel.id
+        ).filter(PantryNameIndexModel.entry_id.is_(None)).limit(batch_size).all()
+        if not missing:
+            break
+        session.add_all(
+            PantryNameIndexModel(entry_id=entry_id, normalized_name=normalize_name(name), updated_version=version)
+            for entry_id, name in missing
+        )
+        session.commit()
+        backfilled += len(missing)
+    if backfilled:
+        logger.info(f"Backfilled {backfilled} pantry name index rows")
+    return backfilled
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Float
+from sqlalchemy import Column, String, Float, Integer, Index
 # Removed: from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import UUID as DB_UUID_type # For PostgreSQL
 from sqlalchemy import Uuid as Default_UUID_type # Generic UUID type
@@ -15,3 +15,61 @@ class PantryModel(Base):
     name = Column(String, nullable=False, index=True) # Added index for name as it's often queried
     quantity = Column(Float, nullable=False)
     unit = Column(String, nullable=False)
+    # Bumped by every write; writers compare it to the version they read, so a concurrent change is detected instead of overwritten
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Change made by the row's last write (the whole quantity for an insert). Each write computes it from the
+    # old row inside its own statement and returns it, so the ledger gets its delta without reading the row first.
+    last_delta = Column(Float, nullable=False, default=0.0, server_default="0")
+
+    __mapper_args__ = {"version_id_col": version}
+
+class PantryVersionModel(Base):
+    """Single-row counter bumped by every pantry write, so caches in other workers can spot stale data."""
+    __tablename__ = "pantry_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class PantryNameIndexModel(Base):
+    """Normalized pantry names for fuzzy matching, tagged with the pantry version that last wrote them."""
+    __tablename__ = "pantry_name_index"
+
+    entry_id = Column(Default_UUID_type(as_uuid=True), primary_key=True)
+    normalized_name = Column(String, nullable=False, index=True)
+    updated_version = Column(Integer, nullable=False, index=True)
+
+class PantryLedgerModel(Base):
+    """Append-only log of pantry changes, written in the same transaction as the change itself.
+
+    `day` (days since the epoch) is the partition key: range queries and compaction select whole
+    days through the (day, name) index instead of scanning the table.
+    """
+    __tablename__ = "pantry_ledger"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entry_id = Column(Default_UUID_type(as_uuid=True), nullable=False)
+    name = Column(String, nullable=False)
+    unit = Column(String, nullable=False)
+    kind = Column(String, nullable=False) # LedgerKind value
+    delta = Column(Float, nullable=False)
+    quantity_after = Column(Float, nullable=False)
+    occurred_at = Column(Float, nullable=False) # seconds since the epoch, UTC
+    day = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_pantry_ledger_day_name", "day", "name"),
+        Index("ix_pantry_ledger_name_occurred_at", "name", "occurred_at"),
+    )
+
+class PantryLedgerRollupModel(Base):
+    """Per-day, per-entry totals that compaction folds old ledger events into."""
+    __tablename__ = "pantry_ledger_rollup"
+
+    day = Column(Integer, primary_key=True)
+    entry_id = Column(Default_UUID_type(as_uuid=True), primary_key=True)
+    name = Column(String, nullable=False, index=True)
+    unit = Column(String, nullable=False)
+    added = Column(Float, nullable=False)
+    used = Column(Float, nullable=False)
+    events = Column(Integer, nullable=False)
+    quantity_end = Column(Float, nullable=False) # stock at the end of the day
@@ -0,0 +1,195 @@
+"""On-demand sampling profiler for the next N requests or T seconds.
+
+It is off unless an admin arms it, and then the request hooks only check one attribute. While armed,
+a background thread samples the stacks of the threads serving profiled requests every few
+milliseconds, using sys._current_frames. The samples are added up per function and as folded
+stacks, which flamegraph.pl and speedscope can read.
+
+This is a sampler rather than cProfile for three reasons:
+- cProfile only sees the thread that enabled it.
+- It allows one active profiler per process on 3.12+.
+- It slows down every Python call.
+
+A sampler only reads the threads it watches, and only at its interval. A request served on an
+asyncio event loop can only be sampled through the loop's thread, so its samples include every
+other coroutine the loop ran meanwhile; the report says so when that happened.
+"""
+import collections
+import dataclasses
+import functools
+import sys
+import threading
+import time
+from typing import Callable, Counter, Dict, List, Optional, Set, Tuple
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+@dataclasses.dataclass
+class FunctionSamples:
+    function: str # "file:line(name)", as pstats prints it
+    self_samples: int # samples with this function on top of the stack
+    total_samples: int # samples with this function anywhere on the stack
+
+@dataclasses.dataclass
+class ProfileReport:
+    requests: int
+    samples: int
+    interval_ms: float
+    duration_seconds: float
+    functions: List[FunctionSamples]
+    stacks: List[str] # folded: "outer;inner;innermost count"
+    notes: List[str] = dataclasses.field(default_factory=list) # caveats about what the samples cover
+
+_EVENT_LOOP_NOTE = ("Some requests ran on an asyncio event loop, whose thread was sampled as a whole: those samples "
+                    "include every coroutine the loop ran meanwhile, not only the profiled requests.")
+
+def _label(code) -> str:
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+class ProfilingSession:
+    def __init__(self, max_requests: Optional[int] = None, max_seconds: float = 30.0, interval_seconds: float = 0.005,
+                 max_depth: int = 128, clock: Callable[[], float] = time.monotonic):
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.interval_seconds = interval_seconds
+        self.max_depth = max_depth
+        self.clock = clock
+        self.started = clock()
+        self.finished_at: Optional[float] = None
+        self.claimed = 0
+        self.completed = 0
+        self.samples = 0
+        self._stacks: Counter[Tuple[str, ...]] = collections.Counter()
+        self._watched: Counter[int] = collections.Counter() # thread id -> profiled requests it is serving
+        self._event_loops: Set[int] = set() # watched threads that run an event loop
+        self._labels: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self) -> "ProfilingSession":
+        self._thread.start()
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def request_started(self, thread_id: int, event_loop: bool = False) -> bool:
+        """Claims a place for a request served on `thread_id`; False once the session has all it wants."""
+        with self._lock:
+            if self._done.is_set() or (self.max_requests is not None and self.claimed >= self.max_requests):
+                return False
+            self.claimed += 1
+            self._watched[thread_id] += 1
+            if event_loop:
+                self._event_loops.add(thread_id)
+            return True
+
+    def request_finished(self, thread_id: int):
+        with self._lock:
+            self._watched[thread_id] -= 1
+            if not self._watched[thread_id]:
+                del self._watched[thread_id]
+            self.completed += 1
+            if self.max_requests is not None and self.completed >= self.max_requests:
+                self._done.set()
+
+    def wait(self) -> "ProfileReport":
+        self._thread.join()
+        return self.report()
+
+    def stop(self):
+        self._done.set()
+
+    def _run(self):
+        while not self._done.wait(self.interval_seconds):
+            if self.clock() - self.started >= self.max_seconds:
+                self._done.set()
+                break
+            self._sample()
+        self.finished_at = self.clock()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            thread_ids = list(self._watched)
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _label(code)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                with self._lock:
+                    self._stacks[tuple(stack)] += 1
+                    self.samples += 1
+
+    def report(self, limit: int = 50) -> ProfileReport:
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples, completed = self.samples, self.completed
+            sampled_event_loop = bool(self._event_loops)
+        self_samples: Counter[str] = collections.Counter()
+        total_samples: Counter[str] = collections.Counter()
+        for stack, count in stacks:
+            self_samples[stack[-1]] += count
+            for function in set(stack): # recursion counts once per sample
+                total_samples[function] += count
+        functions = [FunctionSamples(function, self_samples[function], count)
+                     for function, count in total_samples.most_common()]
+        functions.sort(key=lambda samples: (samples.self_samples, samples.total_samples), reverse=True)
+        return ProfileReport(
+            requests=completed,
+            samples=samples,
+            interval_ms=self.interval_seconds * 1000,
+            duration_seconds=round((self.finished_at or self.clock()) - self.started, 3),
+            functions=functions[:limit],
+            stacks=[f"{';'.join(stack)} {count}" for stack, count in sorted(stacks, key=lambda item: item[1], reverse=True)],
+            notes=[_EVENT_LOOP_NOTE] if sampled_event_loop else [],
+        )
+
+class Profiler:
+    """At most one armed session at a time, shared by the request hooks and the admin endpoint."""
+    def __init__(self, interval_seconds: float = 0.005, max_seconds: float = 300.0):
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.session: Optional[ProfilingSession] = None
+        self._lock = threading.Lock()
+
+    def start(self, max_requests: Optional[int] = None, max_seconds: float = 30.0) -> ProfilingSession:
+        with self._lock:
+            if self.session is not None and not self.session.done:
+                raise ProfilerBusy("A profiling session is already running")
+            self.session = ProfilingSession(max_requests, min(max_seconds, self.max_seconds), self.interval_seconds).start()
+            return self.session
+
+    def profile(self, max_requests: Optional[int] = None, max_seconds: float = 30.0) -> ProfileReport:
+        """Profiles the next `max_requests` requests, or whatever arrives within `max_seconds`, and reports."""
+        session = self.start(max_requests, max_seconds)
+        try:
+            return session.wait()
+        finally:
+            session.stop()
+            with self._lock:
+                if self.session is session:
+                    self.session = None
+
+    def request_started(self, event_loop: bool = False) -> Optional[Callable[[], None]]:
+        """If an armed session takes the request on this thread, the callback to call once it is done.
+
+        Pass `event_loop=True` from a coroutine: the whole loop thread gets sampled, which the report notes.
+        """
+        session = self.session
+        if session is None:
+            return None
+        thread_id = threading.get_ident()
+        if not session.request_started(thread_id, event_loop):
+            return None
+        return functools.partial(session.request_finished, thread_id)
@@ -0,0 +1,42 @@
+import dataclasses
+import hmac
+import math
+from flask import Blueprint, Response, current_app, jsonify, request
+from python_app.profiling import ProfilerBusy
+
+admin_bp = Blueprint('admin_bp', __name__, url_prefix='/admin')
+
+def _authorized(token: str) -> bool:
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+@admin_bp.route('/profile', methods=['POST'])
+def profile():
+    """Samples the next ?requests=N requests, or ?seconds=T of traffic, and answers with the aggregated profile.
+
+    ?format=folded answers with folded stacks only, ready for flamegraph.pl or speedscope. Requests
+    served on the ASGI event loop are sampled through the loop's thread, so their samples cover the
+    whole loop; the JSON report's `notes` say when that happened.
+    """
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        # Without a configured token the endpoint doesn't exist
+        return jsonify({"error": "Not found"}), 404
+    if not _authorized(token):
+        return jsonify({"error": "Unauthorized"}), 401, {'WWW-Authenticate': 'Bearer'}
+    try:
+        # Parsed by hand: request.args.get(type=int) turns "abc" into None, which would mean "no request limit"
+        max_requests = int(request.args['requests']) if 'requests' in request.args else None
+        max_seconds = float(request.args.get('seconds', 30))
+    except ValueError:
+        return jsonify({"error": "requests must be an integer and seconds a number"}), 400
+    # nan passes a <= 0 check and would keep the session (and the profiler) busy for good
+    if (max_requests is not None and max_requests < 1) or not (math.isfinite(max_seconds) and max_seconds > 0):
+        return jsonify({"error": "requests and seconds must be positive and finite"}), 400
+    try:
+        report = current_app.config['PROFILER'].profile(max_requests, max_seconds)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    if request.args.get('format') == 'folded':
+        return Response("\n".join(report.stacks) + "\n", mimetype='text/plain')
+    return jsonify(dataclasses.asdict(report))
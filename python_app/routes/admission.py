@@ -0,0 +1,281 @@
+"""Admission control for the chat endpoints.
+
+Every chat request needs a permit before it does any work. Rate limits are checked first:
+- per client: over its token bucket gets a 429
+- overall: over the global bucket gets a 503
+
+The request then needs one of `max_concurrent` slots. When none is free it waits in a FIFO
+queue, for at most `max_queue_wait_seconds`. A full queue, or a wait that runs out, gets a 503.
+Every rejection carries a Retry-After, and is answered before the body is read. Under overload,
+callers are turned away quickly instead of piling up in threads until everything times out at
+once.
+
+Flask threads and the ASGI event loop can share one controller: sync waiters block on an Event,
+async waiters await a Future, and a released slot goes straight to the longest waiter.
+"""
+import asyncio
+import collections
+import dataclasses
+import functools
+import math
+import threading
+import time
+from typing import Callable, Deque, Optional
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one will be available."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        """Gives back a token taken for a request that was turned away further on."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after_seconds: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        # Whole seconds, as the header wants them; never 0, which would invite an immediate retry
+        self.retry_after = max(1, math.ceil(retry_after_seconds))
+
+@dataclasses.dataclass
+class AdmissionStats:
+    in_flight: int = 0
+    queued: int = 0
+    admitted: int = 0
+    admitted_after_wait: int = 0
+    rejected_client_rate: int = 0
+    rejected_global_rate: int = 0
+    rejected_queue_full: int = 0
+    rejected_queue_timeout: int = 0
+    queue_wait_seconds_total: float = 0.0
+    queue_wait_seconds_max: float = 0.0
+
+    @property
+    def rejected(self) -> int:
+        return self.rejected_client_rate + self.rejected_global_rate + self.rejected_queue_full + self.rejected_queue_timeout
+
+    @property
+    def mean_queue_wait_seconds(self) -> float:
+        return self.queue_wait_seconds_total / self.admitted_after_wait if self.admitted_after_wait else 0.0
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class Permit:
+    """One admitted request's slot; release it exactly once, when the response is done."""
+    __slots__ = ("_controller", "_released")
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+    def __enter__(self) -> "Permit":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 64, max_queue: int = 256, max_queue_wait_seconds: float = 5.0,
+                 global_rate: float = 0.0, global_burst: float = 0.0, client_rate: float = 0.0, client_burst: float = 0.0,
+                 max_clients: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        """Rates are requests per second, 0 turns that limit off; bursts default to one second's worth."""
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_wait_seconds = max_queue_wait_seconds
+        self.client_rate = client_rate
+        self.client_burst = client_burst or max(1.0, client_rate)
+        self.max_clients = max_clients
+        self.clock = clock
+        self._global_bucket = TokenBucket(global_rate, global_burst or max(1.0, global_rate), clock) if global_rate > 0 else None
+        self._client_buckets: "collections.OrderedDict[str, TokenBucket]" = collections.OrderedDict()
+        self._waiters: Deque[_Waiter] = collections.deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stats = AdmissionStats()
+
+    def stats(self) -> AdmissionStats:
+        with self._lock:
+            return dataclasses.replace(self._stats, in_flight=self._in_flight, queued=len(self._waiters))
+
+    def _client_bucket(self, client: str) -> TokenBucket:
+        bucket = self._client_buckets.get(client)
+        if bucket is None:
+            bucket = self._client_buckets[client] = TokenBucket(self.client_rate, self.client_burst, self.clock)
+            if len(self._client_buckets) > self.max_clients:
+                # The least recently seen client; a full bucket is what it would get back anyway
+                self._client_buckets.popitem(last=False)
+        else:
+            self._client_buckets.move_to_end(client)
+        return bucket
+
+    def _admit_or_enqueue(self, client: str, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Admits the request (returns None), queues it (returns its waiter), or raises Rejected."""
+        with self._lock:
+            # Tokens taken here are given back when a later check turns the request away, so a client
+            # isn't charged for requests the server refused
+            taken = []
+            if self.client_rate > 0:
+                bucket = self._client_bucket(client)
+                wait = bucket.take()
+                if wait:
+                    self._stats.rejected_client_rate += 1
+                    raise Rejected(429, "Too many requests from this client", wait)
+                taken.append(bucket)
+            if self._global_bucket is not None:
+                wait = self._global_bucket.take()
+                if wait:
+                    self._refund(taken)
+                    self._stats.rejected_global_rate += 1
+                    raise Rejected(503, "Server is over its request rate", wait)
+                taken.append(self._global_bucket)
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._in_flight += 1
+                self._stats.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._refund(taken)
+                self._stats.rejected_queue_full += 1
+                raise Rejected(503, "Server is at capacity", self.max_queue_wait_seconds)
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    @staticmethod
+    def _refund(buckets):
+        for bucket in buckets:
+            bucket.refund()
+
+    def _finish_wait(self, waiter: _Waiter, started: float) -> Permit:
+        """After a wait ended: the permit if the slot was handed over in time, else a queue-timeout rejection."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self._stats.rejected_queue_timeout += 1
+                raise Rejected(503, "Timed out waiting for capacity", self.max_queue_wait_seconds)
+            waited = self.clock() - started
+            self._stats.admitted += 1
+            self._stats.admitted_after_wait += 1
+            self._stats.queue_wait_seconds_total += waited
+            self._stats.queue_wait_seconds_max = max(self._stats.queue_wait_seconds_max, waited)
+        return Permit(self)
+
+    def acquire(self, client: str) -> Permit:
+        """Blocks until admitted (at most max_queue_wait_seconds); raises Rejected otherwise."""
+        waiter = self._admit_or_enqueue(client, None)
+        if waiter is None:
+            return Permit(self)
+        started = self.clock()
+        waiter.event.wait(self.max_queue_wait_seconds)
+        return self._finish_wait(waiter, started)
+
+    async def aacquire(self, client: str) -> Permit:
+        waiter = self._admit_or_enqueue(client, asyncio.get_running_loop())
+        if waiter is None:
+            return Permit(self)
+        started = self.clock()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_queue_wait_seconds)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued; give back a slot that may already have been handed over
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self._release()
+            raise
+        return self._finish_wait(waiter, started)
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the longest waiter, so in_flight stays the same
+                self._waiters.popleft().grant()
+            else:
+                self._in_flight -= 1
+
+def client_id(remote_addr: Optional[str], headers, client_header: str = "", trusted_hops: int = 1) -> str:
+    """Identifies the caller for per-client limits: `client_header` when set (e.g. behind a proxy), else the peer address.
+
+    Each proxy appends the address it was connected from to a list header like X-Forwarded-For,
+    after whatever the client sent, so only the last `trusted_hops` entries were written by our own
+    proxies. The client is the entry the outermost of them added. When there are fewer entries than
+    that, the request didn't come through all the proxies, and the peer address is used.
+    """
+    if client_header:
+        value = headers.get(client_header)
+        if value:
+            entries = [entry.strip() for entry in value.split(",") if entry.strip()]
+            if trusted_hops >= 1 and len(entries) >= trusted_hops:
+                return entries[-trusted_hops]
+    return remote_addr or "unknown"
+
+def admission_controlled(view):
+    """Flask view decorator: the view runs holding a permit, which a streamed response keeps until it is closed."""
+    from flask import current_app, jsonify, request
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        controller: Optional[AdmissionController] = current_app.config.get('ADMISSION_CONTROLLER')
+        if controller is None:
+            return view(*args, **kwargs)
+        try:
+            permit = controller.acquire(client_id(request.remote_addr, request.headers,
+                                                  current_app.config.get('ADMISSION_CLIENT_HEADER', ''),
+                                                  current_app.config.get('ADMISSION_TRUSTED_PROXY_HOPS', 1)))
+        except Rejected as e:
+            response = jsonify({"error": e.reason})
+            response.status_code = e.status
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            permit.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(permit.release)
+        else:
+            permit.release()
+        return response
+    return wrapper
@@ -1,26 +1,23 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, jsonify, current_app
 from .request_models import CurlChatRequest
+from .admission import admission_controlled
+from .validation import MissingField, PayloadTooLarge, ValidationError, parse_flask_request
 
 curl_bp = Blueprint('curl_bp', __name__, url_prefix='/curl')
 
 @curl_bp.route('/chat', methods=['POST'])
+@admission_controlled
 def chat_request():
-    data = request.get_json()
-    if not data or 'message' not in data:
-        return jsonify({"error": "Missing message"}), 400
-    
     try:
-        # Assuming CurlChatRequest can be instantiated directly from the dict
-        # if its fields match the keys in `data`.
-        # For more complex validation or transformation, you might use a library
-        # or manual checks.
-        chat_req = CurlChatRequest(message=data['message'])
-    except TypeError as e:
-        # This might happen if 'message' key is present but other unexpected keys are also there
-        # and CurlChatRequest is strict about its fields.
-        # Or if data['message'] is not a string.
+        chat_req = parse_flask_request(CurlChatRequest, current_app.config['REQUEST_LIMITS'])
+    except PayloadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValidationError as e:
+        # A body that isn't an object, or one without the message, keeps the original error
+        if isinstance(e, MissingField) or not e.path:
+            return jsonify({"error": "Missing message"}), 400
         return jsonify({"error": f"Invalid request format: {str(e)}"}), 400
 
     orchestrator = current_app.config['LLM_ORCHESTRATOR']
-    reply = orchestrator.call(chat_req.message)
+    reply = orchestrator.call(chat_req.message, memory_id=chat_req.memory_id)
     return jsonify({"reply": reply})
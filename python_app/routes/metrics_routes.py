@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from python_app.metrics import REGISTRY
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape target: stage and request latency histograms, plus the components' own counters."""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
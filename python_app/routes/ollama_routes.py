@@ -1,53 +1,137 @@
-from flask import Blueprint, request, jsonify, current_app
+import contextlib
+import time
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from datetime import datetime, timezone
+from typing import Optional
 from .request_models import (
     OllamaChatRequest, OllamaChatResponse, OllamaMessage, 
     TagsResponse, ModelInfo, ModelDetails, 
     OllamaToolCall, OllamaToolCallFunction # Ensure these are imported if used by request structure
 )
-from dataclasses import asdict # For converting dataclasses to dict for jsonify
+from .serialization import PrecomputedBody, to_json, to_ndjson_line
+from python_app.metrics import RequestTimings, track_request
+from python_app import tracing
+from .admission import admission_controlled
+from .validation import PayloadTooLarge, ValidationError, parse_flask_request
 
 ollama_bp = Blueprint('ollama_bp', __name__, url_prefix='/ollama')
 
+OLLAMA_MODEL_NAME = "workshop_py_converted"
+
+def chunk_line(piece: str) -> bytes:
+    """Serializes one in-progress (`done: false`) streaming chunk as an NDJSON line."""
+    chunk = OllamaChatResponse(
+        model=OLLAMA_MODEL_NAME,
+        created_at=datetime.now(timezone.utc).isoformat(),
+        message=OllamaMessage(role="assistant", content=piece),
+        done=False
+    )
+    return to_ndjson_line(chunk)
+
+def final_chunk_line(started_ns: int, model_started_ns: int, first_chunk_ns: int, finished_ns: int, eval_count: int,
+                     prompt_eval_count: Optional[int] = None) -> bytes:
+    """Serializes the closing `done: true` chunk. Durations are in nanoseconds, as Ollama reports them."""
+    final_chunk = OllamaChatResponse(
+        model=OLLAMA_MODEL_NAME,
+        created_at=datetime.now(timezone.utc).isoformat(),
+        message=OllamaMessage(role="assistant", content=""),
+        done=True,
+        done_reason="stop",
+        total_duration=finished_ns - started_ns,
+        load_duration=model_started_ns - started_ns,
+        prompt_eval_count=prompt_eval_count,
+        prompt_eval_duration=first_chunk_ns - model_started_ns,
+        eval_count=eval_count,
+        eval_duration=finished_ns - first_chunk_ns
+    )
+    return to_ndjson_line(final_chunk)
+
+def timing_fields(timings: RequestTimings, finished_ns: int) -> dict:
+    """Ollama's timing fields for a complete (non-streamed) reply, from the request's stage timings.
+
+    A reply that came from a cache, or from a concurrent identical request, has no model call of
+    its own, so only its total duration is known.
+    """
+    fields = {
+        "total_duration": finished_ns - timings.started_ns,
+        "prompt_eval_count": timings.prompt_tokens,
+        "eval_count": timings.completion_tokens,
+    }
+    model_started_ns = timings.started("model_call")
+    if model_started_ns is not None:
+        fields["load_duration"] = model_started_ns - timings.started_ns
+        fields["eval_duration"] = timings.duration("model_call")
+    return fields
+
+def _stream_chat(orchestrator, message_content: str, timings: RequestTimings, trace: Optional[tracing.Trace] = None):
+    """Yields Ollama NDJSON chunks: one per model token, then a final `done` chunk with timings."""
+    # Runs after the view has returned, so the request's timings and trace are picked up again for the stream
+    with track_request(timings), (tracing.trace_request(trace) if trace is not None else contextlib.nullcontext()):
+        model_started_ns = time.perf_counter_ns()
+        first_chunk_ns = None
+        eval_count = 0
+        try:
+            for piece in orchestrator.stream(message_content):
+                if first_chunk_ns is None:
+                    first_chunk_ns = time.perf_counter_ns()
+                eval_count += 1
+                yield chunk_line(piece)
+        except Exception as e:
+            # Headers are already sent at this point, so report the failure in-band like Ollama does
+            current_app.logger.error(f"Ollama chat stream failed: {str(e)}")
+            yield to_ndjson_line({"error": str(e)})
+            return
+
+        finished_ns = time.perf_counter_ns()
+        yield final_chunk_line(timings.started_ns, model_started_ns, first_chunk_ns or finished_ns, finished_ns, eval_count,
+                               timings.prompt_tokens)
+
 @ollama_bp.route('/api/chat', methods=['POST'])
+@admission_controlled
 def chat_request():
-    data = request.get_json()
-    if not data or not data.get('messages'):
-        return jsonify({"error": "Invalid request structure for Ollama chat"}), 400
-    
+    with track_request() as timings:
+        return _chat(timings)
+
+def _chat(timings: RequestTimings):
     try:
-        # Basic parsing, assuming structure largely matches.
-        # For a production app, consider using a library like Pydantic for robust validation.
-        
-        # Assuming OllamaChatRequest can be constructed if data matches its structure.
-        # This is a simplified approach. Direct instantiation from a complex nested dict 
-        # might require a more sophisticated parsing mechanism (e.g. a library or a custom parser).
-        
-        # For placeholder, let's just extract some info to form a reply
-        last_msg_data = data['messages'][-1] # Get the last message
-        last_message_content = last_msg_data.get('content', '')
-
-        orchestrator = current_app.config['LLM_ORCHESTRATOR']
-        reply_content = orchestrator.call(last_message_content)
-        
-        response_message = OllamaMessage(role="assistant", content=reply_content)
-        
-        # Using datetime.now(timezone.utc).isoformat() to get a string, as dataclass field is str
-        chat_response = OllamaChatResponse(
-            model="workshop_py_converted", 
-            created_at=datetime.now(timezone.utc).isoformat(), 
-            message=response_message, 
-            done=True,
-            done_reason="stop" # Added done_reason as per dataclass definition
-        )
-        return jsonify(asdict(chat_response))
-        
-    except (TypeError, KeyError, IndexError) as e:
-        current_app.logger.error(f"Ollama chat request parsing error: {str(e)}")
+        chat = parse_flask_request(OllamaChatRequest, current_app.config['REQUEST_LIMITS'])
+    except PayloadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValidationError as e:
+        current_app.logger.info(f"Ollama chat request rejected: {str(e)}")
+        if not e.path:
+            return jsonify({"error": "Invalid request structure for Ollama chat"}), 400
         return jsonify({"error": f"Request parsing error: {str(e)}"}), 400
+    if not chat.messages:
+        return jsonify({"error": "Invalid request structure for Ollama chat"}), 400
 
-@ollama_bp.route('/api/tags', methods=['GET'])
-def get_tags():
+    last_message_content = chat.messages[-1].content
+    orchestrator = current_app.config['LLM_ORCHESTRATOR']
+
+    if chat.stream is True:
+        # Chunks are flushed to the client as soon as the model produces them,
+        # so time-to-first-token no longer waits for the whole completion.
+        return Response(
+            stream_with_context(_stream_chat(orchestrator, last_message_content, timings, tracing.current_trace())),
+            mimetype='application/x-ndjson'
+        )
+
+    reply_content = orchestrator.call(last_message_content)
+    
+    response_message = OllamaMessage(role="assistant", content=reply_content)
+    
+    # Using datetime.now(timezone.utc).isoformat() to get a string, as dataclass field is str
+    chat_response = OllamaChatResponse(
+        model=OLLAMA_MODEL_NAME, 
+        created_at=datetime.now(timezone.utc).isoformat(), 
+        message=response_message, 
+        done=True,
+        done_reason="stop", # Added done_reason as per dataclass definition
+        **timing_fields(timings, time.perf_counter_ns())
+    )
+    return Response(to_json(chat_response), mimetype='application/json')
+
+def _tags_response() -> TagsResponse:
     mock_details = ModelDetails(
         format="gguf", 
         family="mock_family_py", 
@@ -65,12 +149,25 @@ def get_tags():
         expires_at=None, # Optional field
         size_vram=None    # Optional field
     )
-    response = TagsResponse(models=[mock_model_info])
-    return jsonify(asdict(response))
+    return TagsResponse(models=[mock_model_info])
+
+# The model list and version are fixed for the life of the process, so their bodies are encoded once
+TAGS_BODY = PrecomputedBody.of(_tags_response())
+VERSION_BODY = PrecomputedBody.of({"version": "0.1.0_py_converted"})
+
+def _precomputed_response(precomputed: PrecomputedBody) -> Response:
+    """Serves the body with its ETag; a matching If-None-Match gets an empty 304 instead."""
+    response = Response(precomputed.body, mimetype='application/json')
+    response.set_etag(precomputed.etag)
+    return response.make_conditional(request)
+
+@ollama_bp.route('/api/tags', methods=['GET'])
+def get_tags():
+    return _precomputed_response(TAGS_BODY)
 
 @ollama_bp.route('/api/version', methods=['GET'])
 def get_version():
-    return jsonify({"version": "0.1.0_py_converted"})
+    return _precomputed_response(VERSION_BODY)
 
 @ollama_bp.route('/', methods=['GET'])
 def get_heartbeat():
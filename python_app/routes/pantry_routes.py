@@ -0,0 +1,99 @@
+import json
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, request, jsonify, current_app, g, stream_with_context
+from ..adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from ..services import pantry_transfer
+from ..services.pantry_service import ConcurrentModificationError, LedgerUnavailable
+
+pantry_bp = Blueprint('pantry_bp', __name__, url_prefix='/pantry')
+
+MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _requested_format():
+    """?format=ndjson|csv wins; otherwise the Content-Type of an upload, defaulting to NDJSON."""
+    format = request.args.get('format')
+    if format is None and request.mimetype == MIMETYPES["csv"]:
+        format = "csv"
+    return format or "ndjson"
+
+def _import_progress(pantry_service, lines, format, chunk_size):
+    """Yields one NDJSON progress line per committed chunk, then a summary line; errors are reported in-band."""
+    progress = pantry_transfer.ImportProgress()
+    try:
+        for progress in pantry_transfer.import_items(pantry_service, pantry_transfer.parse(lines, format), chunk_size):
+            yield json.dumps(asdict(progress)) + "\n"
+    except (ValueError, ConcurrentModificationError) as e:
+        # Parse, validation, unit and write-conflict errors; chunks before the failing one are already committed
+        current_app.logger.error(f"Pantry import stopped: {str(e)}")
+        yield json.dumps({"error": str(e), **asdict(progress)}) + "\n"
+        return
+    yield json.dumps({"done": True, **asdict(progress)}) + "\n"
+
+@pantry_bp.route('/import', methods=['POST'])
+def import_pantry():
+    format = _requested_format()
+    if format not in pantry_transfer.FORMATS:
+        return jsonify({"error": f"Unsupported format: {format}"}), 400
+    chunk_size = request.args.get('chunk_size', current_app.config['PANTRY_IMPORT_CHUNK_SIZE'], type=int)
+    if chunk_size < 1:
+        return jsonify({"error": "chunk_size must be positive"}), 400
+
+    # The read cache would pull the whole pantry into memory; other workers see the import through its version counter
+    pantry_service = current_app.config['PANTRY_SERVICE_FACTORY'](g.db_session, cached=False)
+    # request.stream is read line by line as the response is produced, so the upload is never buffered whole
+    return Response(
+        stream_with_context(_import_progress(pantry_service, request.stream, format, chunk_size)),
+        mimetype=MIMETYPES["ndjson"]
+    )
+
+@pantry_bp.route('/export', methods=['GET'])
+def export_pantry():
+    format = _requested_format()
+    if format not in pantry_transfer.FORMATS:
+        return jsonify({"error": f"Unsupported format: {format}"}), 400
+    entries = SqlAlchemyDurablePantryAdapter(g.db_session).stream_all(current_app.config['PANTRY_EXPORT_BATCH_SIZE'])
+    return Response(
+        stream_with_context(pantry_transfer.serialize(entries, format)),
+        mimetype=MIMETYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=pantry.{format}"}
+    )
+
+def _requested_range(default_days: int = 7):
+    """?start=&end= as ISO 8601 (naive means UTC); defaults to the last `default_days` days."""
+    end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.now(timezone.utc)
+    start = datetime.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=default_days)
+    return start, end
+
+@pantry_bp.route('/usage', methods=['GET'])
+def pantry_usage():
+    try:
+        start, end = _requested_range()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+    pantry_service = current_app.config['PANTRY_SERVICE_FACTORY'](g.db_session)
+    try:
+        totals = pantry_service.get_usage(start, end)
+    except LedgerUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(), "totals": [asdict(total) for total in totals]})
+
+@pantry_bp.route('/history/<name>', methods=['GET'])
+def pantry_history(name):
+    try:
+        start, end = _requested_range()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+    pantry_service = current_app.config['PANTRY_SERVICE_FACTORY'](g.db_session)
+    try:
+        history = pantry_service.get_history(name, start, end)
+    except LedgerUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    events = [
+        {**asdict(event), "entry_id": str(event.entry_id), "kind": event.kind.value, "occurred_at": event.occurred_at.isoformat()}
+        for event in history
+    ]
+    return jsonify({"name": name, "events": events})
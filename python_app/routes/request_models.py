@@ -1,10 +1,11 @@
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 @dataclass
 class CurlChatRequest:
-    message: str
+    message: str = field(metadata={"limit": "max_content_chars"})
+    memory_id: Optional[str] = None # continue this conversation instead of answering in isolation
 
 @dataclass
 class OllamaToolCallFunction:
@@ -18,9 +19,11 @@ class OllamaToolCall:
 @dataclass
 class OllamaMessage:
     role: str
-    content: str
+    # Ollama treats a missing content as empty, e.g. on assistant messages that only carry tool calls
+    content: str = field(default="", metadata={"limit": "max_content_chars"})
     images: Optional[List[str]] = None
-    tool_calls: Optional[List[OllamaToolCall]] = field(default_factory=list)
+    # Ollama leaves tool_calls out of messages that have none
+    tool_calls: Optional[List[OllamaToolCall]] = field(default_factory=list, metadata={"omit_empty": True})
 
 @dataclass
 class OllamaChatOptions:
@@ -28,13 +31,13 @@ class OllamaChatOptions:
 
 @dataclass
 class OllamaChatRequest:
-    model: str # model is usually required
-    messages: List[OllamaMessage] = field(default_factory=list)
+    model: str = "" # model is usually required; requests without one are served by the only model there is
+    messages: List[OllamaMessage] = field(default_factory=list, metadata={"limit": "max_messages"})
     stream: Optional[bool] = False
     options: Optional[OllamaChatOptions] = None
     # Added format and keep_alive based on Ollama docs for more complete request
-    format: Optional[str] = None # e.g., "json"
-    keep_alive: Optional[str] = None # e.g., "5m"
+    format: Optional[Union[str, Dict[str, Any]]] = None # e.g., "json", or a JSON schema for structured output
+    keep_alive: Optional[Union[str, float]] = None # e.g., "5m", or seconds
 
 
 @dataclass
@@ -55,9 +58,9 @@ class OllamaChatResponse:
 class ModelDetails:
     format: str
     family: str
-    families: Optional[List[str]] = None # Added based on Ollama /tags response
     parameter_size: str
     quantization_level: str
+    families: Optional[List[str]] = None # Added based on Ollama /tags response
 
 @dataclass
 class ModelInfo:
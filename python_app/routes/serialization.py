@@ -0,0 +1,83 @@
+"""JSON encoding of the request_models dataclasses, compiled once per class.
+
+`dataclasses.asdict` walks every value recursively and deep-copies it on each call. Here the
+first use of a dataclass generates a plain function that reads its fields directly, recurses
+only into fields typed as dataclasses, and leaves out None values, which Ollama omits rather
+than sending as null. Fields marked `metadata={"omit_empty": True}` are left out when empty too,
+like Go's `omitempty`. Bytes are produced by orjson when it is installed, by the json module
+otherwise.
+"""
+import dataclasses
+import datetime
+import functools
+import hashlib
+import json
+import typing
+from typing import Any, Callable, Dict
+
+try:
+    import orjson
+except ImportError: # optional; the standard library encoder is used instead
+    orjson = None
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+dumps: Callable[[Any], bytes] = orjson.dumps if orjson is not None else _stdlib_dumps
+
+def _unwrap_optional(hint):
+    if typing.get_origin(hint) is typing.Union:
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return hint
+
+def _value_expression(hint, variable: str, namespace: Dict[str, Any]) -> str:
+    """Python source that converts `variable`, of type `hint`, to plain JSON values."""
+    hint = _unwrap_optional(hint)
+    if dataclasses.is_dataclass(hint):
+        namespace[f"_to_dict_{hint.__name__}"] = serializer_for(hint)
+        return f"_to_dict_{hint.__name__}({variable})"
+    if typing.get_origin(hint) in (list, tuple) and typing.get_args(hint):
+        inner = _value_expression(typing.get_args(hint)[0], "item", namespace)
+        return variable if inner == "item" else f"[{inner} for item in {variable}]"
+    if hint is datetime.datetime:
+        return f"{variable}.isoformat()"
+    return variable
+
+@functools.lru_cache(maxsize=None)
+def serializer_for(cls) -> Callable[[Any], dict]:
+    """Generates, once per dataclass, a function that turns an instance into a JSON-ready dict."""
+    hints = typing.get_type_hints(cls)
+    namespace: Dict[str, Any] = {}
+    lines = ["def to_dict(obj):", "    result = {}"]
+    for field in dataclasses.fields(cls):
+        expression = _value_expression(hints[field.name], "value", namespace)
+        lines.append(f"    value = obj.{field.name}")
+        condition = "value" if field.metadata.get("omit_empty") else "value is not None"
+        lines.append(f"    if {condition}:")
+        lines.append(f"        result[{field.name!r}] = {expression}")
+    lines.append("    return result")
+    exec("\n".join(lines), namespace)
+    return namespace["to_dict"]
+
+def to_dict(value) -> dict:
+    return serializer_for(type(value))(value)
+
+def to_json(value) -> bytes:
+    """A dataclass instance (or plain dict) as compact JSON bytes."""
+    return dumps(to_dict(value) if dataclasses.is_dataclass(value) else value)
+
+def to_ndjson_line(value) -> bytes:
+    return to_json(value) + b"\n"
+
+@dataclasses.dataclass(frozen=True)
+class PrecomputedBody:
+    """A response body that never changes while the process runs, with its ETag."""
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, value) -> "PrecomputedBody":
+        body = to_json(value)
+        return cls(body=body, etag=hashlib.sha256(body).hexdigest()[:32])
@@ -0,0 +1,205 @@
+"""Parsing of raw JSON request bodies into the request_models dataclasses, compiled once per class.
+
+The first use of a dataclass generates a plain function that type-checks each field of a decoded
+JSON object and builds the instance, recursing into nested dataclasses and lists. Errors carry
+the path of the offending value, e.g. `messages[2].content: expected a string`. Keys the
+dataclass doesn't declare are ignored, as Ollama does. Size limits are checked before any of it:
+the body length before decoding, and list and string lengths of fields marked
+`metadata={"limit": "<RequestLimits attribute>"}` before their items are parsed.
+"""
+import dataclasses
+import datetime
+import functools
+import json
+import typing
+from typing import Any, Callable, Dict, List, Union
+from python_app.metrics import stage_timer
+
+try:
+    import orjson
+except ImportError: # optional; the standard library decoder is used instead
+    orjson = None
+
+@dataclasses.dataclass(frozen=True)
+class RequestLimits:
+    max_body_bytes: int = 1024 * 1024
+    max_messages: int = 256
+    max_content_chars: int = 100_000
+
+class ValidationError(ValueError):
+    def __init__(self, message: str, path: List[Union[str, int]] = None):
+        super().__init__(message)
+        self.message = message
+        self.path = path or []
+
+    def at(self, part: Union[str, int]) -> "ValidationError":
+        """Prefixes the path with the field or index the error was found under, and returns self to re-raise."""
+        self.path.insert(0, part)
+        return self
+
+    @property
+    def location(self) -> str:
+        location = ""
+        for part in self.path:
+            location += f"[{part}]" if isinstance(part, int) else (f".{part}" if location else part)
+        return location
+
+    def __str__(self) -> str:
+        return f"{self.location}: {self.message}" if self.path else self.message
+
+class MissingField(ValidationError):
+    pass
+
+class PayloadTooLarge(ValidationError):
+    pass
+
+_loads: Callable[[bytes], Any] = orjson.loads if orjson is not None else json.loads
+_DECODE_ERRORS = (ValueError, orjson.JSONDecodeError) if orjson is not None else (ValueError,)
+
+_SIMPLE_CHECKS = {
+    str: ("type({v}) is str", "expected a string"),
+    bool: ("type({v}) is bool", "expected a boolean"),
+    int: ("type({v}) is int", "expected an integer"),
+    float: ("type({v}) is float or type({v}) is int", "expected a number"),
+    dict: ("type({v}) is dict", "expected an object"),
+    list: ("type({v}) is list", "expected an array"),
+}
+
+class _Compiler:
+    """Emits the source of one parse function; nested values get numbered variables."""
+
+    def __init__(self, namespace: Dict[str, Any]):
+        self.namespace = namespace
+        self.lines: List[str] = []
+        self.depth = 0
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def convert(self, hint, source: str, target: str, indent: int, limit: str = None):
+        """Emits statements that check `source` against `hint` and store the parsed value in `target`."""
+        origin, args = typing.get_origin(hint), typing.get_args(hint)
+        if origin is Union:
+            self.convert_union(args, source, target, indent)
+        elif hint is Any:
+            self.emit(indent, f"{target} = {source}")
+        elif dataclasses.is_dataclass(hint):
+            self.namespace[f"_parse_{hint.__name__}"] = parser_for(hint)
+            self.emit(indent, f"{target} = _parse_{hint.__name__}({source}, limits)")
+        elif hint is datetime.datetime:
+            self.check(str, source, indent)
+            self.emit(indent, "try:")
+            self.emit(indent + 1, f"{target} = _datetime.fromisoformat({source})")
+            self.emit(indent, "except ValueError:")
+            self.emit(indent + 1, "raise ValidationError('expected an ISO 8601 timestamp')")
+        elif origin in (list, tuple) or hint in (list, tuple):
+            self.check(list, source, indent)
+            self.check_limit(source, limit, "items", indent)
+            inner = args[0] if args else Any
+            if inner is Any:
+                self.emit(indent, f"{target} = list({source})")
+                return
+            self.depth += 1
+            index, item, parsed = f"index{self.depth}", f"item{self.depth}", f"parsed{self.depth}"
+            self.emit(indent, f"{target} = []")
+            self.emit(indent, f"for {index}, {item} in enumerate({source}):")
+            self.emit(indent + 1, "try:")
+            self.convert(inner, item, parsed, indent + 2)
+            self.emit(indent + 1, "except ValidationError as error:")
+            self.emit(indent + 2, f"raise error.at({index})")
+            self.emit(indent + 1, f"{target}.append({parsed})")
+        elif origin is dict or hint is dict:
+            self.check(dict, source, indent)
+            self.emit(indent, f"{target} = {source}")
+        elif hint in _SIMPLE_CHECKS:
+            self.check(hint, source, indent)
+            if hint is str:
+                self.check_limit(source, limit, "characters", indent)
+            self.emit(indent, f"{target} = float({source})" if hint is float else f"{target} = {source}")
+        else:
+            raise TypeError(f"No request parser for {hint!r}")
+
+    def convert_union(self, args, source: str, target: str, indent: int):
+        """Tries each type of the union in order; the last one's error is reported."""
+        if type(None) in args:
+            self.emit(indent, f"if {source} is None:")
+            self.emit(indent + 1, f"{target} = None")
+            self.emit(indent, "else:")
+            args = tuple(arg for arg in args if arg is not type(None))
+            indent += 1
+        for position, arg in enumerate(args):
+            if position == len(args) - 1:
+                self.convert(arg, source, target, indent + position)
+            else:
+                self.emit(indent + position, "try:")
+                self.convert(arg, source, target, indent + position + 1)
+                self.emit(indent + position, "except ValidationError:")
+
+    def check(self, kind: type, source: str, indent: int):
+        condition, message = _SIMPLE_CHECKS[kind]
+        self.emit(indent, f"if not ({condition.format(v=source)}):")
+        self.emit(indent + 1, f"raise ValidationError({message!r})")
+
+    def check_limit(self, source: str, limit: str, noun: str, indent: int):
+        if limit is None:
+            return
+        self.emit(indent, f"if len({source}) > limits.{limit}:")
+        self.emit(indent + 1, f"raise ValidationError(f'more than {{limits.{limit}}} {noun}')")
+
+@functools.lru_cache(maxsize=None)
+def parser_for(cls) -> Callable[[Any, RequestLimits], Any]:
+    """Generates, once per dataclass, a function that turns a decoded JSON object into an instance."""
+    hints = typing.get_type_hints(cls)
+    namespace: Dict[str, Any] = {"ValidationError": ValidationError, "MissingField": MissingField,
+                                 "_cls": cls, "_datetime": datetime.datetime}
+    compiler = _Compiler(namespace)
+    compiler.emit(0, "def parse(data, limits):")
+    compiler.emit(1, "if type(data) is not dict:")
+    compiler.emit(2, "raise ValidationError('expected an object')")
+    arguments = []
+    for field in dataclasses.fields(cls):
+        if not field.init:
+            continue
+        name = field.name
+        compiler.emit(1, f"if {name!r} in data:")
+        compiler.emit(2, "try:")
+        compiler.convert(hints[name], f"data[{name!r}]", f"field_{name}", 3, field.metadata.get("limit"))
+        compiler.emit(2, "except ValidationError as error:")
+        compiler.emit(3, f"raise error.at({name!r})")
+        compiler.emit(1, "else:")
+        if field.default is not dataclasses.MISSING:
+            namespace[f"_default_{name}"] = field.default
+            compiler.emit(2, f"field_{name} = _default_{name}")
+        elif field.default_factory is not dataclasses.MISSING:
+            namespace[f"_factory_{name}"] = field.default_factory
+            compiler.emit(2, f"field_{name} = _factory_{name}()")
+        else:
+            compiler.emit(2, f"raise MissingField('is required', [{name!r}])")
+        arguments.append(f"{name}=field_{name}")
+    compiler.emit(1, f"return _cls({', '.join(arguments)})")
+    exec("\n".join(compiler.lines), namespace)
+    return namespace["parse"]
+
+def parse(cls, data: Any, limits: RequestLimits = RequestLimits()):
+    """`data`, already decoded from JSON, as an instance of the dataclass `cls`; raises ValidationError."""
+    return parser_for(cls)(data, limits)
+
+def parse_json(cls, body: bytes, limits: RequestLimits = RequestLimits()):
+    """Like parse, from the raw request body; the length is checked before anything is decoded."""
+    if len(body) > limits.max_body_bytes:
+        raise PayloadTooLarge(f"request body is larger than {limits.max_body_bytes} bytes")
+    if not body:
+        raise ValidationError("expected a JSON body")
+    with stage_timer("parse"):
+        try:
+            data = _loads(body)
+        except _DECODE_ERRORS:
+            raise ValidationError("invalid JSON") from None
+        return parse(cls, data, limits)
+
+def parse_flask_request(cls, limits: RequestLimits):
+    """parse_json on the current Flask request, reading at most one byte past the limit."""
+    from flask import request
+    if request.content_length is not None and request.content_length > limits.max_body_bytes:
+        raise PayloadTooLarge(f"request body is larger than {limits.max_body_bytes} bytes")
+    return parse_json(cls, request.stream.read(limits.max_body_bytes + 1), limits)
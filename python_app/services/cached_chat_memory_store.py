@@ -0,0 +1,235 @@
+import collections
+import dataclasses
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from python_app.metrics import timed
+from .chat_memory_store import PythonChatMemoryStore
+
+logger = logging.getLogger(__name__)
+
+@dataclasses.dataclass
+class _PendingWrite:
+    """Coalesced writes for one conversation since the last flush.
+
+    `replacement` set means "the conversation is exactly this list" (a delete is an empty
+    replacement); `appended` holds messages to add after whatever is stored.
+    """
+    replacement: Optional[List[dict]] = None
+    appended: List[dict] = dataclasses.field(default_factory=list)
+
+    def merged_with(self, newer: "_PendingWrite") -> "_PendingWrite":
+        if newer.replacement is not None:
+            return newer
+        if self.replacement is not None:
+            return _PendingWrite(replacement=self.replacement + newer.appended)
+        return _PendingWrite(appended=self.appended + newer.appended)
+
+    def apply_to(self, messages: List[dict]) -> List[dict]:
+        base = list(self.replacement) if self.replacement is not None else list(messages)
+        return base + self.appended
+
+@dataclasses.dataclass
+class CachedChatMemoryStoreStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    writes: int = 0
+    flushes: int = 0
+    flushed_conversations: int = 0
+    flush_failures: int = 0
+    dropped_conversations: int = 0
+
+class CachedChatMemoryStore:
+    """Write-behind, LRU-cached front for PythonChatMemoryStore.
+
+    Hot conversations are served from memory. Writes update the cached copy immediately and are
+    queued per memory_id, where later writes to the same conversation coalesce with earlier ones.
+    A background thread flushes the queue in a single transaction every `flush_interval_seconds`,
+    or sooner once `flush_threshold` conversations are waiting. Call `close()` on shutdown so
+    queued writes reach the database.
+
+    If that transaction fails, each conversation is written in a transaction of its own, so one
+    conversation the database rejects does not hold back the others. Only the failed ones are
+    queued again, and one that still fails after `max_flush_attempts` flushes in which others got
+    through is dropped with an error log (and evicted, so the cache doesn't keep what was lost).
+
+    `on_delete` is called with the memory_id of every deleted conversation, so state derived from
+    it elsewhere (like a ContextWindowManager's summary) can be dropped along with it.
+    """
+    def __init__(self, session_factory: Callable[[], Session], capacity: int = 256,
+                 flush_interval_seconds: float = 1.0, flush_threshold: int = 100, max_flush_attempts: int = 5,
+                 on_delete: Optional[Callable[[str], None]] = None):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_threshold = flush_threshold
+        self.max_flush_attempts = max_flush_attempts
+        self.on_delete = on_delete
+        self._cache = collections.OrderedDict() # memory_id -> full list of messages
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._failed_attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Held while writing to the database, and while loading a cold conversation so that
+        # a flush cannot land between reading the rows and overlaying the pending writes
+        self._flush_lock = threading.Lock()
+        self._stats = CachedChatMemoryStoreStats()
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_periodically, name="chat-memory-flusher", daemon=True)
+        self._flusher.start()
+
+    @timed("chat_memory")
+    def get_messages(self, memory_id: str, last_n: Optional[int] = None) -> List[dict]:
+        with self._lock:
+            messages = self._cache.get(memory_id)
+            if messages is not None:
+                self._cache.move_to_end(memory_id)
+                self._stats.hits += 1
+                return self._window(messages, last_n)
+            self._stats.misses += 1
+
+        with self._flush_lock:
+            with self.session_factory() as session:
+                stored = PythonChatMemoryStore(session).get_messages(memory_id)
+            with self._lock:
+                messages = self._cache.get(memory_id)
+                if messages is None:
+                    pending = self._pending.get(memory_id)
+                    messages = pending.apply_to(stored) if pending is not None else stored
+                    self._remember(memory_id, messages)
+                return self._window(messages, last_n)
+
+    def append_messages(self, memory_id: str, messages: List[dict]):
+        self._write(memory_id, _PendingWrite(appended=list(messages)))
+
+    def update_messages(self, memory_id: str, messages: List[dict]):
+        self._write(memory_id, _PendingWrite(replacement=list(messages)))
+
+    def delete_messages(self, memory_id: str):
+        self._write(memory_id, _PendingWrite(replacement=[]))
+        if self.on_delete is not None:
+            self.on_delete(memory_id)
+
+    @timed("chat_memory")
+    def _write(self, memory_id: str, write: _PendingWrite):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CachedChatMemoryStore is closed")
+            self._stats.writes += 1
+            previous = self._pending.get(memory_id)
+            self._pending[memory_id] = previous.merged_with(write) if previous is not None else write
+            cached = self._cache.get(memory_id)
+            if cached is not None:
+                self._cache[memory_id] = write.apply_to(cached)
+                self._cache.move_to_end(memory_id)
+            elif write.replacement is not None:
+                # The full conversation is known without a read, so start caching it
+                self._remember(memory_id, write.apply_to([]))
+            if len(self._pending) >= self.flush_threshold:
+                self._wake.set()
+
+    def _remember(self, memory_id: str, messages: List[dict]):
+        self._cache[memory_id] = messages
+        self._cache.move_to_end(memory_id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+            self._stats.evictions += 1
+
+    @staticmethod
+    def _window(messages: List[dict], last_n: Optional[int]) -> List[dict]:
+        return list(messages if last_n is None else messages[-last_n:] if last_n > 0 else [])
+
+    @timed("chat_memory_flush")
+    def flush(self) -> int:
+        """Writes every queued change; returns the number of conversations written.
+
+        Raises only when nothing could be written, which points at the database rather than at
+        any one conversation; the whole batch is then queued again.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            failed: Dict[str, Exception] = {}
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # Find the conversations that fail on their own and let the rest through
+                for memory_id, write in batch.items():
+                    try:
+                        self._write_batch({memory_id: write})
+                    except Exception as e:
+                        failed[memory_id] = e
+            written = len(batch) - len(failed)
+            dropped = []
+            with self._lock:
+                for memory_id, error in failed.items():
+                    # Only count an attempt against a conversation when others were written in the same flush
+                    attempts = self._failed_attempts.get(memory_id, 0) + (1 if written else 0)
+                    if attempts >= self.max_flush_attempts:
+                        dropped.append((memory_id, batch[memory_id], error))
+                        self._failed_attempts.pop(memory_id, None)
+                        self._stats.dropped_conversations += 1
+                        self._cache.pop(memory_id, None)
+                        continue
+                    self._failed_attempts[memory_id] = attempts
+                    # Put it back in front of anything written meanwhile and retry on the next flush
+                    newer = self._pending.get(memory_id)
+                    self._pending[memory_id] = batch[memory_id].merged_with(newer) if newer is not None else batch[memory_id]
+                for memory_id in batch.keys() - failed.keys():
+                    self._failed_attempts.pop(memory_id, None)
+                if failed:
+                    self._stats.flush_failures += 1
+                if written:
+                    self._stats.flushes += 1
+                    self._stats.flushed_conversations += written
+            for memory_id, write, error in dropped:
+                lost = len(write.replacement if write.replacement is not None else write.appended)
+                logger.error(f"Dropping queued chat memory writes for {memory_id} ({lost} messages) "
+                             f"after {self.max_flush_attempts} failed flushes: {error}")
+            if failed and not written:
+                raise next(iter(failed.values()))
+            return written
+
+    def _write_batch(self, batch: Dict[str, _PendingWrite]):
+        with self.session_factory() as session:
+            store = PythonChatMemoryStore(session, autocommit=False)
+            for memory_id, write in batch.items():
+                if write.replacement is not None and not write.replacement:
+                    store.delete_messages(memory_id)
+                elif write.replacement is not None:
+                    store.update_messages(memory_id, write.replacement)
+                else:
+                    store.append_messages(memory_id, write.appended)
+            session.commit()
+
+    def _flush_periodically(self):
+        while True:
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Chat memory write-behind flush failed, will retry: {e}")
+
+    def close(self):
+        """Stops the background flusher and writes out everything still queued; logs what could not be."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Chat memory writes for {len(self._pending)} conversations were lost on shutdown: {e}")
+
+    def stats(self) -> CachedChatMemoryStoreStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
@@ -1,30 +1,145 @@
+import asyncio
 import json
-from typing import List
+import weakref
+from typing import List, Optional
+from sqlalchemy import String, bindparam, func, insert, select
 from sqlalchemy.orm import Session
-from ..models.chat_memory_model import ChatMemoryModel
+from ..models.chat_memory_model import ChatMemoryModel, ChatMessageModel
+
+# Databases whose legacy blob table was found empty (init_db drains it at startup); stores skip the
+# per-conversation legacy lookup for them from then on
+_legacy_drained = weakref.WeakSet()
 
 class PythonChatMemoryStore:
-    def __init__(self, session: Session):
+    """Stores conversations one row per message, keyed by (memory_id, seq).
+
+    Appending a turn inserts only the new rows and reading the recent context is a bounded
+    range scan, so per-turn cost no longer grows with conversation length. Conversations still
+    held in the legacy blob table are migrated the first time they are read or written, until
+    the table is seen empty; after that the lookup is skipped for the rest of the process.
+    """
+    def __init__(self, session: Session, autocommit: bool = True):
         self.session = session
+        # Batched writers turn this off to group several conversations into one transaction
+        self.autocommit = autocommit
+
+    def _commit(self):
+        if self.autocommit:
+            self.session.commit()
+        else:
+            self.session.flush()
 
-    def get_messages(self, memory_id: str) -> List[dict]:
-        entry = self.session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
-        if entry:
-            return json.loads(entry.json_messages)
-        return []
+    def get_messages(self, memory_id: str, last_n: Optional[int] = None) -> List[dict]:
+        """Returns the conversation in order; with `last_n`, only its most recent `last_n` messages."""
+        self._migrate_legacy(memory_id)
+        query = self.session.query(ChatMessageModel.json_message).filter(ChatMessageModel.memory_id == memory_id)
+        if last_n is None:
+            rows = query.order_by(ChatMessageModel.seq).all()
+        else:
+            rows = query.order_by(ChatMessageModel.seq.desc()).limit(last_n).all()
+            rows.reverse()
+        return [json.loads(row.json_message) for row in rows]
+
+    def count_messages(self, memory_id: str) -> int:
+        self._migrate_legacy(memory_id)
+        return self._next_seq(memory_id)
+
+    def append_messages(self, memory_id: str, messages: List[dict]):
+        self._migrate_legacy(memory_id)
+        if messages:
+            # Each row takes max(seq) + 1 inside its own INSERT, so concurrent appends cannot pick the same seq
+            table = ChatMessageModel.__table__
+            next_seq = select(func.coalesce(func.max(table.c.seq) + 1, 0)).where(
+                table.c.memory_id == bindparam("memory_id", type_=String)
+            ).scalar_subquery()
+            statement = insert(table).from_select(
+                ["memory_id", "seq", "json_message"],
+                select(bindparam("memory_id", type_=String), next_seq, bindparam("json_message", type_=String))
+            )
+            self.session.execute(statement, [
+                {"memory_id": memory_id, "json_message": json.dumps(message)} for message in messages
+            ])
+        self._commit()
 
     def update_messages(self, memory_id: str, messages: List[dict]):
-        json_messages_str = json.dumps(messages)
-        entry = self.session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
-        if entry:
-            entry.json_messages = json_messages_str
+        """Replaces the stored conversation with `messages`.
+
+        Callers usually pass the previous conversation plus the new turn; that case is detected by
+        comparing the stored messages with the start of `messages`, and only the new suffix is inserted.
+        """
+        self._migrate_legacy(memory_id)
+        stored_count = self._next_seq(memory_id)
+        if 0 < stored_count <= len(messages) and self._stored_prefix_matches(memory_id, stored_count, messages):
+            self._insert(memory_id, stored_count, messages[stored_count:])
         else:
-            new_entry = ChatMemoryModel(memory_id=memory_id, json_messages=json_messages_str)
-            self.session.add(new_entry)
-        self.session.commit()
+            self.session.query(ChatMessageModel).filter(ChatMessageModel.memory_id == memory_id).delete(synchronize_session=False)
+            self._insert(memory_id, 0, messages)
+        self._commit()
 
     def delete_messages(self, memory_id: str):
-        entry = self.session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
-        if entry:
-            self.session.delete(entry)
-            self.session.commit()
+        deleted = self.session.query(ChatMessageModel).filter(ChatMessageModel.memory_id == memory_id).delete(synchronize_session=False)
+        deleted += self.session.query(ChatMemoryModel).filter(ChatMemoryModel.memory_id == memory_id).delete(synchronize_session=False)
+        if deleted:
+            self._commit()
+
+    def _next_seq(self, memory_id: str) -> int:
+        max_seq = self.session.query(func.max(ChatMessageModel.seq)).filter(ChatMessageModel.memory_id == memory_id).scalar()
+        return 0 if max_seq is None else max_seq + 1
+
+    def _stored_prefix_matches(self, memory_id: str, stored_count: int, messages: List[dict]) -> bool:
+        # Every stored message, not just the first and last: an edit in the middle must rewrite the conversation
+        stored = self.session.query(ChatMessageModel.seq, ChatMessageModel.json_message).filter(
+            ChatMessageModel.memory_id == memory_id
+        ).order_by(ChatMessageModel.seq).all()
+        return len(stored) == stored_count and all(
+            row.seq == seq and json.loads(row.json_message) == messages[seq] for seq, row in enumerate(stored)
+        )
+
+    def _insert(self, memory_id: str, first_seq: int, messages: List[dict]):
+        if messages:
+            self.session.bulk_insert_mappings(ChatMessageModel, [
+                {"memory_id": memory_id, "seq": first_seq + offset, "json_message": json.dumps(message)}
+                for offset, message in enumerate(messages)
+            ])
+
+    def _migrate_legacy(self, memory_id: str):
+        bind = self.session.get_bind()
+        if bind in _legacy_drained:
+            return
+        if self.session.query(ChatMemoryModel.id).first() is None:
+            _legacy_drained.add(bind)
+            return
+        legacy = self.session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
+        if legacy is not None:
+            migrate_legacy_entry(self.session, legacy)
+            self._commit()
+
+def migrate_legacy_entry(session: Session, legacy: ChatMemoryModel):
+    """Moves one blob-table conversation into per-message rows (without committing)."""
+    session.query(ChatMessageModel).filter(ChatMessageModel.memory_id == legacy.memory_id).delete(synchronize_session=False)
+    session.bulk_insert_mappings(ChatMessageModel, [
+        {"memory_id": legacy.memory_id, "seq": seq, "json_message": json.dumps(message)}
+        for seq, message in enumerate(json.loads(legacy.json_messages))
+    ])
+    session.delete(legacy)
+
+class AsyncPythonChatMemoryStore:
+    """Async counterpart of PythonChatMemoryStore.
+
+    The SQLite driver blocks, so every call is handed to the default executor and the
+    event loop stays free for other requests while the query runs.
+    """
+    def __init__(self, store: PythonChatMemoryStore):
+        self.store = store
+
+    async def get_messages(self, memory_id: str, last_n: Optional[int] = None) -> List[dict]:
+        return await asyncio.to_thread(self.store.get_messages, memory_id, last_n)
+
+    async def append_messages(self, memory_id: str, messages: List[dict]):
+        await asyncio.to_thread(self.store.append_messages, memory_id, messages)
+
+    async def update_messages(self, memory_id: str, messages: List[dict]):
+        await asyncio.to_thread(self.store.update_messages, memory_id, messages)
+
+    async def delete_messages(self, memory_id: str):
+        await asyncio.to_thread(self.store.delete_messages, memory_id)
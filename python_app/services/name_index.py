@@ -0,0 +1,190 @@
+import dataclasses
+import logging
+import math
+import re
+import threading
+import unicodedata
+import uuid
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+def normalize_name(name: str) -> str:
+    """Lowercase, accent-free, punctuation-free and singular: "Roma Tomatoes!" -> "roma tomato"."""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(_singular(word) for word in _WORD_PATTERN.findall(ascii_name))
+
+def _singular(word: str) -> str:
+    # Deliberately naive English plurals; good enough for grocery names, and stable across versions
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def name_trigrams(normalized: str) -> Set[str]:
+    """Character trigrams per word, padded like pg_trgm so word starts weigh more than word ends."""
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+@dataclasses.dataclass
+class NameIndexRow:
+    entry_id: uuid.UUID
+    name: str
+    normalized_name: str
+
+@dataclasses.dataclass
+class NameMatch:
+    entry_id: uuid.UUID
+    name: str
+    score: float # shared trigrams over the union of both names' trigrams, 1.0 for equal normalized names
+
+class TrigramNameIndex:
+    """In-memory inverted index from character trigram to the pantry entries whose name contains it.
+
+    Each entry occupies a slot; postings are int32 arrays of slots that numpy reads without
+    copying, so scoring a query is one bincount over the postings of its ~10 trigrams rather than
+    a pass over every name. Replacing or removing an entry leaves a dead slot behind; the index
+    compacts itself once more than half of the slots are dead.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, array] = {}
+        self._trigram_counts = array("i")
+        self._alive = bytearray()
+        self._rows: List[Optional[NameIndexRow]] = []
+        self._slot_by_entry: Dict[uuid.UUID, int] = {}
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._slot_by_entry)
+
+    def add(self, rows: Iterable[NameIndexRow]):
+        """Adds or replaces entries, keyed by entry_id."""
+        with self._lock:
+            for row in rows:
+                slot = self._slot_by_entry.get(row.entry_id)
+                if slot is not None:
+                    if self._rows[slot].normalized_name == row.normalized_name:
+                        self._rows[slot] = row
+                        continue
+                    self._kill(slot)
+                self._insert(row)
+            self._maybe_compact()
+
+    def remove(self, entry_ids: Iterable[uuid.UUID]):
+        with self._lock:
+            for entry_id in entry_ids:
+                slot = self._slot_by_entry.get(entry_id)
+                if slot is not None:
+                    self._kill(slot)
+            self._maybe_compact()
+
+    def _insert(self, row: NameIndexRow):
+        slot = len(self._rows)
+        trigrams = name_trigrams(row.normalized_name)
+        for trigram in trigrams:
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = self._postings[trigram] = array("i")
+            postings.append(slot)
+        self._trigram_counts.append(len(trigrams))
+        self._alive.append(1)
+        self._rows.append(row)
+        self._slot_by_entry[row.entry_id] = slot
+
+    def _kill(self, slot: int):
+        del self._slot_by_entry[self._rows[slot].entry_id]
+        self._alive[slot] = 0
+        self._rows[slot] = None
+        self._dead += 1
+
+    def _maybe_compact(self):
+        if self._dead * 2 <= len(self._rows):
+            return
+        live = [row for row in self._rows if row is not None]
+        self._postings, self._trigram_counts, self._alive = {}, array("i"), bytearray()
+        self._rows, self._slot_by_entry, self._dead = [], {}, 0
+        for row in live:
+            self._insert(row)
+
+    def lookup_batch(self, names: List[str], k: int = 5, min_score: float = 0.0) -> List[List[NameMatch]]:
+        """Top-k most similar entries for each name, best first."""
+        results = []
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in names]
+            trigram_counts = np.frombuffer(self._trigram_counts, dtype=np.int32)
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool) if self._dead else None
+            for name in names:
+                results.append(self._lookup(normalize_name(name), k, min_score, trigram_counts, alive))
+        return results
+
+    def _lookup(self, normalized: str, k: int, min_score: float, trigram_counts: np.ndarray,
+                alive: Optional[np.ndarray]) -> List[NameMatch]:
+        trigrams = name_trigrams(normalized)
+        postings = [np.frombuffer(self._postings[trigram], dtype=np.int32) for trigram in trigrams if trigram in self._postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._rows))
+        # A score can't exceed shared / len(trigrams), so weak overlaps are dropped before scoring
+        keep = shared >= max(1, math.ceil(min_score * len(trigrams) - 1e-9))
+        candidates = np.flatnonzero(keep if alive is None else keep & alive)
+        if len(candidates) == 0:
+            return []
+        shared = shared[candidates]
+        scores = shared / (len(trigrams) + trigram_counts[candidates] - shared)
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        matches = []
+        for index in np.argsort(-scores, kind="stable"):
+            row = self._rows[candidates[index]]
+            # Trigram sets of different names can coincide ("aab"/"aba"); only equal names score a full 1.0
+            score = 1.0 if row.normalized_name == normalized else min(float(scores[index]), 0.99)
+            if score >= min_score:
+                matches.append(NameMatch(entry_id=row.entry_id, name=row.name, score=score))
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return matches
+
+class PantryNameIndex:
+    """Process-wide fuzzy name index kept in step with a DurablePantry through its version counter.
+
+    `sync` only fetches the index rows written since the last version it saw, so keeping up with
+    other workers costs one cheap query when nothing changed.
+    """
+    def __init__(self, auto_merge_threshold: float = 0.6):
+        # Names at least this similar to an existing entry are treated as that entry
+        self.auto_merge_threshold = auto_merge_threshold
+        self.index = TrigramNameIndex()
+        self.version: Optional[int] = None
+        self._sync_lock = threading.Lock()
+
+    def sync(self, durable_pantry):
+        version = durable_pantry.current_version()
+        if version is not None and version == self.version:
+            return
+        with self._sync_lock:
+            if version is not None and version == self.version:
+                return
+            rows = durable_pantry.find_name_index_rows(since_version=self.version)
+            self.index.add(rows)
+            self.version = version
+            if rows:
+                logger.info(f"Name index synced to version {version}: {len(rows)} names updated, {len(self.index)} total")
+
+    def lookup_batch(self, names: List[str], k: int = 5, min_score: float = 0.0) -> List[List[NameMatch]]:
+        return self.index.lookup_batch(names, k, min_score)
+
+    def resolve(self, names: List[str]) -> List[Optional[NameMatch]]:
+        """The best match for each name if it clears the auto-merge threshold, else None."""
+        return [matches[0] if matches else None for matches in self.lookup_batch(names, k=1, min_score=self.auto_merge_threshold)]
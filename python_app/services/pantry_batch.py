@@ -0,0 +1,117 @@
+"""Columnar container for many pantry entries at once.
+
+A million PantryEntry objects cost a Python object, a UUID object, a float and two strings each.
+PantryBatch keeps the same data in a handful of arrays: ids as one block of 16-byte values,
+amounts and versions as numpy arrays, names as one UTF-8 buffer with offsets, and units
+dictionary-encoded since a pantry only uses a few of them. Entries are only materialized on
+demand.
+"""
+import dataclasses
+import os
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+from .pantry_service import PantryEntry
+
+# Versions are stored as int64; this marks entries that were never stored
+NO_VERSION = -1
+
+def new_ids(count: int) -> np.ndarray:
+    """`count` random version-4 UUIDs as 16-byte values, generated in one call instead of one uuid4() each."""
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40 # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80 # RFC 4122 variant
+    return raw.reshape(-1).view("V16")
+
+@dataclasses.dataclass(eq=False)
+class PantryBatch:
+    ids: np.ndarray # dtype V16, UUID bytes (S16 would strip trailing zero bytes)
+    name_buffer: bytes # every name, UTF-8, back to back
+    name_offsets: np.ndarray # int64, len + 1 boundaries into name_buffer
+    amounts: np.ndarray # float64
+    unit_codes: np.ndarray # int32 indexes into `units`
+    units: List[str]
+    versions: np.ndarray # int64, NO_VERSION for entries that were never stored
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @classmethod
+    def from_columns(cls, names: Sequence[str], amounts: Sequence[float], units: Sequence[str],
+                     ids: Optional[np.ndarray] = None, versions: Optional[Sequence[Optional[int]]] = None) -> "PantryBatch":
+        """Builds a batch from parallel columns; missing ids are generated, missing versions mean "new"."""
+        encoded = [name.encode("utf-8") for name in names]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        vocabulary: Dict[str, int] = {}
+        unit_codes = np.fromiter((vocabulary.setdefault(unit, len(vocabulary)) for unit in units), dtype=np.int32, count=len(encoded))
+        if versions is None:
+            version_array = np.full(len(encoded), NO_VERSION, dtype=np.int64)
+        else:
+            version_array = np.fromiter((NO_VERSION if version is None else version for version in versions), dtype=np.int64, count=len(encoded))
+        return cls(
+            ids=new_ids(len(encoded)) if ids is None else np.asarray(ids, dtype="V16"),
+            name_buffer=b"".join(encoded),
+            name_offsets=offsets,
+            amounts=np.asarray(amounts, dtype=np.float64),
+            unit_codes=unit_codes,
+            units=list(vocabulary),
+            versions=version_array,
+        )
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[PantryEntry]) -> "PantryBatch":
+        entries = list(entries)
+        return cls.from_columns(
+            [entry.name for entry in entries], [entry.amount for entry in entries], [entry.unit for entry in entries],
+            ids=ids_from_values([entry.id for entry in entries]), versions=[entry.version for entry in entries]
+        )
+
+    def name(self, index: int) -> str:
+        return self.name_buffer[self.name_offsets[index]:self.name_offsets[index + 1]].decode("utf-8")
+
+    def names(self) -> List[str]:
+        buffer, offsets = self.name_buffer, self.name_offsets.tolist()
+        return [buffer[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def unit_column(self) -> List[str]:
+        return [self.units[code] for code in self.unit_codes.tolist()]
+
+    def entry(self, index: int) -> PantryEntry:
+        version = int(self.versions[index])
+        return PantryEntry(id=uuid.UUID(bytes=bytes(self.ids[index])), name=self.name(index), amount=float(self.amounts[index]),
+                           unit=self.units[self.unit_codes[index]], version=None if version == NO_VERSION else version)
+
+    def entries(self) -> Iterator[PantryEntry]:
+        """Materializes the entries one at a time."""
+        names, units = self.names(), self.units
+        for entry_id, name, amount, code, version in zip(self.ids.tolist(), names, self.amounts.tolist(),
+                                                         self.unit_codes.tolist(), self.versions.tolist()):
+            yield PantryEntry(id=uuid.UUID(bytes=entry_id), name=name, amount=amount, unit=units[code],
+                              version=None if version == NO_VERSION else version)
+
+    def take(self, indexes: np.ndarray) -> "PantryBatch":
+        """The entries at `indexes` (or where a boolean mask is set), as a new batch."""
+        indexes = np.flatnonzero(indexes) if indexes.dtype == bool else np.asarray(indexes, dtype=np.int64)
+        names = self.names()
+        return PantryBatch.from_columns(
+            [names[i] for i in indexes.tolist()], self.amounts[indexes], [self.units[c] for c in self.unit_codes[indexes].tolist()],
+            ids=self.ids[indexes], versions=[None if v == NO_VERSION else v for v in self.versions[indexes].tolist()]
+        )
+
+    def totals_by_unit(self) -> Dict[str, float]:
+        sums = np.bincount(self.unit_codes, weights=self.amounts, minlength=len(self.units))
+        return dict(zip(self.units, sums.tolist()))
+
+    @property
+    def nbytes(self) -> int:
+        return (self.ids.nbytes + len(self.name_buffer) + self.name_offsets.nbytes + self.amounts.nbytes
+                + self.unit_codes.nbytes + self.versions.nbytes + sum(len(unit) for unit in self.units))
+
+def ids_from_values(values: Sequence) -> np.ndarray:
+    """UUIDs as a V16 array, from uuid.UUID objects or the 32-digit hex strings SQLite stores them as."""
+    if not values:
+        return np.empty(0, dtype="V16")
+    if isinstance(values[0], str):
+        return np.frombuffer(bytes.fromhex("".join(values)), dtype="V16").copy()
+    return np.frombuffer(b"".join(value.bytes for value in values), dtype="V16").copy()
@@ -1,32 +1,132 @@
 import abc
+import asyncio
 import dataclasses
+import enum
 import logging
+import math
+import random
+import threading
+import time
 import uuid
-from typing import List
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from .name_index import NameIndexRow, PantryNameIndex, normalize_name
+from .units import UnitConverter
+
+if TYPE_CHECKING:
+    from .pantry_batch import PantryBatch
 
 logger = logging.getLogger(__name__)
 
-@dataclasses.dataclass
+# Slotted: bulk operations hold many of these, and slots save the per-instance __dict__
+@dataclasses.dataclass(frozen=True, slots=True)
 class LineItem:
     name: str
     amount: float
     unit: str
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class PantryEntry:
-    id: uuid.UUID = dataclasses.field(default_factory=uuid.uuid4)
+    # kw_only keeps `id` first in the field order while letting the required fields follow it
+    id: uuid.UUID = dataclasses.field(default_factory=uuid.uuid4, kw_only=True)
     name: str
     amount: float
     unit: str
+    # Row version this entry was read at; None for entries that were never stored. Not part of equality.
+    version: Optional[int] = dataclasses.field(default=None, kw_only=True, compare=False)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True, slots=True)
 class StorageRequest:
     items: List[LineItem]
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True, slots=True)
 class UseFoodRequest:
     items: List[LineItem]
 
+class UseStatus(enum.Enum):
+    USED = "used"
+    NOT_FOUND = "not_found"
+    UNIT_MISMATCH = "unit_mismatch"
+    INSUFFICIENT = "insufficient"
+    ROLLED_BACK = "rolled_back" # would have been used, but another item in the same all-or-nothing call was refused
+
+@dataclasses.dataclass
+class UseOutcome:
+    item: LineItem
+    status: UseStatus
+    # The entry after the decrement when USED, its current state when refused, None when not found
+    entry: Optional[PantryEntry] = None
+
+    @property
+    def refused(self) -> bool:
+        return self.status in (UseStatus.UNIT_MISMATCH, UseStatus.INSUFFICIENT)
+
+class LedgerKind(enum.Enum):
+    SET = "set" # a save; the delta is the change from the amount stored before
+    USE = "use"
+
+@dataclasses.dataclass
+class LedgerEvent:
+    entry_id: uuid.UUID
+    name: str
+    unit: str
+    kind: LedgerKind
+    delta: float
+    quantity_after: float
+    occurred_at: datetime
+
+@dataclasses.dataclass
+class UsageTotal:
+    name: str
+    unit: str
+    added: float = 0.0 # increases from saves
+    used: float = 0.0
+    events: int = 0
+
+class ConcurrentModificationError(Exception):
+    """Raised by DurablePantry.save_all when entries changed since they were read; nothing was saved."""
+    def __init__(self, entries: List[PantryEntry]):
+        self.entries = entries
+        super().__init__(f"Pantry entries changed concurrently: {', '.join(entry.name for entry in entries)}")
+
+class LedgerUnavailable(Exception):
+    """Raised for change-history queries (usage, history) on a store that keeps no ledger."""
+
+@dataclasses.dataclass
+class PantryContentionStats:
+    writes: int = 0
+    conflicts: int = 0
+    retries: int = 0
+    exhausted: int = 0 # writes that still conflicted after the last attempt
+    conflicts_by_name: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def hottest(self, limit: int = 10) -> List[Tuple[str, int]]:
+        return sorted(self.conflicts_by_name.items(), key=lambda pair: pair[1], reverse=True)[:limit]
+
+class PantryContention:
+    """Conflict counters shared by every PantryService in the process, to see which items are hot."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = PantryContentionStats()
+
+    def record_write(self):
+        with self._lock:
+            self._stats.writes += 1
+
+    def record_conflict(self, names: List[str], retrying: bool):
+        with self._lock:
+            self._stats.conflicts += 1
+            if retrying:
+                self._stats.retries += 1
+            else:
+                self._stats.exhausted += 1
+            for name in names:
+                self._stats.conflicts_by_name[name] = self._stats.conflicts_by_name.get(name, 0) + 1
+
+    def stats(self) -> PantryContentionStats:
+        with self._lock:
+            return dataclasses.replace(self._stats, conflicts_by_name=dict(self._stats.conflicts_by_name))
+
 class DurablePantry(abc.ABC):
     @abc.abstractmethod
     def find_all(self) -> List[PantryEntry]:
@@ -38,70 +138,209 @@ class DurablePantry(abc.ABC):
 
     @abc.abstractmethod
     def save_all(self, entries: List[PantryEntry]) -> List[PantryEntry]:
+        """Stores the entries and returns them with their new versions.
+
+        Entries carrying a version are only written if the stored row still has that version;
+        otherwise nothing is saved and ConcurrentModificationError is raised.
+        """
         pass
 
+    @abc.abstractmethod
+    def use_all(self, items: List[LineItem], all_or_nothing: bool = True) -> List[UseOutcome]:
+        """Atomically takes each item's amount out of the entry with the same name and unit.
+
+        An item is only used if enough is in stock at that moment, so concurrent callers can never
+        oversell. Returns one outcome per item, in order. With `all_or_nothing`, a single refused
+        item rolls back the whole call.
+        """
+        pass
+
+    def current_version(self) -> Optional[int]:
+        """Counter that changes with every committed write, or None if the store doesn't keep one."""
+        return None
+
+    def find_name_index_rows(self, since_version: Optional[int] = None) -> List[NameIndexRow]:
+        """Normalized names written after `since_version`, or all of them for None.
+
+        Stores without a persistent name index derive every row from find_all.
+        """
+        return [NameIndexRow(entry.id, entry.name, normalize_name(entry.name)) for entry in self.find_all()]
+
+    def find_all_batch(self) -> "PantryBatch":
+        """Every entry in columnar form. Stores that can fill the columns straight from their rows override this."""
+        from .pantry_batch import PantryBatch # imported here, pantry_batch imports this module
+        return PantryBatch.from_entries(self.find_all())
+
+    def save_batch(self, batch: "PantryBatch") -> "PantryBatch":
+        """save_all for a batch, with the same version checks."""
+        from .pantry_batch import PantryBatch
+        return PantryBatch.from_entries(self.save_all(list(batch.entries())))
+
+    def usage(self, start: datetime, end: datetime) -> List[UsageTotal]:
+        """Totals per name and unit of the changes made in [start, end)."""
+        raise LedgerUnavailable(f"{type(self).__name__} keeps no change history")
+
+    def history(self, name: str, start: datetime, end: datetime) -> List[LedgerEvent]:
+        """Changes to the entries called `name` in [start, end), oldest first."""
+        raise LedgerUnavailable(f"{type(self).__name__} keeps no change history")
+
 class PantryService:
-    def __init__(self, durable_pantry: DurablePantry):
+    def __init__(self, durable_pantry: DurablePantry, contention: Optional[PantryContention] = None,
+                 max_attempts: int = 5, backoff_seconds: float = 0.01, max_backoff_seconds: float = 0.2,
+                 name_index: Optional[PantryNameIndex] = None, unit_converter: Optional[UnitConverter] = None):
         self.durable_pantry = durable_pantry
+        # Maps near-miss names from the model ("Roma Tomatoes") onto existing entries ("tomato")
+        self.name_index = name_index
+        # Brings amounts in other units ("1 kg" of an entry kept in g) into the unit the entry is stored in
+        self.unit_converter = unit_converter or UnitConverter()
+        self.contention = contention or PantryContention()
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
 
     def get_food(self) -> List[PantryEntry]:
         logger.info("Finding all pantry entries")
         return self.durable_pantry.find_all()
 
+    def get_food_batch(self) -> "PantryBatch":
+        logger.info("Finding all pantry entries as a batch")
+        return self.durable_pantry.find_all_batch()
+
+    def get_usage(self, start: datetime, end: datetime) -> List[UsageTotal]:
+        logger.info(f"Summarizing pantry usage from {start} to {end}")
+        return self.durable_pantry.usage(start, end)
+
+    def get_history(self, name: str, start: datetime, end: datetime) -> List[LedgerEvent]:
+        return self.durable_pantry.history(name, start, end)
+
     def save_food(self, request: StorageRequest) -> List[PantryEntry]:
         logger.info(f"Saving food items: {request.items}")
-        
+
+        # Another writer changing the same entries between our read and write makes save_all refuse;
+        # re-reading and re-applying the request is then safe, so retry a few times with backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                saved_entries = self._save_food_once(request)
+            except ConcurrentModificationError as e:
+                retrying = attempt < self.max_attempts
+                self.contention.record_conflict([entry.name for entry in e.entries], retrying)
+                if not retrying:
+                    logger.error(f"Giving up saving food after {attempt} conflicting attempts: {e}")
+                    raise
+                logger.warning(f"Conflict saving food (attempt {attempt}), retrying: {e}")
+                time.sleep(self._backoff(attempt))
+                continue
+            self.contention.record_write()
+            logger.info(f"Saved entries: {saved_entries}")
+            return saved_entries
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential with jitter, so colliding writers don't retry in lockstep
+        return min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def _resolve_names(self, items: List[LineItem], exclusive: bool = False) -> List[LineItem]:
+        """Renames items onto the existing entries their names fuzzily match.
+
+        With `exclusive`, each entry takes at most one item of the request: a match onto a name that
+        another item already has, or that an earlier item matched, is refused and the item keeps its
+        own name. Saves set amounts, so two items on one entry would silently drop all but the last.
+        """
+        if self.name_index is None or not items:
+            return items
+        self.name_index.sync(self.durable_pantry)
+        claimed = {item.name for item in items} if exclusive else set()
+        resolved = []
+        for item, match in zip(items, self.name_index.resolve([item.name for item in items])):
+            if match is not None and match.name != item.name:
+                if match.name in claimed:
+                    logger.info(f"Not merging {item.name!r} into pantry entry {match.name!r}, another item in the request has it")
+                else:
+                    logger.info(f"Matched {item.name!r} to pantry entry {match.name!r} (score {match.score:.2f})")
+                    item = dataclasses.replace(item, name=match.name)
+                    if exclusive:
+                        claimed.add(match.name)
+            resolved.append(item)
+        return resolved
+
+    def _to_stored_units(self, items: List[LineItem], stored_units: Dict[int, str]) -> List[LineItem]:
+        """Converts items[i] into stored_units[i] in one batch; raises the usual ValueError for units that don't convert."""
+        if not stored_units:
+            return items
+        positions = list(stored_units)
+        converted = self.unit_converter.convert_batch(
+            [items[i].amount for i in positions], [items[i].unit for i in positions],
+            [stored_units[i] for i in positions], [items[i].name for i in positions]
+        )
+        items = list(items)
+        for i, amount in zip(positions, converted.tolist()):
+            item = items[i]
+            if math.isnan(amount):
+                logger.error(f"Unit mismatch for {item.name}: existing {stored_units[i]}, requested {item.unit}")
+                raise ValueError(f"Unit mismatch for {item.name}")
+            logger.info(f"Converted {item.amount} {item.unit} of {item.name} to {amount} {stored_units[i]}")
+            items[i] = dataclasses.replace(item, amount=amount, unit=stored_units[i])
+        return items
+
+    def _save_food_once(self, request: StorageRequest) -> List[PantryEntry]:
+        request = StorageRequest(items=self._resolve_names(request.items, exclusive=True))
         names_to_find = [item.name for item in request.items]
         existing_entries = self.durable_pantry.find_all_where_names_exist(names_to_find)
         
         existing_map = {entry.name: entry for entry in existing_entries}
+        items = self._to_stored_units(request.items, {
+            i: existing_map[item.name].unit for i, item in enumerate(request.items)
+            if item.name in existing_map and existing_map[item.name].unit != item.unit
+        })
         
         updated_entries = []
         new_entries = []
 
-        for item in request.items:
+        for item in items:
             if item.name in existing_map:
                 entry = existing_map[item.name]
-                if entry.unit != item.unit:
-                    logger.error(f"Unit mismatch for {item.name}: existing {entry.unit}, new {item.unit}")
-                    raise ValueError(f"Unit mismatch for {item.name}")
                 entry.amount = item.amount # Changed from += to =
                 updated_entries.append(entry)
             else:
                 new_entries.append(PantryEntry(name=item.name, amount=item.amount, unit=item.unit))
         
-        saved_entries = self.durable_pantry.save_all(updated_entries + new_entries)
-        logger.info(f"Saved entries: {saved_entries}")
-        return saved_entries
+        return self.durable_pantry.save_all(updated_entries + new_entries)
 
     def use_food(self, request: UseFoodRequest) -> List[PantryEntry]:
         logger.info(f"Using food items: {request.items}")
 
-        names_to_find = [item.name for item in request.items]
-        existing_entries = self.durable_pantry.find_all_where_names_exist(names_to_find)
-        
-        existing_map = {entry.name: entry for entry in existing_entries}
-        
-        entries_to_save = []
+        # Check and decrement happen in the database, so concurrent requests can't oversell an item
+        items = self._resolve_names(request.items)
+        outcomes = self.durable_pantry.use_all(items)
+        mismatched = {i: outcome.entry.unit for i, outcome in enumerate(outcomes) if outcome.status is UseStatus.UNIT_MISMATCH}
+        if mismatched:
+            # The refusal rolled everything back and told us the stored units; the retry re-checks them atomically
+            outcomes = self.durable_pantry.use_all(self._to_stored_units(items, mismatched))
 
-        for item in request.items:
-            if item.name not in existing_map:
+        for outcome in outcomes:
+            item = outcome.item
+            if outcome.status is UseStatus.NOT_FOUND:
                 logger.error(f"Item not found in pantry: {item.name}")
-                # Removed: raise ValueError(f"Item not found: {item.name}")
-                continue # Skip to the next item
-
-            entry = existing_map[item.name]
-            if entry.unit != item.unit:
-                logger.error(f"Unit mismatch for {item.name}: existing {entry.unit}, requested {item.unit}")
+            elif outcome.status is UseStatus.UNIT_MISMATCH:
+                logger.error(f"Unit mismatch for {item.name}: existing {outcome.entry.unit}, requested {item.unit}")
                 raise ValueError(f"Unit mismatch for {item.name}")
-            
-            if entry.amount < item.amount:
-                logger.error(f"Not enough {item.name} in pantry: requested {item.amount}, available {entry.amount}")
+            elif outcome.status is UseStatus.INSUFFICIENT:
+                logger.error(f"Not enough {item.name} in pantry: requested {item.amount}, available {outcome.entry.amount}")
                 raise ValueError(f"Not enough {item.name}")
 
-            entry.amount -= item.amount
-            entries_to_save.append(entry)
-            
-        saved_entries = self.durable_pantry.save_all(entries_to_save)
-        logger.info(f"Updated entries after use: {saved_entries}")
-        return saved_entries
+        used_entries = [outcome.entry for outcome in outcomes if outcome.status is UseStatus.USED]
+        logger.info(f"Updated entries after use: {used_entries}")
+        return used_entries
+
+class AsyncPantryService:
+    """Async counterpart of PantryService; the blocking DurablePantry calls run in the default executor."""
+    def __init__(self, pantry_service: PantryService):
+        self.pantry_service = pantry_service
+
+    async def get_food(self) -> List[PantryEntry]:
+        return await asyncio.to_thread(self.pantry_service.get_food)
+
+    async def save_food(self, request: StorageRequest) -> List[PantryEntry]:
+        return await asyncio.to_thread(self.pantry_service.save_food, request)
+
+    async def use_food(self, request: UseFoodRequest) -> List[PantryEntry]:
+        return await asyncio.to_thread(self.pantry_service.use_food, request)
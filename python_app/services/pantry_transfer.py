@@ -0,0 +1,127 @@
+"""Streaming NDJSON/CSV import and export of pantry data.
+
+Everything here works on iterators, so a file of any size is held in memory one chunk at a time:
+imports parse rows lazily and save them `chunk_size` at a time, exports serialize entries as the
+database cursor yields them.
+"""
+import csv
+import dataclasses
+import io
+import json
+import logging
+import math
+from typing import Iterable, Iterator, Union
+from .pantry_service import LineItem, PantryEntry, PantryService, StorageRequest
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+CSV_FIELDS = ("name", "amount", "unit")
+
+class PantryImportError(ValueError):
+    def __init__(self, row_number: int, message: str):
+        self.row_number = row_number
+        super().__init__(f"Row {row_number}: {message}")
+
+@dataclasses.dataclass
+class ImportProgress:
+    rows_read: int = 0
+    rows_saved: int = 0
+    chunks: int = 0
+
+def _text_lines(lines: Iterable[Union[str, bytes]]) -> Iterator[str]:
+    for line in lines:
+        yield line.decode("utf-8") if isinstance(line, bytes) else line
+
+def validate_line_item(record, row_number: int) -> LineItem:
+    if not isinstance(record, dict):
+        raise PantryImportError(row_number, "expected an object with name, amount and unit")
+    name, amount, unit = record.get("name"), record.get("amount"), record.get("unit")
+    if not isinstance(name, str) or not name.strip():
+        raise PantryImportError(row_number, "name must be a non-empty string")
+    if not isinstance(unit, str) or not unit.strip():
+        raise PantryImportError(row_number, "unit must be a non-empty string")
+    if isinstance(amount, str):
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise PantryImportError(row_number, f"amount {amount!r} is not a number")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount < 0:
+        raise PantryImportError(row_number, "amount must be a non-negative number")
+    return LineItem(name=name.strip(), amount=float(amount), unit=unit.strip())
+
+def parse_ndjson(lines: Iterable[Union[str, bytes]]) -> Iterator[LineItem]:
+    for row_number, line in enumerate(_text_lines(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise PantryImportError(row_number, f"invalid JSON: {e}")
+        yield validate_line_item(record, row_number)
+
+def parse_csv(lines: Iterable[Union[str, bytes]]) -> Iterator[LineItem]:
+    """Expects a header row naming at least the name, amount and unit columns."""
+    reader = csv.DictReader(_text_lines(lines))
+    missing = set(CSV_FIELDS) - set(reader.fieldnames or ())
+    if missing:
+        raise PantryImportError(1, f"missing columns: {', '.join(sorted(missing))}")
+    for record in reader:
+        # line_num counts physical lines, so it points at the right row even with quoted newlines
+        yield validate_line_item(record, reader.line_num)
+
+def parse(lines: Iterable[Union[str, bytes]], format: str) -> Iterator[LineItem]:
+    if format == "ndjson":
+        return parse_ndjson(lines)
+    if format == "csv":
+        return parse_csv(lines)
+    raise ValueError(f"Unsupported format: {format}")
+
+def import_items(pantry_service: PantryService, items: Iterable[LineItem], chunk_size: int = 1000) -> Iterator[ImportProgress]:
+    """Saves the items through PantryService.save_food in chunks, yielding progress after each committed chunk.
+
+    Chunks that were committed stay committed if a later row fails to parse or save.
+    """
+    progress = ImportProgress()
+    chunk = {}
+    for item in items:
+        progress.rows_read += 1
+        # A later row for the same name overrides an earlier one, as two separate saves would
+        chunk[item.name] = item
+        if len(chunk) >= chunk_size:
+            _save_chunk(pantry_service, chunk, progress)
+            yield dataclasses.replace(progress)
+    if chunk:
+        _save_chunk(pantry_service, chunk, progress)
+        yield dataclasses.replace(progress)
+
+def _save_chunk(pantry_service: PantryService, chunk: dict, progress: ImportProgress):
+    pantry_service.save_food(StorageRequest(items=list(chunk.values())))
+    progress.rows_saved += len(chunk)
+    progress.chunks += 1
+    logger.info(f"Imported pantry chunk {progress.chunks}: {progress.rows_saved} rows saved so far")
+    chunk.clear()
+
+def ndjson_lines(entries: Iterable[PantryEntry]) -> Iterator[str]:
+    for entry in entries:
+        yield json.dumps({"id": str(entry.id), "name": entry.name, "amount": entry.amount, "unit": entry.unit}) + "\n"
+
+def csv_lines(entries: Iterable[PantryEntry]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("id",) + CSV_FIELDS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for entry in entries:
+        writer.writerow((str(entry.id), entry.name, entry.amount, entry.unit))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def serialize(entries: Iterable[PantryEntry], format: str) -> Iterator[str]:
+    if format == "ndjson":
+        return ndjson_lines(entries)
+    if format == "csv":
+        return csv_lines(entries)
+    raise ValueError(f"Unsupported format: {format}")
@@ -0,0 +1,143 @@
+"""Unit conversion for pantry amounts.
+
+Units are compiled once from a small conversion graph into a factor towards the base unit of
+their dimension (grams, millilitres, pieces), so converting a whole batch is a few numpy array
+operations. Mass and volume convert into each other through per-ingredient densities.
+"""
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from .name_index import normalize_name
+
+logger = logging.getLogger(__name__)
+
+MASS, VOLUME, COUNT = 0, 1, 2
+BASE_UNITS = {MASS: "g", VOLUME: "ml", COUNT: "pcs"}
+
+# (unit, other unit, how many of the other unit make one unit); conversions follow paths through this graph
+CONVERSIONS: Tuple[Tuple[str, str, float], ...] = (
+    ("kg", "g", 1000.0),
+    ("mg", "g", 0.001),
+    ("lb", "oz", 16.0),
+    ("oz", "g", 28.349523125),
+    ("l", "ml", 1000.0),
+    ("dl", "ml", 100.0),
+    ("cl", "ml", 10.0),
+    ("tsp", "ml", 4.92892159375),
+    ("tbsp", "tsp", 3.0),
+    ("fl oz", "tbsp", 2.0),
+    ("cup", "fl oz", 8.0),
+    ("pint", "cup", 2.0),
+    ("quart", "pint", 2.0),
+    ("gallon", "quart", 4.0),
+    ("dozen", "pcs", 12.0),
+)
+
+ALIASES: Dict[str, str] = {
+    "gram": "g", "grams": "g", "gr": "g",
+    "kilogram": "kg", "kilograms": "kg", "kilo": "kg", "kilos": "kg",
+    "milligram": "mg", "milligrams": "mg",
+    "pound": "lb", "pounds": "lb", "lbs": "lb",
+    "ounce": "oz", "ounces": "oz",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "teaspoon": "tsp", "teaspoons": "tsp",
+    "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "fluid ounce": "fl oz", "fluid ounces": "fl oz", "floz": "fl oz",
+    "cups": "cup", "pints": "pint", "quarts": "quart", "gallons": "gallon",
+    "pc": "pcs", "piece": "pcs", "pieces": "pcs", "item": "pcs", "items": "pcs", "each": "pcs", "unit": "pcs", "units": "pcs",
+}
+
+# Grams per millilitre for common ingredients, keyed by normalized name
+DEFAULT_DENSITIES: Dict[str, float] = {
+    "water": 1.0, "milk": 1.03, "cream": 1.01, "yogurt": 1.03, "butter": 0.91, "oil": 0.92, "olive oil": 0.91,
+    "honey": 1.42, "flour": 0.53, "sugar": 0.85, "brown sugar": 0.9, "powdered sugar": 0.56, "salt": 1.2,
+    "rice": 0.85, "oat": 0.41, "cocoa": 0.52, "vinegar": 1.01, "soy sauce": 1.17, "maple syrup": 1.32,
+}
+
+def normalize_unit(unit: str) -> str:
+    unit = " ".join(unit.strip().lower().rstrip(".").split())
+    return ALIASES.get(unit, unit)
+
+def compile_units(conversions: Iterable[Tuple[str, str, float]] = CONVERSIONS) -> Dict[str, Tuple[int, float]]:
+    """Walks the conversion graph out from each base unit: unit -> (dimension, base units per unit)."""
+    edges: Dict[str, List[Tuple[str, float]]] = {}
+    for unit, other, factor in conversions:
+        edges.setdefault(unit, []).append((other, factor))
+        edges.setdefault(other, []).append((unit, 1.0 / factor))
+    compiled: Dict[str, Tuple[int, float]] = {}
+    for dimension, base in BASE_UNITS.items():
+        compiled[base] = (dimension, 1.0)
+        queue = deque([base])
+        while queue:
+            unit = queue.popleft()
+            # `factor` other units make one `unit`, so one `other` is 1/factor of `unit` in base units
+            for other, factor in edges.get(unit, ()):
+                if other in compiled:
+                    if compiled[other][0] != dimension:
+                        raise ValueError(f"Unit {other} is reachable from both {BASE_UNITS[compiled[other][0]]} and {base}")
+                    continue
+                compiled[other] = (dimension, compiled[unit][1] / factor)
+                queue.append(other)
+    return compiled
+
+class UnitConverter:
+    def __init__(self, densities: Optional[Dict[str, float]] = None,
+                 conversions: Iterable[Tuple[str, str, float]] = CONVERSIONS):
+        compiled = compile_units(conversions)
+        self._unit_index = {unit: index for index, unit in enumerate(compiled)}
+        self._dimensions = np.array([dimension for dimension, _ in compiled.values()], dtype=np.int8)
+        self._factors = np.array([factor for _, factor in compiled.values()], dtype=np.float64)
+        self.densities = {**DEFAULT_DENSITIES, **{normalize_name(name): density for name, density in (densities or {}).items()}}
+
+    def density(self, ingredient: Optional[str]) -> Optional[float]:
+        """Grams per millilitre, trying the whole name first and then its last word ("whole milk" -> "milk")."""
+        if not ingredient:
+            return None
+        normalized = normalize_name(ingredient)
+        density = self.densities.get(normalized)
+        if density is None and " " in normalized:
+            density = self.densities.get(normalized.rsplit(" ", 1)[1])
+        return density
+
+    def convert(self, amount: float, from_unit: str, to_unit: str, ingredient: Optional[str] = None) -> Optional[float]:
+        """The amount in `to_unit`, or None if the units can't be converted."""
+        converted = self.convert_batch([amount], [from_unit], [to_unit], [ingredient])[0]
+        return None if np.isnan(converted) else float(converted)
+
+    def convert_batch(self, amounts: Sequence[float], from_units: Sequence[str], to_units: Sequence[str],
+                      ingredients: Optional[Sequence[Optional[str]]] = None) -> np.ndarray:
+        """Converts every amount at once; NaN marks the ones whose units don't convert."""
+        from_normalized = [normalize_unit(unit) for unit in from_units]
+        to_normalized = [normalize_unit(unit) for unit in to_units]
+        from_index = np.array([self._unit_index.get(unit, -1) for unit in from_normalized], dtype=np.int64)
+        to_index = np.array([self._unit_index.get(unit, -1) for unit in to_normalized], dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        known = (from_index >= 0) & (to_index >= 0)
+
+        from_dimension = np.where(known, self._dimensions[from_index], -1)
+        to_dimension = np.where(known, self._dimensions[to_index], -2)
+        in_base = amounts * self._factors[from_index]
+        converted = np.full(len(amounts), np.nan)
+
+        same = from_dimension == to_dimension
+        converted[same] = in_base[same]
+        crossing = known & ~same & np.isin(from_dimension, (MASS, VOLUME)) & np.isin(to_dimension, (MASS, VOLUME))
+        if crossing.any():
+            # Densities are only looked up for the rows that need them
+            ingredients = ingredients if ingredients is not None else [None] * len(amounts)
+            density = np.full(len(amounts), np.nan)
+            for index in np.flatnonzero(crossing):
+                density[index] = self.density(ingredients[index]) or np.nan
+            to_volume = crossing & (from_dimension == MASS)
+            to_mass = crossing & (from_dimension == VOLUME)
+            converted[to_volume] = in_base[to_volume] / density[to_volume]
+            converted[to_mass] = in_base[to_mass] * density[to_mass]
+
+        converted /= self._factors[to_index]
+        # A unit we don't know still converts to itself
+        identical = np.array([a == b for a, b in zip(from_normalized, to_normalized)], dtype=bool)
+        converted[identical & ~known] = amounts[identical & ~known]
+        # Keeps round trips exact enough that using "1000 ml" of a 1 l entry isn't refused as too much
+        return np.round(converted, 9)
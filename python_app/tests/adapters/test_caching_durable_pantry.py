@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from python_app.adapters.caching_durable_pantry import CachingDurablePantry, PantryReadCache
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.services.pantry_service import PantryEntry, PantryService, StorageRequest, LineItem
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    Base.metadata.drop_all(engine)
+
+@pytest.fixture
+def cache():
+    return PantryReadCache()
+
+def caching_pantry(session_factory, cache):
+    return CachingDurablePantry(SqlAlchemyDurablePantryAdapter(session_factory()), cache)
+
+def test_reads_are_served_from_the_snapshot(session_factory, cache, mocker):
+    pantry = caching_pantry(session_factory, cache)
+    pantry.find_all()
+    find_all = mocker.spy(pantry.delegate, "find_all")
+    pantry.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+
+    assert [entry.name for entry in pantry.find_all()] == ["flour"]
+    assert [entry.name for entry in pantry.find_all_where_names_exist(["flour", "sugar"])] == ["flour"]
+    assert find_all.call_count == 0 # the write went through to the snapshot
+    assert cache.stats().write_throughs == 1
+
+def test_reads_return_copies(session_factory, cache):
+    pantry = caching_pantry(session_factory, cache)
+    pantry.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    pantry.find_all_where_names_exist(["flour"])[0].amount = 1.0
+    pantry.find_all()[0].amount = 2.0
+    assert pantry.find_all()[0].amount == 500.0
+    assert cache.snapshot[0].amount == 500.0
+
+def test_write_from_another_worker_is_detected_by_version(session_factory, cache):
+    pantry = caching_pantry(session_factory, cache)
+    pantry.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    assert len(pantry.find_all()) == 1
+
+    # Another worker writes straight to the database, bypassing this process' cache
+    SqlAlchemyDurablePantryAdapter(session_factory()).save_all([PantryEntry(name="sugar", amount=1.0, unit="kg")])
+    assert {entry.name for entry in pantry.find_all()} == {"flour", "sugar"}
+    assert cache.stats().loads == 2
+
+def test_version_check_interval_skips_database(session_factory):
+    clock = FakeClock()
+    cache = PantryReadCache(version_check_interval_seconds=5.0, clock=clock)
+    pantry = caching_pantry(session_factory, cache)
+    pantry.find_all()
+    SqlAlchemyDurablePantryAdapter(session_factory()).save_all([PantryEntry(name="sugar", amount=1.0, unit="kg")])
+    assert pantry.find_all() == []
+    clock.now = 5.0
+    assert [entry.name for entry in pantry.find_all()] == ["sugar"]
+
+def test_failed_save_invalidates(session_factory, cache, mocker):
+    pantry = caching_pantry(session_factory, cache)
+    pantry.find_all()
+    mocker.patch.object(pantry.delegate, "save_all", side_effect=RuntimeError("disk full"))
+    with pytest.raises(RuntimeError):
+        pantry.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    assert not cache.valid
+
+def test_pantry_service_through_cache(session_factory, cache):
+    service = PantryService(caching_pantry(session_factory, cache))
+    service.save_food(StorageRequest(items=[LineItem(name="rice", amount=2.0, unit="kg")]))
+    service.save_food(StorageRequest(items=[LineItem(name="rice", amount=3.0, unit="kg")]))
+    assert [(entry.name, entry.amount) for entry in service.get_food()] == [("rice", 3.0)]
+    # A fresh worker with an empty cache sees the same state
+    assert [(entry.name, entry.amount) for entry in caching_pantry(session_factory, PantryReadCache()).find_all()] == [("rice", 3.0)]
+
+def test_use_all_writes_through(session_factory, cache):
+    pantry = caching_pantry(session_factory, cache)
+    pantry.find_all()
+    pantry.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    pantry.use_all([LineItem(name="flour", amount=200.0, unit="g")])
+    assert [entry.amount for entry in pantry.find_all()] == [300.0]
+    assert cache.stats().write_throughs == 2
+    assert cache.stats().loads == 1
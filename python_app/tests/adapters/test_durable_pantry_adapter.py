@@ -0,0 +1,149 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.models.pantry_model import PantryModel
+from python_app.services.pantry_service import ConcurrentModificationError, LineItem, PantryEntry, UseStatus
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+@pytest.fixture(params=[True, False], ids=["bulk", "orm"])
+def adapter(request, session):
+    return SqlAlchemyDurablePantryAdapter(session, bulk_upsert=request.param, upsert_chunk_size=3)
+
+def by_id(entries):
+    return {entry.id: entry for entry in entries}
+
+def test_save_all_inserts_new_entries(adapter):
+    entries = [PantryEntry(name=f"item {i}", amount=float(i), unit="g") for i in range(7)]
+    saved = adapter.save_all(entries)
+    assert by_id(saved) == by_id(entries)
+    assert by_id(adapter.find_all()) == by_id(entries)
+
+def test_save_all_updates_existing_entries(adapter):
+    flour = PantryEntry(name="flour", amount=500.0, unit="g")
+    adapter.save_all([flour])
+    updated = PantryEntry(id=flour.id, name="flour", amount=250.0, unit="g")
+    sugar = PantryEntry(name="sugar", amount=100.0, unit="g")
+
+    saved = adapter.save_all([updated, sugar])
+    assert by_id(saved) == {flour.id: updated, sugar.id: sugar}
+    assert adapter.session.query(PantryModel).count() == 2
+
+def test_bulk_save_all_keeps_last_write_for_repeated_id(session):
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    entry_id = uuid.uuid4()
+    saved = adapter.save_all([
+        PantryEntry(id=entry_id, name="rice", amount=1.0, unit="kg"),
+        PantryEntry(id=entry_id, name="rice", amount=2.0, unit="kg"),
+    ])
+    assert saved == [PantryEntry(id=entry_id, name="rice", amount=2.0, unit="kg")]
+
+def test_save_all_with_no_entries(adapter):
+    assert adapter.save_all([]) == []
+
+def test_use_all_decrements_and_reports_outcomes(session):
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    adapter.save_all([PantryEntry(name="milk", amount=1.0, unit="liter"), PantryEntry(name="rice", amount=500.0, unit="g")])
+
+    outcomes = adapter.use_all([LineItem("milk", 0.25, "liter"), LineItem("sugar", 1.0, "g")])
+    assert [outcome.status for outcome in outcomes] == [UseStatus.USED, UseStatus.NOT_FOUND]
+    assert outcomes[0].entry.amount == 0.75
+
+    outcomes = adapter.use_all([LineItem("milk", 0.25, "liter"), LineItem("rice", 1.0, "kg"), LineItem("rice", 900.0, "g")])
+    assert [outcome.status for outcome in outcomes] == [UseStatus.ROLLED_BACK, UseStatus.UNIT_MISMATCH, UseStatus.INSUFFICIENT]
+    assert outcomes[2].entry.amount == 500.0
+    # The refused items rolled back the whole call
+    assert {entry.name: entry.amount for entry in adapter.find_all()} == {"milk": 0.75, "rice": 500.0}
+
+def test_use_all_partial_when_not_all_or_nothing(session):
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    adapter.save_all([PantryEntry(name="milk", amount=1.0, unit="liter")])
+    outcomes = adapter.use_all([LineItem("milk", 0.5, "liter"), LineItem("milk", 0.75, "liter")], all_or_nothing=False)
+    assert [outcome.status for outcome in outcomes] == [UseStatus.USED, UseStatus.INSUFFICIENT]
+    assert adapter.find_all()[0].amount == 0.5
+
+@pytest.mark.parametrize("returning", [True, False], ids=["returning", "read_back"])
+def test_use_all_takes_from_one_of_several_rows_with_the_same_name(session, monkeypatch, returning):
+    monkeypatch.setattr(session.get_bind().dialect, "update_returning", returning)
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    adapter.save_all([PantryEntry(name="egg", amount=6.0, unit="pcs"), PantryEntry(name="egg", amount=6.0, unit="pcs")])
+
+    outcomes = adapter.use_all([LineItem("egg", 4.0, "pcs")])
+    assert [outcome.status for outcome in outcomes] == [UseStatus.USED]
+    assert outcomes[0].entry.amount == 2.0
+    assert by_id(adapter.find_all())[outcomes[0].entry.id].amount == 2.0
+    assert sorted(entry.amount for entry in adapter.find_all()) == [2.0, 6.0]
+
+def test_concurrent_use_all_never_oversells(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pantry.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    stock = 200
+    with session_factory() as session:
+        SqlAlchemyDurablePantryAdapter(session).save_all([
+            PantryEntry(name="flour", amount=float(stock), unit="g"),
+            PantryEntry(name="eggs", amount=float(stock), unit="pcs"),
+        ])
+
+    def worker(_):
+        used = 0
+        with session_factory() as session:
+            adapter = SqlAlchemyDurablePantryAdapter(session)
+            for _ in range(25):
+                outcomes = adapter.use_all([LineItem("flour", 1.0, "g"), LineItem("eggs", 1.0, "pcs")])
+                statuses = {outcome.status for outcome in outcomes}
+                # Both items go together or not at all
+                assert statuses in ({UseStatus.USED}, {UseStatus.INSUFFICIENT}, {UseStatus.ROLLED_BACK, UseStatus.INSUFFICIENT})
+                used += statuses == {UseStatus.USED}
+        return used
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        used = sum(pool.map(worker, range(16)))
+
+    assert used == stock # 400 attempts for 200 units: every unit sold exactly once
+    with session_factory() as session:
+        assert {entry.name: entry.amount for entry in SqlAlchemyDurablePantryAdapter(session).find_all()} == {"flour": 0.0, "eggs": 0.0}
+    engine.dispose()
+
+def test_version_row_is_created_and_bumped_by_one_statement(session):
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement) if "pantry_version" in statement else None)
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    adapter.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    adapter.save_all([PantryEntry(name="sugar", amount=1.0, unit="kg")])
+
+    # An upsert, not UPDATE-then-INSERT: two workers' first writes cannot both try to create the row
+    assert [statement.split()[0] for statement in statements] == ["INSERT", "INSERT"]
+    assert adapter.current_version() == 2
+
+def test_save_all_bumps_row_versions(adapter):
+    saved = adapter.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    assert saved[0].version == 1
+    saved[0].amount = 400.0
+    assert adapter.save_all(saved)[0].version == 2
+    assert adapter.find_all()[0].version == 2
+
+def test_save_all_refuses_stale_version(adapter, session):
+    saved = {entry.name: entry for entry in adapter.save_all([PantryEntry(name="flour", amount=500.0, unit="g"),
+                                                              PantryEntry(name="sugar", amount=1.0, unit="kg")])}
+    flour, sugar = saved["flour"], saved["sugar"]
+    # Someone else updates flour after we read it
+    adapter.save_all([PantryEntry(id=flour.id, name="flour", amount=300.0, unit="g", version=flour.version)])
+    session.expire_all()
+
+    with pytest.raises(ConcurrentModificationError) as excinfo:
+        adapter.save_all([PantryEntry(id=flour.id, name="flour", amount=100.0, unit="g", version=flour.version),
+                          PantryEntry(id=sugar.id, name="sugar", amount=2.0, unit="kg", version=sugar.version)])
+    assert [entry.name for entry in excinfo.value.entries] == ["flour"]
+    # Nothing from the refused call was written
+    assert {entry.name: entry.amount for entry in adapter.find_all()} == {"flour": 300.0, "sugar": 1.0}
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.models.pantry_model import PantryLedgerModel, PantryLedgerRollupModel, PantryModel
+from python_app.services.pantry_service import (ConcurrentModificationError, LedgerKind, LedgerUnavailable, LineItem,
+                                                PantryEntry, UsageTotal, UseStatus)
+
+DAY = timedelta(days=1)
+MONDAY = datetime(2026, 10, 5, 12, 0, tzinfo=timezone.utc)
+
+class Clock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now.timestamp()
+
+@pytest.fixture
+def clock():
+    return Clock(MONDAY)
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+@pytest.fixture(params=[True, False], ids=["bulk", "orm"])
+def adapter(request, session, clock):
+    return SqlAlchemyDurablePantryAdapter(session, bulk_upsert=request.param, ledger=True, clock=clock)
+
+def events(adapter, name):
+    return [(event.kind, event.delta, event.quantity_after) for event in adapter.history(name, MONDAY - DAY, MONDAY + 30 * DAY)]
+
+def test_saves_and_uses_are_logged_with_deltas(adapter):
+    [flour] = adapter.save_all([PantryEntry(name="flour", amount=500.0, unit="g")])
+    [flour] = adapter.save_all([PantryEntry(id=flour.id, name="flour", amount=800.0, unit="g", version=flour.version)])
+    adapter.use_all([LineItem(name="flour", amount=300.0, unit="g")])
+
+    assert events(adapter, "flour") == [
+        (LedgerKind.SET, 500.0, 500.0),
+        (LedgerKind.SET, 300.0, 800.0),
+        (LedgerKind.USE, -300.0, 500.0),
+    ]
+
+def test_blind_overwrite_is_logged_against_the_stored_quantity(session, clock):
+    adapter = SqlAlchemyDurablePantryAdapter(session, ledger=True, clock=clock)
+    [rice] = adapter.save_all([PantryEntry(name="rice", amount=2.0, unit="kg")])
+    adapter.save_all([PantryEntry(id=rice.id, name="rice", amount=1.5, unit="kg")])
+
+    assert events(adapter, "rice") == [(LedgerKind.SET, 2.0, 2.0), (LedgerKind.SET, -0.5, 1.5)]
+
+def test_overwrite_of_a_row_inserted_concurrently_is_logged(tmp_path, clock):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pantry.db'}")
+    Base.metadata.create_all(engine)
+    rice = PantryEntry(name="rice", amount=1.5, unit="kg")
+    other_writer = create_engine(f"sqlite:///{tmp_path / 'pantry.db'}")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+        # Another worker inserts the same id just before this save writes
+        if statement.startswith("INSERT INTO pantry_entry") and not getattr(insert_first, "done", False):
+            insert_first.done = True
+            with other_writer.begin() as connection:
+                connection.execute(insert(PantryModel.__table__), {"id": rice.id, "name": "rice", "quantity": 2.0, "unit": "kg"})
+
+    with sessionmaker(bind=engine)() as session:
+        adapter = SqlAlchemyDurablePantryAdapter(session, ledger=True, clock=clock)
+        [saved] = adapter.save_all([rice])
+        assert saved.version == 2
+        assert events(adapter, "rice") == [(LedgerKind.SET, -0.5, 1.5)]
+
+def test_refused_writes_leave_no_events(adapter):
+    [milk] = adapter.save_all([PantryEntry(name="milk", amount=1.0, unit="l")])
+    adapter.save_all([PantryEntry(id=milk.id, name="milk", amount=2.0, unit="l", version=milk.version)])
+
+    outcomes = adapter.use_all([LineItem(name="milk", amount=0.5, unit="l"), LineItem(name="milk", amount=5.0, unit="l")])
+    assert [outcome.status for outcome in outcomes] == [UseStatus.ROLLED_BACK, UseStatus.INSUFFICIENT]
+    with pytest.raises(ConcurrentModificationError):
+        adapter.save_all([PantryEntry(id=milk.id, name="milk", amount=3.0, unit="l", version=milk.version)])
+
+    assert [kind for kind, _, _ in events(adapter, "milk")] == [LedgerKind.SET, LedgerKind.SET]
+
+def test_usage_aggregates_a_time_range(adapter, clock):
+    adapter.save_all([PantryEntry(name="egg", amount=12.0, unit="pcs"), PantryEntry(name="milk", amount=1.0, unit="l")])
+    for day in range(1, 4):
+        clock.now = MONDAY + day * DAY
+        adapter.use_all([LineItem(name="egg", amount=2.0, unit="pcs")])
+    clock.now = MONDAY + 10 * DAY
+    adapter.use_all([LineItem(name="milk", amount=0.25, unit="l")])
+
+    assert adapter.usage(MONDAY + DAY, MONDAY + 3 * DAY) == [UsageTotal(name="egg", unit="pcs", used=4.0, events=2)]
+    assert adapter.usage(MONDAY, MONDAY + 30 * DAY) == [
+        UsageTotal(name="egg", unit="pcs", added=12.0, used=6.0, events=4),
+        UsageTotal(name="milk", unit="l", added=1.0, used=0.25, events=2),
+    ]
+
+def test_compaction_keeps_daily_totals_and_closing_stock(session, clock):
+    adapter = SqlAlchemyDurablePantryAdapter(session, ledger=True, clock=clock)
+    adapter.save_all([PantryEntry(name="egg", amount=12.0, unit="pcs")])
+    adapter.use_all([LineItem(name="egg", amount=2.0, unit="pcs")])
+    clock.now = MONDAY + DAY
+    adapter.use_all([LineItem(name="egg", amount=3.0, unit="pcs")])
+    clock.now = MONDAY + 2 * DAY
+    adapter.use_all([LineItem(name="egg", amount=1.0, unit="pcs")])
+    week = adapter.usage(MONDAY - DAY, MONDAY + 7 * DAY)
+
+    assert adapter.compact_ledger(MONDAY + 2 * DAY) == 3
+
+    # Only the uncompacted day is still kept as individual events; the totals don't change
+    assert events(adapter, "egg") == [(LedgerKind.USE, -1.0, 6.0)]
+    assert adapter.usage(MONDAY - DAY, MONDAY + 7 * DAY) == week
+    rollups = session.execute(select(PantryLedgerRollupModel.__table__).order_by("day")).all()
+    assert [(row.added, row.used, row.events, row.quantity_end) for row in rollups] == [(12.0, 2.0, 2, 10.0), (0.0, 3.0, 1, 7.0)]
+    assert adapter.compact_ledger(MONDAY + 2 * DAY) == 0
+
+def test_compaction_merges_late_events_into_the_days_rollup(session, clock):
+    adapter = SqlAlchemyDurablePantryAdapter(session, ledger=True, clock=clock)
+    adapter.save_all([PantryEntry(name="egg", amount=12.0, unit="pcs")])
+    clock.now = MONDAY + DAY
+    assert adapter.compact_ledger(MONDAY + DAY) == 1
+    # An event stamped with a day that was already compacted, e.g. from a transaction that committed late
+    clock.now = MONDAY
+    adapter.use_all([LineItem(name="egg", amount=2.0, unit="pcs")])
+
+    assert adapter.compact_ledger(MONDAY + DAY) == 1
+    rollups = session.execute(select(PantryLedgerRollupModel.__table__)).all()
+    assert [(row.added, row.used, row.events, row.quantity_end) for row in rollups] == [(12.0, 2.0, 2, 10.0)]
+
+def test_snapshot_is_rebuilt_from_the_ledger(session, clock):
+    adapter = SqlAlchemyDurablePantryAdapter(session, ledger=True, clock=clock)
+    [egg, milk] = adapter.save_all([PantryEntry(name="egg", amount=12.0, unit="pcs"), PantryEntry(name="milk", amount=1.0, unit="l")])
+    adapter.use_all([LineItem(name="egg", amount=2.0, unit="pcs")])
+    clock.now = MONDAY + DAY
+    adapter.compact_ledger(MONDAY + DAY)
+    adapter.use_all([LineItem(name="milk", amount=0.25, unit="l")])
+    # The snapshot drifts from the ledger, e.g. after restoring pantry_entry from an older backup
+    session.execute(PantryModel.__table__.delete().where(PantryModel.id == egg.id))
+    session.execute(PantryModel.__table__.update().values(quantity=1.0).where(PantryModel.id == milk.id))
+    session.commit()
+
+    assert adapter.rebuild_snapshot() == 2
+    assert {entry.name: entry.amount for entry in adapter.find_all()} == {"egg": 10.0, "milk": 0.75}
+    assert adapter.rebuild_snapshot() == 0
+
+def test_ledger_is_off_by_default(session):
+    adapter = SqlAlchemyDurablePantryAdapter(session)
+    adapter.save_all([PantryEntry(name="salt", amount=1.0, unit="kg")])
+
+    assert session.execute(select(PantryLedgerModel.__table__)).all() == []
+    with pytest.raises(LedgerUnavailable):
+        adapter.usage(MONDAY, MONDAY + DAY)
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+import pytest
+from langchain_community.chat_models.fake import FakeListChatModel
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.batching import MicroBatcher
+
+@pytest.fixture
+def recorded_batches():
+    return []
+
+@pytest.fixture
+def batcher(recorded_batches):
+    def batch_fn(items):
+        recorded_batches.append(list(items))
+        return [ValueError(f"bad {item}") if item == "bad" else item.upper() for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_wait_ms=50, max_batch_size=4)
+    yield batcher
+    batcher.close()
+
+def submit_concurrently(batcher, items):
+    futures = [None] * len(items)
+    start = threading.Barrier(len(items))
+
+    def worker(index):
+        start.wait()
+        futures[index] = batcher.submit(items[index])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return futures
+
+def test_concurrent_items_are_dispatched_together(batcher, recorded_batches):
+    futures = submit_concurrently(batcher, ["a", "b", "c"])
+    assert [future.result(timeout=2) for future in futures] == ["A", "B", "C"]
+    assert len(recorded_batches) == 1
+    assert sorted(recorded_batches[0]) == ["a", "b", "c"]
+    stats = batcher.stats()
+    assert stats.batch_sizes == {3: 1}
+    assert stats.queued_seconds_max > 0
+
+def test_batches_are_capped_at_max_batch_size(batcher, recorded_batches):
+    futures = submit_concurrently(batcher, [str(i) for i in range(10)])
+    for future in futures:
+        future.result(timeout=2)
+    assert all(len(batch) <= 4 for batch in recorded_batches)
+    assert batcher.stats().items == 10
+
+def test_failures_are_isolated_per_item(batcher):
+    futures = submit_concurrently(batcher, ["ok", "bad"])
+    assert futures[0].result(timeout=2) == "OK"
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=2)
+
+def test_batch_fn_error_fails_the_whole_batch():
+    def broken(items):
+        raise RuntimeError("backend down")
+
+    batcher = MicroBatcher(broken, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.submit("x").result(timeout=2)
+    finally:
+        batcher.close()
+
+def test_asubmit(batcher):
+    async def main():
+        return await asyncio.gather(batcher.asubmit("x"), batcher.asubmit("y"))
+
+    assert asyncio.run(main()) == ["X", "Y"]
+
+def test_close_drains_queued_items(recorded_batches):
+    batcher = MicroBatcher(lambda items: items, max_wait_ms=1000)
+    future = batcher.submit("pending")
+    batcher.close()
+    assert future.result(timeout=0) == "pending"
+
+def test_submit_racing_close_is_still_dispatched():
+    batcher = MicroBatcher(lambda items: items, max_wait_ms=1000)
+    put = batcher._queue.put
+    closing = threading.Thread(target=batcher.close)
+
+    def put_while_closing(entry):
+        # close() starts between submit's closed check and its enqueue
+        if entry is not None and not closing.is_alive():
+            closing.start()
+            time.sleep(0.05)
+        put(entry)
+    batcher._queue.put = put_while_closing
+
+    future = batcher.submit("late")
+    closing.join(timeout=5)
+    assert future.result(timeout=5) == "late"
+    with pytest.raises(RuntimeError):
+        batcher.submit("after close")
+
+def test_agent_calls_model_through_batcher():
+    chat_model = FakeListChatModel(responses=["batched reply"])
+    batcher = MicroBatcher.for_chat_model(chat_model, max_wait_ms=1)
+    try:
+        agent = PythonStorageAgent(chat_model=chat_model, batcher=batcher)
+        assert agent.chat("hello") == "batched reply"
+        assert batcher.stats().items == 1
+    finally:
+        batcher.close()
@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.context_window import ApproximateTokenizer, ContextWindowManager, TruncatingSummarizer
+
+class RecordingSummarizer(TruncatingSummarizer):
+    def __init__(self):
+        super().__init__(max_chars=200)
+        self.calls = []
+
+    def __call__(self, previous_summary, evicted):
+        self.calls.append(list(evicted))
+        return super().__call__(previous_summary, evicted)
+
+class InMemoryChatMemory:
+    def __init__(self):
+        self.conversations = {}
+
+    def get_messages(self, memory_id, last_n=None):
+        return list(self.conversations.get(memory_id, []))
+
+    def append_messages(self, memory_id, messages):
+        self.conversations.setdefault(memory_id, []).extend(messages)
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "x" * 36})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y" * 38})
+    return messages
+
+@pytest.fixture
+def summarizer():
+    return RecordingSummarizer()
+
+@pytest.fixture
+def manager(summarizer):
+    # Each history message costs 12 + 4 tokens with the 4-chars-per-token estimate
+    return ContextWindowManager(summarizer, tokenizer=ApproximateTokenizer(), token_budget=150, summary_token_budget=50)
+
+def test_short_history_is_sent_verbatim(manager, summarizer):
+    window = manager.build("m1", "system", history(2), "next")
+    assert window.messages == history(2)
+    assert window.summary == ""
+    assert window.saved_tokens == 0
+    assert summarizer.calls == []
+
+def test_long_history_is_cut_to_budget_and_summarized(manager, summarizer):
+    window = manager.build("m1", "system", history(10), "next")
+    assert window.prompt_tokens <= manager.token_budget
+    assert window.messages == history(10)[-len(window.messages):]
+    assert len(window.messages) < 20
+    assert window.summary
+    assert window.saved_tokens > 0
+    assert summarizer.calls == [history(10)[:20 - len(window.messages)]]
+
+def test_only_newly_evicted_messages_are_summarized(manager, summarizer):
+    first = manager.build("m1", "system", history(10), "next")
+    covered = 20 - len(first.messages)
+    second = manager.build("m1", "system", history(11), "next")
+    assert len(summarizer.calls) == 2
+    assert summarizer.calls[1] == history(11)[covered:20 + 2 - len(second.messages)]
+    # Nothing new fell out of the window, so the cached summary is reused as is
+    manager.build("m1", "system", history(11), "again")
+    assert len(summarizer.calls) == 2
+    assert manager.stats().summarizations == 2
+
+def test_shorter_history_resets_summary(manager, summarizer):
+    manager.build("m1", "system", history(10), "next")
+    window = manager.build("m1", "system", history(1), "next")
+    assert window.summary == ""
+    assert window.messages == history(1)
+
+def test_least_recently_used_summaries_are_evicted(summarizer):
+    manager = ContextWindowManager(summarizer, tokenizer=ApproximateTokenizer(), token_budget=150, summary_token_budget=50,
+                                   capacity=2)
+    for memory_id in ("m1", "m2", "m1", "m3"):
+        manager.build(memory_id, "system", history(10), "next")
+    assert manager.stats().evictions == 1
+    # m1 was used more recently than m2, so its summary survived
+    manager.build("m1", "system", history(10), "next")
+    assert len(summarizer.calls) == 3
+    manager.build("m2", "system", history(10), "next")
+    assert len(summarizer.calls) == 4
+
+def test_concurrent_builds_summarize_a_span_once(summarizer):
+    def slow_summarizer(previous, evicted):
+        time.sleep(0.05)
+        return summarizer(previous, evicted)
+    manager = ContextWindowManager(slow_summarizer, tokenizer=ApproximateTokenizer(), token_budget=150, summary_token_budget=50)
+    threads = [threading.Thread(target=manager.build, args=("m1", "system", history(10), "next")) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(summarizer.calls) == 1
+
+def test_forget_drops_the_summary(manager, summarizer):
+    manager.build("m1", "system", history(10), "next")
+    manager.forget("m1")
+    manager.build("m1", "system", history(10), "next")
+    assert len(summarizer.calls) == 2
+
+def test_summary_is_capped_to_its_budget():
+    manager = ContextWindowManager(lambda previous, evicted: "z" * 1000, tokenizer=ApproximateTokenizer(),
+                                   token_budget=150, summary_token_budget=20)
+    window = manager.build("m1", "system", history(10), "next")
+    assert ApproximateTokenizer().count(window.summary) <= 20
+
+def test_agent_sends_summary_and_recent_turns(manager):
+    memory = InMemoryChatMemory()
+    memory.conversations["m1"] = history(10)
+    agent = PythonStorageAgent(FakeListChatModel(responses=["ok"]), chat_memory=memory, context_window=manager)
+
+    messages = agent.prepare_messages("next", memory_id="m1")
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[1].content.startswith(ContextWindowManager.SUMMARY_PREFIX)
+    assert isinstance(messages[-2], AIMessage)
+    assert messages[-1] == HumanMessage(content="next")
+
+def test_agent_records_the_turn(manager):
+    memory = InMemoryChatMemory()
+    agent = PythonStorageAgent(FakeListChatModel(responses=["ok"]), chat_memory=memory, context_window=manager)
+    assert agent.chat("hello", memory_id="m1") == "ok"
+    assert memory.conversations["m1"] == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "ok"}]
+    # Without a memory_id the agent stays stateless
+    agent.chat("hello")
+    assert list(memory.conversations) == ["m1"]
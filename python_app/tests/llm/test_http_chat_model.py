@@ -0,0 +1,148 @@
+import asyncio
+import types
+import httpx
+import pytest
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from python_app.llm.backends import build_chat_model
+from python_app.llm.http_chat_model import OLLAMA, OPENAI, HttpChatModel, ModelBackendError
+from python_app.llm.stand_in_server import StandInModelServer
+
+MESSAGES = [SystemMessage(content="be brief"), HumanMessage(content="what can I cook?")]
+
+@pytest.fixture
+def server():
+    with StandInModelServer(reply="soup with what you have") as server:
+        yield server
+
+def model_for(server, api_style=OPENAI, **kwargs):
+    base_url = f"{server.url}/v1" if api_style == OPENAI else server.url
+    return HttpChatModel(base_url=base_url, api_style=api_style, model_name="stand-in",
+                         retry_backoff_seconds=0.001, **kwargs)
+
+@pytest.mark.parametrize("api_style", [OPENAI, OLLAMA])
+def test_invoke_and_stream(server, api_style):
+    model = model_for(server, api_style)
+
+    assert model.invoke(MESSAGES).content == "soup with what you have"
+    # LangChain closes every stream with an empty chunk, which the storage agent skips too
+    assert [chunk.content for chunk in model.stream(MESSAGES) if chunk.content] == ["soup ", "with ", "what ", "you ", "have"]
+    model.close()
+
+def test_requests_share_one_kept_alive_connection(server):
+    model = model_for(server)
+    for _ in range(5):
+        model.invoke(MESSAGES)
+        list(model.stream(MESSAGES))
+
+    assert server.requests == 10
+    assert server.connections == 1
+    model.close()
+
+def test_retryable_failures_are_retried(server):
+    model = model_for(server, max_retries=2)
+    server.fail_next(503, 429)
+
+    assert model.invoke(MESSAGES).content == "soup with what you have"
+    assert server.requests == 3
+
+    server.fail_next(503, 503, 503)
+    with pytest.raises(ModelBackendError) as raised:
+        list(model.stream(MESSAGES))
+    assert raised.value.status_code == 503
+
+    server.fail_next(400)
+    with pytest.raises(ModelBackendError):
+        model.invoke(MESSAGES)
+    assert server.requests == 3 + 3 + 1 # client errors aren't retried
+    model.close()
+
+def test_unreachable_backend_raises_after_retries():
+    model = HttpChatModel(base_url="http://127.0.0.1:9", model_name="m", max_retries=1, retry_backoff_seconds=0.001)
+    with pytest.raises(ModelBackendError, match="unreachable"):
+        model.invoke(MESSAGES)
+
+class BrokenBody(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """A body whose connection drops before any of it arrives."""
+    def __iter__(self):
+        raise httpx.ReadError("connection reset")
+        yield b""
+
+    async def __aiter__(self):
+        raise httpx.ReadError("connection reset")
+        yield b""
+
+def flaky_transport(broken: int):
+    """Sends `broken` replies whose body can't be read, then good ones."""
+    calls = []
+    def handler(request):
+        calls.append(request)
+        if len(calls) <= broken:
+            return httpx.Response(200, stream=BrokenBody())
+        return httpx.Response(200, json={"choices": [{"message": {"content": "soup"}}]})
+    return calls, handler
+
+def test_body_read_errors_are_retried_and_wrapped():
+    calls, handler = flaky_transport(broken=1)
+    model = HttpChatModel(base_url="http://stand-in", model_name="m", max_retries=1, retry_backoff_seconds=0.001)
+    model._client = httpx.Client(base_url="http://stand-in", transport=httpx.MockTransport(handler))
+    assert model.invoke(MESSAGES).content == "soup"
+    assert len(calls) == 2
+
+    calls, handler = flaky_transport(broken=2)
+    model._client = httpx.Client(base_url="http://stand-in", transport=httpx.MockTransport(handler))
+    with pytest.raises(ModelBackendError, match="unreachable"):
+        model.invoke(MESSAGES)
+
+    async def run():
+        calls, handler = flaky_transport(broken=1)
+        model._async_client = httpx.AsyncClient(base_url="http://stand-in", transport=httpx.MockTransport(handler))
+        reply = await model.ainvoke(MESSAGES)
+        calls, handler = flaky_transport(broken=2)
+        model._async_client = httpx.AsyncClient(base_url="http://stand-in", transport=httpx.MockTransport(handler))
+        with pytest.raises(ModelBackendError, match="unreachable"):
+            await model.ainvoke(MESSAGES)
+        await model.aclose()
+        return reply.content, len(calls)
+
+    assert asyncio.run(run()) == ("soup", 2)
+    model.close()
+
+def test_retry_delay_has_full_jitter_and_honours_retry_after():
+    model = HttpChatModel(base_url="http://unused", model_name="m", retry_backoff_seconds=0.1, retry_backoff_max_seconds=1.0)
+    delays = [model.retry_delay(3) for _ in range(200)]
+    assert all(0 <= delay <= 0.8 for delay in delays) and len(set(delays)) > 1
+    assert model.retry_delay(10) <= 1.0
+    assert model.retry_delay(0, types.SimpleNamespace(headers={"Retry-After": "1"})) == 1.0
+
+@pytest.mark.parametrize("api_style", [OPENAI, OLLAMA])
+def test_async_calls(server, api_style):
+    model = model_for(server, api_style)
+
+    async def run():
+        server.fail_next(502)
+        replies = await asyncio.gather(*(model.ainvoke(MESSAGES) for _ in range(5)))
+        pieces = [chunk.content async for chunk in model.astream(MESSAGES)]
+        await model.aclose()
+        return replies, pieces
+
+    replies, pieces = asyncio.run(run())
+    assert {reply.content for reply in replies} == {"soup with what you have"}
+    assert "".join(pieces) == "soup with what you have"
+
+def test_build_chat_model_from_settings(server):
+    settings = types.SimpleNamespace(
+        CHAT_MODEL_BACKEND="ollama", CHAT_MODEL_BASE_URL=server.url, CHAT_MODEL_NAME="llama3", OPENAI_API_KEY="dummy_openai_api_key",
+        OPENAI_TEMPERATURE=0.2, HTTP_POOL_SIZE=4, HTTP_CONNECT_TIMEOUT_SECONDS=1.0, HTTP_READ_TIMEOUT_SECONDS=5.0,
+        HTTP_MAX_RETRIES=1, HTTP_RETRY_BACKOFF_SECONDS=0.01
+    )
+    model = build_chat_model(settings)
+    assert isinstance(model, HttpChatModel) and model.api_key is None and model.pool_size == 4
+    assert model.invoke(MESSAGES).content == "soup with what you have"
+    model.close()
+
+    settings.CHAT_MODEL_BACKEND = "fake"
+    assert isinstance(build_chat_model(settings, fake_responses=["hi"]), FakeListChatModel)
+    settings.CHAT_MODEL_BACKEND = "carrier pigeon"
+    with pytest.raises(ValueError):
+        build_chat_model(settings)
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.response_cache import ResponseCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def messages(text):
+    return [SystemMessage(content="system"), HumanMessage(content=text)]
+
+@pytest.fixture
+def cache():
+    return ResponseCache(capacity=2, ttl_seconds=60)
+
+def test_hit_after_put(cache):
+    cache.put("system", "model", 0.0, messages("hi"), "hello")
+    assert cache.get("system", "model", 0.0, messages("hi")) == "hello"
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 0
+
+def test_key_covers_model_and_system_prompt(cache):
+    cache.put("system", "model", 0.0, messages("hi"), "hello")
+    assert cache.get("other system", "model", 0.0, messages("hi")) is None
+    assert cache.get("system", "other-model", 0.0, messages("hi")) is None
+    assert cache.stats().misses == 2
+
+def test_positive_temperature_bypasses_cache(cache):
+    cache.put("system", "model", 0.7, messages("hi"), "hello")
+    assert cache.get("system", "model", 0.7, messages("hi")) is None
+    assert cache.stats().bypasses == 1
+    assert len(cache.memory) == 0
+
+def test_lru_eviction(cache):
+    cache.put("s", "m", 0.0, messages("a"), "A")
+    cache.put("s", "m", 0.0, messages("b"), "B")
+    cache.get("s", "m", 0.0, messages("a")) # refresh "a" so "b" is the eviction candidate
+    cache.put("s", "m", 0.0, messages("c"), "C")
+    assert cache.get("s", "m", 0.0, messages("b")) is None
+    assert cache.get("s", "m", 0.0, messages("a")) == "A"
+    assert cache.stats().evictions == 1
+
+def test_counters_add_up_under_concurrent_use(cache):
+    def churn(worker):
+        for i in range(200):
+            cache.put("s", "m", 0.0, messages(f"{worker}-{i}"), "reply")
+            cache.get("s", "m", 0.0, messages(f"{worker}-{i - 1}"))
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(churn, range(8)))
+    stats = cache.stats()
+    assert stats.hits + stats.misses == 8 * 200
+    assert stats.evictions == 8 * 200 - len(cache.memory)
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = ResponseCache(capacity=10, ttl_seconds=5)
+    cache.memory.clock = clock
+    cache.put("s", "m", 0.0, messages("a"), "A")
+    clock.now = 10.0
+    assert cache.get("s", "m", 0.0, messages("a")) is None
+    assert cache.stats().expirations == 1
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(sqlite_path=path).put("s", "m", 0.0, messages("a"), "A")
+
+    restarted = ResponseCache(sqlite_path=path)
+    assert restarted.get("s", "m", 0.0, messages("a")) == "A"
+    assert restarted.stats().persistent_hits == 1
+    # Promoted into memory, so the next hit does not touch SQLite
+    assert len(restarted.memory) == 1
+
+def test_agent_serves_repeated_prompt_from_cache():
+    chat_model = FakeListChatModel(responses=["first", "second"])
+    agent = PythonStorageAgent(chat_model=chat_model, response_cache=ResponseCache())
+    assert agent.chat("what's in my pantry") == "first"
+    assert agent.chat("what's in my pantry") == "first"
+    assert agent.chat("something else") == "second"
+
+def test_agent_stream_populates_cache():
+    chat_model = FakeListChatModel(responses=["streamed", "other"])
+    agent = PythonStorageAgent(chat_model=chat_model, response_cache=ResponseCache())
+    assert "".join(agent.stream("hi")) == "streamed"
+    assert list(agent.stream("hi")) == ["streamed"]
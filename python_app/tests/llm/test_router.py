@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+import types
+from typing import Any, List, Optional
+import pytest
+from langchain_core.messages import BaseMessage, HumanMessage
+from python_app.agents.latency_fake_chat_model import LatencyFakeListChatModel
+from python_app.llm.backends import build_chat_model
+from python_app.llm.http_chat_model import HttpChatModel
+from python_app.llm.router import CircuitBreaker, NoHealthyEndpoint, RoutedChatModel
+from python_app.llm.stand_in_server import StandInModelServer
+
+MESSAGES = [HumanMessage(content="hi")]
+
+class FailingChatModel(LatencyFakeListChatModel):
+    failing: bool = True
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.failing:
+            raise ConnectionError("replica down")
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.failing:
+            raise ConnectionError("replica down")
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.failing:
+            raise ConnectionError("replica down")
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+def replica(reply: str, latency: float = 0.0):
+    return LatencyFakeListChatModel(responses=[reply], latency=latency)
+
+def test_traffic_follows_latency():
+    router = RoutedChatModel(endpoints=[replica("slow", 0.03), replica("fast", 0.001)])
+    replies = [router.invoke(MESSAGES).content for _ in range(20)]
+
+    # Each replica is tried once; after that the fast one gets everything
+    assert replies[:2] == ["slow", "fast"] and set(replies[2:]) == {"fast"}
+    slow, fast = router.stats().endpoints
+    assert slow.ewma_ms > fast.ewma_ms and slow.outstanding == fast.outstanding == 0
+
+def test_failures_fail_over_and_open_the_breaker():
+    broken = FailingChatModel(responses=["never"])
+    router = RoutedChatModel(endpoints=[broken, replica("ok")], breaker_failures=2, breaker_reset_seconds=60)
+    assert [router.invoke(MESSAGES).content for _ in range(5)] == ["ok"] * 5
+
+    broken_stats, healthy_stats = router.stats().endpoints
+    assert broken_stats.state == CircuitBreaker.OPEN and broken_stats.failures == 2
+    assert healthy_stats.calls == 5
+
+def test_no_healthy_endpoint_raises_the_last_error():
+    router = RoutedChatModel(endpoints=[FailingChatModel(responses=["x"])], breaker_failures=1, breaker_reset_seconds=60)
+    with pytest.raises(ConnectionError):
+        router.invoke(MESSAGES)
+    with pytest.raises(NoHealthyEndpoint):
+        router.invoke(MESSAGES)
+
+def test_breaker_lets_one_trial_through_after_the_reset_period():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=5, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 5.0
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow() # only the one trial
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_sync_hedge_returns_the_first_result():
+    router = RoutedChatModel(endpoints=[replica("stuck", 1.0), replica("hedge", 0.01)], hedge=True, hedge_delay_ms=20)
+    started = time.perf_counter()
+
+    assert router.invoke(MESSAGES).content == "hedge"
+    assert time.perf_counter() - started < 0.5
+    assert (router.stats().hedged, router.stats().hedge_wins) == (1, 1)
+    router.close()
+
+def test_async_hedge_cancels_the_loser():
+    router = RoutedChatModel(endpoints=[replica("stuck", 5.0), replica("hedge", 0.01)], hedge=True, hedge_delay_ms=20)
+
+    async def run():
+        started = time.perf_counter()
+        reply = await router.ainvoke(MESSAGES)
+        await asyncio.sleep(0) # let the cancellation land
+        return reply.content, time.perf_counter() - started
+
+    content, elapsed = asyncio.run(run())
+    assert content == "hedge" and elapsed < 0.5
+    stuck, _ = router.stats().endpoints
+    # Cancelled, not failed, and no longer counted as in flight
+    assert stuck.outstanding == 0 and stuck.failures == 0 and stuck.state == CircuitBreaker.CLOSED
+
+def test_sync_hedging_beyond_its_workers_runs_inline_instead_of_queueing():
+    router = RoutedChatModel(endpoints=[replica("a", 0.1), replica("b", 0.1)], hedge=True, hedge_delay_ms=1000,
+                             hedge_max_workers=1)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=router.invoke, args=(MESSAGES,)) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Twelve calls at once with one hedge worker: all overlap, none wait behind another
+    assert time.perf_counter() - started < 0.18
+    assert router.stats().hedged == 0
+    router.close()
+
+def half_open(router: RoutedChatModel):
+    breaker = router._endpoints[0].breaker
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, breaker.clock() - breaker.reset_seconds
+    return breaker
+
+def test_cancelled_trial_call_reopens_the_breaker():
+    router = RoutedChatModel(endpoints=[replica("slow", 5.0)])
+    breaker = half_open(router)
+
+    async def run():
+        call = asyncio.ensure_future(router.ainvoke(MESSAGES))
+        await asyncio.sleep(0.02)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(run())
+    endpoint = router.stats().endpoints[0]
+    assert endpoint.state == CircuitBreaker.OPEN and endpoint.outstanding == 0 and endpoint.failures == 0
+
+def test_abandoned_trial_stream_reopens_the_breaker():
+    router = RoutedChatModel(endpoints=[replica("several streamed pieces")])
+    half_open(router)
+    stream = router.stream(MESSAGES)
+    next(stream)
+    stream.close()
+    endpoint = router.stats().endpoints[0]
+    assert endpoint.state == CircuitBreaker.OPEN and endpoint.outstanding == 0
+
+def test_percentile_hedge_delay_needs_history():
+    router = RoutedChatModel(endpoints=[replica("a")], hedge=True, hedge_percentile=90, hedge_min_samples=10)
+    assert router.hedge_delay() is None
+    for elapsed in range(1, 11):
+        router._latencies.append(elapsed / 100)
+    assert router.hedge_delay() == pytest.approx(0.10)
+
+def test_streams_fail_over_before_the_first_piece():
+    router = RoutedChatModel(endpoints=[FailingChatModel(responses=["never"]), replica("streamed")])
+    pieces = [chunk.content for chunk in router.stream(MESSAGES)]
+
+    assert "".join(pieces) == "streamed"
+    assert [endpoint.failures for endpoint in router.stats().endpoints] == [1, 0]
+
+def test_several_base_urls_build_a_router():
+    with StandInModelServer(reply="first") as first, StandInModelServer(reply="second") as second:
+        settings = types.SimpleNamespace(
+            CHAT_MODEL_BACKEND="ollama", CHAT_MODEL_BASE_URL=f"{first.url}, {second.url}", CHAT_MODEL_NAME="llama3",
+            OPENAI_API_KEY="dummy_openai_api_key", OPENAI_TEMPERATURE=0.0, HTTP_POOL_SIZE=4, HTTP_CONNECT_TIMEOUT_SECONDS=1.0,
+            HTTP_READ_TIMEOUT_SECONDS=5.0, HTTP_MAX_RETRIES=2, HTTP_RETRY_BACKOFF_SECONDS=0.01, ROUTER_EWMA_ALPHA=0.2,
+            ROUTER_BREAKER_FAILURES=3, ROUTER_BREAKER_RESET_SECONDS=10.0, ROUTER_HEDGE_ENABLED=False,
+            ROUTER_HEDGE_PERCENTILE=95.0, ROUTER_HEDGE_DELAY_MS=0.0, ROUTER_HEDGE_MAX_WORKERS=64
+        )
+        router = build_chat_model(settings)
+        assert isinstance(router, RoutedChatModel) and router.model_name == "llama3"
+        assert all(isinstance(endpoint, HttpChatModel) and endpoint.max_retries == 0 for endpoint in router.endpoints)
+
+        first.fail_next(503)
+        assert router.invoke(MESSAGES).content == "second"
+        router.close()
@@ -0,0 +1,93 @@
+import numpy as np
+from langchain_community.chat_models.fake import FakeListChatModel
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.llm.semantic_cache import HashingEmbedder, SemanticCache
+from python_app.llm_orchestrator import PythonLLMOrchestrator
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dimension=64)
+    first = embedder.embed(["show my pantry", "what food do I have"])
+    second = embedder.embed(["show my pantry", "what food do I have"])
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first, axis=1), 1.0)
+
+def test_near_duplicate_prompt_hits():
+    cache = SemanticCache(HashingEmbedder(), threshold=0.8)
+    cache.put("what food do I have in my pantry", "You have apples.")
+    hit = cache.lookup("What food do I have in my pantry?")
+    assert hit is not None
+    assert hit.response == "You have apples."
+    assert hit.score > 0.8
+    assert cache.lookup("tell me a joke about penguins") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+def test_lookup_batch_returns_one_result_per_prompt():
+    cache = SemanticCache(HashingEmbedder(), threshold=0.8)
+    cache.put("list my pantry items", "apples")
+    results = cache.lookup_batch(["list my pantry items", "something unrelated entirely"])
+    assert results[0].response == "apples"
+    assert results[1] is None
+
+def test_capacity_evicts_least_recently_used():
+    cache = SemanticCache(HashingEmbedder(), capacity=2, threshold=0.99)
+    cache.put("alpha", "A")
+    cache.put("bravo", "B")
+    cache.lookup("alpha")
+    cache.put("charlie", "C")
+    assert len(cache) == 2
+    assert cache.lookup("bravo") is None
+    assert cache.lookup("alpha").response == "A"
+    assert cache.stats().evictions == 1
+
+def test_ttl_expires_entries():
+    now = [0.0]
+    cache = SemanticCache(HashingEmbedder(), threshold=0.99, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("alpha", "A")
+    now[0] = 11.0
+    assert cache.lookup("alpha") is None
+    assert len(cache) == 0
+    assert cache.stats().expirations == 1
+
+def test_hashed_search_finds_near_duplicates_beyond_exact_limit():
+    dimension = 64
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((500, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    cache = SemanticCache(HashingEmbedder(dimension), capacity=500, threshold=0.9, exact_search_limit=10, hash_bits=6)
+    for i, vector in enumerate(vectors):
+        cache.put_embedding(f"prompt {i}", vector, f"reply {i}")
+
+    query = vectors[123] + rng.standard_normal(dimension).astype(np.float32) * 0.01
+    query /= np.linalg.norm(query)
+    hit = cache.lookup_embeddings(query[np.newaxis, :])[0]
+    assert hit is not None
+    assert hit.response == "reply 123"
+
+def test_orchestrator_answers_paraphrase_without_calling_agent():
+    chat_model = FakeListChatModel(responses=["first", "second"])
+    orchestrator = PythonLLMOrchestrator(
+        storage_agent=PythonStorageAgent(chat_model=chat_model),
+        semantic_cache=SemanticCache(HashingEmbedder(), threshold=0.8)
+    )
+    assert orchestrator.call("what is in my pantry") == "first"
+    assert orchestrator.call("What is in my pantry?") == "first"
+    assert chat_model.i == 1
+
+def test_orchestrator_embeds_each_prompt_once():
+    class CountingEmbedder(HashingEmbedder):
+        calls = 0
+
+        def embed(self, texts):
+            self.calls += len(texts)
+            return super().embed(texts)
+
+    embedder = CountingEmbedder()
+    orchestrator = PythonLLMOrchestrator(
+        storage_agent=PythonStorageAgent(chat_model=FakeListChatModel(responses=["first"])),
+        semantic_cache=SemanticCache(embedder, threshold=0.8)
+    )
+    assert orchestrator.call("what is in my pantry") == "first"
+    assert embedder.calls == 1
+    assert orchestrator.call("What is in my pantry?") == "first"
+    assert embedder.calls == 2
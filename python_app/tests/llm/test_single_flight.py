@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+import pytest
+from python_app.llm.single_flight import SingleFlight, SingleFlightStats, normalize_request_key
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.001)
+
+def run_in_threads(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def test_normalize_request_key_collapses_whitespace():
+    assert normalize_request_key("  what is\n in my   pantry ") == "what is in my pantry"
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def generate():
+        executions.append(1)
+        release.wait()
+        return "reply"
+
+    threads, results, errors = run_in_threads(5, lambda: flight.do("key", generate))
+    wait_for(lambda: flight.stats().shared == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["reply"] * 5
+    assert errors == [None] * 5
+    assert len(executions) == 1
+    assert flight.stats().executions == 1
+
+def test_concurrent_callers_share_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def generate():
+        release.wait()
+        raise RuntimeError("upstream failed")
+
+    threads, _, errors = run_in_threads(3, lambda: flight.do("key", generate))
+    wait_for(lambda: flight.stats().shared == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+def test_sequential_calls_are_not_deduplicated():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats().executions == 2
+
+def test_stream_fans_out_the_same_chunks():
+    flight = SingleFlight()
+    gate = threading.Event()
+    upstream_calls = []
+
+    def source():
+        upstream_calls.append(1)
+        yield "a"
+        gate.wait()
+        yield "b"
+        yield "c"
+
+    first = flight.stream("key", source)
+    assert next(first) == "a"
+    # Joins mid-stream and still sees the chunks produced so far
+    second = flight.stream("key", source)
+    gate.set()
+    assert list(first) == ["b", "c"]
+    assert list(second) == ["a", "b", "c"]
+    assert len(upstream_calls) == 1
+
+def test_stream_survives_an_abandoned_consumer():
+    flight = SingleFlight()
+    first = flight.stream("key", lambda: iter(["a", "b", "c"]))
+    second = flight.stream("key", lambda: iter(["unused"]))
+    assert next(first) == "a"
+    first.close()
+    assert list(second) == ["a", "b", "c"]
+
+def test_stream_error_reaches_every_consumer():
+    flight = SingleFlight()
+
+    def source():
+        yield "a"
+        raise RuntimeError("stream broke")
+
+    first = flight.stream("key", source)
+    second = flight.stream("key", source)
+    with pytest.raises(RuntimeError):
+        list(first)
+    with pytest.raises(RuntimeError):
+        list(second)
+
+def test_async_callers_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+
+    async def generate():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return "reply"
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("key", generate) for _ in range(10)])
+
+    assert asyncio.run(main()) == ["reply"] * 10
+    assert len(executions) == 1
+
+def test_async_stream_fans_out():
+    flight = SingleFlight()
+    executions = []
+
+    async def source():
+        executions.append(1)
+        for piece in ["a", "b", "c"]:
+            await asyncio.sleep(0)
+            yield piece
+
+    async def collect():
+        return [piece async for piece in flight.astream("key", source)]
+
+    async def main():
+        return await asyncio.gather(collect(), collect(), collect())
+
+    assert asyncio.run(main()) == [["a", "b", "c"]] * 3
+    assert len(executions) == 1
+
+def test_abandoned_stream_is_forgotten_and_closed():
+    flight = SingleFlight()
+    closed = []
+
+    def source():
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    first = flight.stream("key", source)
+    second = flight.stream("key", source)
+    assert next(first) == "a"
+    first.close()
+    assert next(second) == "a"
+    second.close()
+    assert closed == [True]
+    assert flight._stream_calls == {}
+    assert list(flight.stream("key", source)) == ["a", "b", "c"]
+
+def test_stream_consumer_dropped_before_its_first_chunk_lets_go():
+    flight = SingleFlight()
+    closed = []
+
+    def source():
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    first = flight.stream("key", source)
+    unstarted = flight.stream("key", source)
+    assert next(first) == "a"
+    del unstarted
+    first.close()
+    assert closed == [True]
+    assert flight._stream_calls == {}
+
+def test_cancelled_async_leader_hands_over_to_a_follower():
+    flight = SingleFlight()
+    executions = []
+
+    async def generate():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", generate))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(flight.ado("key", generate)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(main()) == ["reply"] * 3
+    # The cancelled leader's call, then one re-run shared by all three followers
+    assert len(executions) == 2
+    assert flight.stats() == SingleFlightStats(executions=2, shared=3)
+
+def test_cancelled_async_stream_consumer_does_not_end_the_stream_for_others():
+    flight = SingleFlight()
+    executions = []
+
+    async def source():
+        executions.append(1)
+        for piece in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield piece
+
+    async def collect():
+        return [piece async for piece in flight.astream("key", source)]
+
+    async def main():
+        first = asyncio.ensure_future(collect())
+        second = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.015)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert len(executions) == 1
+    assert flight._async_stream_calls == {}
+
+def test_async_stream_is_forgotten_once_every_consumer_left():
+    flight = SingleFlight()
+
+    async def source():
+        for piece in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield piece
+
+    async def main():
+        consumer = flight.astream("key", source)
+        assert await consumer.__anext__() == "a"
+        await consumer.aclose()
+        await asyncio.sleep(0)
+        return flight._async_stream_calls
+
+    assert asyncio.run(main()) == {}
+
+def test_async_stream_consumer_that_never_started_does_not_join():
+    flight = SingleFlight()
+    started = []
+
+    async def source():
+        started.append(1)
+        yield "a"
+
+    flight.astream("key", source)
+    assert flight._async_stream_calls == {}
+    assert started == []
@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine, inspect, text
+from python_app.models.migrations import add_pantry_entry_last_delta_column, add_pantry_entry_version_column
+
+def test_adds_version_column_to_existing_pantry_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE pantry_entry (id CHAR(32) PRIMARY KEY, name VARCHAR NOT NULL, quantity FLOAT NOT NULL, unit VARCHAR NOT NULL)"))
+        connection.execute(text("INSERT INTO pantry_entry VALUES ('a', 'flour', 1.0, 'kg')"))
+
+    assert add_pantry_entry_version_column(engine) is True
+    assert add_pantry_entry_version_column(engine) is False # already there
+    assert "version" in {column["name"] for column in inspect(engine).get_columns("pantry_entry")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM pantry_entry")).scalar() == 1
+    engine.dispose()
+
+def test_adds_last_delta_column_to_existing_pantry_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE pantry_entry (id CHAR(32) PRIMARY KEY, name VARCHAR NOT NULL, quantity FLOAT NOT NULL, unit VARCHAR NOT NULL)"))
+        connection.execute(text("INSERT INTO pantry_entry VALUES ('a', 'flour', 1.0, 'kg')"))
+
+    assert add_pantry_entry_last_delta_column(engine) is True
+    assert add_pantry_entry_last_delta_column(engine) is False
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT last_delta FROM pantry_entry")).scalar() == 0.0
+    engine.dispose()
+
+def test_skips_missing_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    assert add_pantry_entry_version_column(engine) is False
+    engine.dispose()
@@ -0,0 +1,44 @@
+import threading
+import time
+import pytest
+from python_app.app import app
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', 'secret-token')
+    return 'secret-token'
+
+def test_profile_endpoint_is_off_without_a_token(monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', '')
+    assert app.test_client().post('/admin/profile?seconds=0.1').status_code == 404
+
+def test_profile_endpoint_needs_the_token(admin_token):
+    response = app.test_client().post('/admin/profile?seconds=0.1', headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+def test_profile_endpoint_rejects_bad_arguments(admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    assert app.test_client().post('/admin/profile?requests=0', headers=headers).status_code == 400
+    assert app.test_client().post('/admin/profile?seconds=soon', headers=headers).status_code == 400
+    assert app.test_client().post('/admin/profile?requests=abc', headers=headers).status_code == 400
+    assert app.test_client().post('/admin/profile?seconds=nan', headers=headers).status_code == 400
+    assert app.test_client().post('/admin/profile?seconds=inf', headers=headers).status_code == 400
+
+def test_profile_endpoint_profiles_the_next_requests(admin_token):
+    result = {}
+
+    def profile():
+        response = app.test_client().post('/admin/profile?requests=2&seconds=10', headers={"Authorization": f"Bearer {admin_token}"})
+        result["status"], result["report"] = response.status_code, response.get_json()
+
+    profiler_thread = threading.Thread(target=profile)
+    profiler_thread.start()
+    while app.config['PROFILER'].session is None:
+        time.sleep(0.01)
+    client = app.test_client()
+    for index in range(2):
+        client.post('/curl/chat', json={"message": f"profile me {index}"}).close()
+    profiler_thread.join(timeout=10)
+    assert result["status"] == 200
+    assert result["report"]["requests"] == 2
+    assert app.config['PROFILER'].session is None
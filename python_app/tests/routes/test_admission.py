@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+import pytest
+from python_app.app import app
+from python_app.routes.admission import AdmissionController, Rejected, TokenBucket, client_id
+from python_app.tests.routes.test_asgi_app import application, call_asgi
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_token_bucket_refills_at_its_rate():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.take() == 0
+
+def test_client_rate_limit_is_per_client():
+    controller = AdmissionController(client_rate=1, client_burst=2, clock=Clock())
+    controller.acquire("alice").release()
+    controller.acquire("alice").release()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("alice")
+    assert (rejected.value.status, rejected.value.retry_after) == (429, 1)
+    controller.acquire("bob").release()
+    assert controller.stats().rejected_client_rate == 1
+
+def test_global_rate_limit_answers_503():
+    controller = AdmissionController(global_rate=10, global_burst=1, clock=Clock())
+    controller.acquire("alice").release()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("bob")
+    assert rejected.value.status == 503 and controller.stats().rejected_global_rate == 1
+
+def test_rejected_requests_do_not_spend_client_tokens():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, global_rate=1, global_burst=1,
+                                     client_rate=1, client_burst=1, clock=Clock())
+    controller.acquire("bob").release()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("alice")
+    assert rejected.value.status == 503
+    # Alice's token was given back, so she is turned away by the server again rather than as a client
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("alice")
+    assert rejected.value.status == 503
+    assert controller.stats().rejected_client_rate == 0
+
+def test_queued_request_gets_the_released_slot():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_queue_wait_seconds=5)
+    held = controller.acquire("a")
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire("b")))
+    waiter.start()
+    while controller.stats().queued == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire("c")
+    assert rejected.value.status == 503 and rejected.value.retry_after == 5
+
+    held.release()
+    waiter.join(1)
+    stats = controller.stats()
+    assert admitted and stats.in_flight == 1 and stats.queued == 0
+    assert (stats.admitted, stats.admitted_after_wait, stats.rejected_queue_full) == (2, 1, 1)
+    admitted[0].release()
+    admitted[0].release() # a second release is a no-op
+    assert controller.stats().in_flight == 0
+
+def test_queue_wait_times_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, max_queue_wait_seconds=0.02)
+    with controller.acquire("a"):
+        with pytest.raises(Rejected):
+            controller.acquire("b")
+    stats = controller.stats()
+    assert (stats.rejected_queue_timeout, stats.queued, stats.in_flight) == (1, 0, 0)
+
+def test_async_waiters_share_slots_with_threads():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, max_queue_wait_seconds=5)
+
+    async def run():
+        held = controller.acquire("thread")
+        queued = asyncio.ensure_future(controller.aacquire("loop"))
+        cancelled = asyncio.ensure_future(controller.aacquire("gone"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        threading.Timer(0.01, held.release).start()
+        permit = await queued
+        permit.release()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(run())
+    stats = controller.stats()
+    assert (stats.in_flight, stats.queued, stats.admitted) == (0, 0, 2)
+
+def test_client_id_prefers_the_configured_header():
+    headers = {"X-Forwarded-For": "203.0.113.7"}
+    assert client_id("10.0.0.1", headers, "X-Forwarded-For") == "203.0.113.7"
+    assert client_id("10.0.0.1", headers) == "10.0.0.1"
+
+def test_client_id_ignores_entries_the_client_wrote_itself():
+    # The client sent "198.51.100.9"; our proxy appended the address it saw, 203.0.113.7
+    headers = {"X-Forwarded-For": "198.51.100.9, 203.0.113.7"}
+    assert client_id("10.0.0.1", headers, "X-Forwarded-For") == "203.0.113.7"
+    assert client_id("10.0.0.1", headers, "X-Forwarded-For", trusted_hops=2) == "198.51.100.9"
+    # Fewer entries than proxies: the header didn't come through them all
+    assert client_id("10.0.0.1", headers, "X-Forwarded-For", trusted_hops=3) == "10.0.0.1"
+
+def test_flask_chat_is_rejected_with_retry_after(monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMISSION_CONTROLLER', AdmissionController(max_concurrent=0, max_queue=0))
+    with app.test_client() as client:
+        response = client.post('/curl/chat', json={"message": "hi"})
+    assert response.status_code == 503 and response.headers['Retry-After'] == "5"
+    assert response.get_json() == {"error": "Server is at capacity"}
+
+def test_flask_stream_holds_its_permit_until_closed(monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setitem(app.config, 'ADMISSION_CONTROLLER', controller)
+    with app.test_client() as client:
+        streamed = client.post('/ollama/api/chat', json={"messages": [{"role": "user", "content": "hi"}], "stream": True},
+                               buffered=False)
+        assert controller.stats().in_flight == 1
+        streamed.close()
+    assert controller.stats().in_flight == 0
+
+def test_asgi_chat_is_admission_controlled(application):
+    application.admission = AdmissionController(max_concurrent=1, max_queue=0)
+
+    async def run():
+        return await asyncio.gather(*(call_asgi(application, 'POST', '/curl/chat', {"message": f"hi {i}"}) for i in range(3)))
+
+    statuses = sorted(status for status, _ in asyncio.run(run()))
+    assert statuses == [200, 503, 503]
+    assert application.admission.stats().in_flight == 0
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import pytest
+from python_app.agents.latency_fake_chat_model import LatencyFakeListChatModel
+from python_app.agents.storage_agent import PythonStorageAgent
+from python_app.asgi import AsyncChatApplication
+from python_app.llm_orchestrator import PythonLLMOrchestrator
+
+async def call_asgi(application, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': []}
+    await application(scope, receive, send)
+    status = sent[0]['status']
+    response_body = b''.join(message.get('body', b'') for message in sent[1:])
+    return status, response_body
+
+@pytest.fixture
+def application():
+    chat_model = LatencyFakeListChatModel(responses=["async reply"], latency=0.05)
+    orchestrator = PythonLLMOrchestrator(storage_agent=PythonStorageAgent(chat_model=chat_model))
+
+    async def fallback(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    return AsyncChatApplication(orchestrator=orchestrator, fallback_app=fallback)
+
+def test_curl_chat_is_served_async(application):
+    status, body = asyncio.run(call_asgi(application, 'POST', '/curl/chat', {"message": "hi"}))
+    assert status == 200
+    assert json.loads(body) == {"reply": "async reply"}
+
+def test_curl_chat_missing_message(application):
+    status, body = asyncio.run(call_asgi(application, 'POST', '/curl/chat', {"wrong_field": "x"}))
+    assert status == 400
+    assert json.loads(body)["error"] == "Missing message"
+
+def test_ollama_chat_streams_ndjson(application):
+    payload = {"messages": [{"role": "user", "content": "hi"}], "stream": True}
+    status, body = asyncio.run(call_asgi(application, 'POST', '/ollama/api/chat', payload))
+    assert status == 200
+    chunks = [json.loads(line) for line in body.decode().splitlines()]
+    assert chunks[-1]["done"] is True
+    assert "".join(chunk["message"]["content"] for chunk in chunks[:-1]) == "async reply"
+
+def test_other_routes_fall_back(application):
+    status, _ = asyncio.run(call_asgi(application, 'GET', '/ollama/api/version'))
+    assert status == 404
+
+def test_concurrent_model_calls_overlap(application):
+    async def many():
+        return await asyncio.gather(*[
+            call_asgi(application, 'POST', '/curl/chat', {"message": f"hi {i}"}) for i in range(50)
+        ])
+
+    loop = asyncio.new_event_loop()
+    try:
+        started = loop.time()
+        results = loop.run_until_complete(many())
+        elapsed = loop.time() - started
+    finally:
+        loop.close()
+    assert all(status == 200 for status, _ in results)
+    # 50 sequential calls would take 2.5s; overlapping calls finish in roughly one latency period
+    assert elapsed < 1.0
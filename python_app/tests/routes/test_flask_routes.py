@@ -88,3 +88,35 @@ def test_get_ollama_tags(client):
     assert "models" in data
     assert len(data["models"]) > 0 # Mock returns one model
     assert data["models"][0]["name"] == "workshop_py:latest"
+
+def test_post_ollama_chat_streaming(client):
+    request_data = {"messages": [{"role": "user", "content": "Hello Ollama from test"}], "stream": True}
+    response = client.post('/ollama/api/chat', json=request_data)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+
+    chunks = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+    assert len(chunks) > 1
+    assert all(not chunk["done"] for chunk in chunks[:-1])
+    final_chunk = chunks[-1]
+    assert final_chunk["done"] is True
+    assert final_chunk["done_reason"] == "stop"
+    assert final_chunk["eval_count"] == len(chunks) - 1
+    assert final_chunk["total_duration"] >= final_chunk["eval_duration"]
+
+    # FakeListChatModel streams its canned reply character by character
+    fake_responses_from_app = [
+        "I am a fake LLM. You said: pantry stuff. My system prompt makes me confused.",
+        "You asked about chat. I am still a fake LLM, and quite confused.",
+        "Regarding your query: As a confused LLM, I can only offer generic advice."
+    ]
+    streamed_content = "".join(chunk["message"]["content"] for chunk in chunks[:-1])
+    assert streamed_content in fake_responses_from_app
+
+def test_post_ollama_chat_stream_false_returns_single_response(client):
+    request_data = {"messages": [{"role": "user", "content": "Hello"}], "stream": False}
+    response = client.post('/ollama/api/chat', json=request_data)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data["done"] is True
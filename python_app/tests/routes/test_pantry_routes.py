@@ -0,0 +1,113 @@
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import python_app.app as app_module
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.cli import pantry_cli
+from python_app.routes.pantry_routes import MIMETYPES
+from python_app.services import pantry_transfer
+from python_app.services.pantry_service import LineItem, PantryEntry
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    # Requests get their g.db_session from SessionLocal, so point it at a private in-memory database
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(app_module, "SessionLocal", session_factory)
+    monkeypatch.setitem(app_module.app.config, "SESSION_FACTORY", session_factory)
+    yield session_factory
+    Base.metadata.drop_all(engine)
+
+@pytest.fixture
+def client(session_factory):
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+def stored(session_factory):
+    with session_factory() as session:
+        return {entry.name: (entry.amount, entry.unit) for entry in SqlAlchemyDurablePantryAdapter(session).find_all()}
+
+def progress_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_import_ndjson_in_chunks(client, session_factory):
+    body = "".join(json.dumps({"name": f"item {i}", "amount": i, "unit": "g"}) + "\n" for i in range(5))
+    response = client.post('/pantry/import?chunk_size=2', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    lines = progress_lines(response)
+    assert [line["rows_saved"] for line in lines] == [2, 4, 5, 5]
+    assert lines[-1]["done"] is True
+    assert stored(session_factory) == {f"item {i}": (float(i), "g") for i in range(5)}
+
+def test_import_csv_updates_existing(client, session_factory):
+    with session_factory() as session:
+        SqlAlchemyDurablePantryAdapter(session).save_all([PantryEntry(name="flour", amount=1.0, unit="kg")])
+    body = "name,amount,unit\nflour,2.5,kg\nsugar,500,g\n"
+    response = client.post('/pantry/import', data=body, content_type='text/csv')
+    assert progress_lines(response)[-1] == {"done": True, "rows_read": 2, "rows_saved": 2, "chunks": 1}
+    assert stored(session_factory) == {"flour": (2.5, "kg"), "sugar": (500.0, "g")}
+
+def test_import_reports_invalid_row_in_band(client, session_factory):
+    body = '{"name": "flour", "amount": 1, "unit": "kg"}\n{"name": "sugar", "amount": -1, "unit": "g"}\n'
+    response = client.post('/pantry/import?chunk_size=1', data=body)
+    last = progress_lines(response)[-1]
+    assert "Row 2" in last["error"]
+    assert last["rows_saved"] == 1 # the chunk before the bad row stays committed
+    assert stored(session_factory) == {"flour": (1.0, "kg")}
+
+def test_import_rejects_unknown_format(client):
+    response = client.post('/pantry/import?format=xml', data="")
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("format", ["ndjson", "csv"])
+def test_export_round_trips_through_import(client, session_factory, format):
+    with session_factory() as session:
+        SqlAlchemyDurablePantryAdapter(session).save_all([
+            PantryEntry(name="flour", amount=1.5, unit="kg"),
+            PantryEntry(name="milk, whole", amount=2.0, unit="liter"),
+        ])
+    exported = client.get(f'/pantry/export?format={format}')
+    assert exported.status_code == 200
+    assert exported.mimetype == MIMETYPES[format]
+
+    items = list(pantry_transfer.parse(exported.get_data(as_text=True).splitlines(keepends=True), format))
+    assert items == [LineItem("flour", 1.5, "kg"), LineItem("milk, whole", 2.0, "liter")]
+
+def test_parse_csv_requires_columns():
+    with pytest.raises(pantry_transfer.PantryImportError):
+        list(pantry_transfer.parse_csv(["name,unit\n", "flour,kg\n"]))
+
+def test_cli_import_then_export(session_factory, tmp_path):
+    source = tmp_path / "pantry.csv"
+    source.write_text("name,amount,unit\nrice,2,kg\n", encoding="utf-8")
+    runner = app_module.app.test_cli_runner()
+
+    result = runner.invoke(pantry_cli, ["import", str(source)])
+    assert result.exit_code == 0, result.output
+    assert stored(session_factory) == {"rice": (2.0, "kg")}
+
+    result = runner.invoke(pantry_cli, ["export", "--format", "ndjson"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.stdout)["name"] == "rice"
+
+def test_usage_and_history(client, session_factory, monkeypatch):
+    monkeypatch.setattr(app_module.settings, "PANTRY_LEDGER_ENABLED", True)
+    client.post('/pantry/import', data='{"name": "flour", "amount": 1000, "unit": "g"}\n')
+    with session_factory() as session:
+        SqlAlchemyDurablePantryAdapter(session, ledger=True).use_all([LineItem(name="flour", amount=250.0, unit="g")])
+
+    usage = client.get('/pantry/usage').get_json()
+    assert usage["totals"] == [{"name": "flour", "unit": "g", "added": 1000.0, "used": 250.0, "events": 2}]
+    history = client.get('/pantry/history/flour?start=2000-01-01T00:00:00').get_json()
+    assert [(event["kind"], event["delta"]) for event in history["events"]] == [("set", 1000.0), ("use", -250.0)]
+    assert client.get('/pantry/usage?start=yesterday').status_code == 400
+
+def test_usage_without_ledger_is_not_implemented(client):
+    response = client.get('/pantry/usage')
+    assert response.status_code == 501
+    assert "ledger" in response.get_json()["error"]
@@ -0,0 +1,69 @@
+import dataclasses
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
+import pytest
+import python_app.app as app_module
+from python_app.routes import serialization
+from python_app.routes.request_models import (ModelDetails, ModelInfo, OllamaChatResponse, OllamaMessage, OllamaToolCall,
+                                              OllamaToolCallFunction, TagsResponse)
+
+@pytest.fixture
+def client():
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+def test_none_and_empty_tool_calls_are_left_out():
+    response = OllamaChatResponse(model="m", created_at="t", message=OllamaMessage(role="assistant", content="hi"), done=False)
+    assert json.loads(serialization.to_json(response)) == {
+        "model": "m", "created_at": "t", "message": {"role": "assistant", "content": "hi"}, "done": False
+    }
+
+def test_nested_lists_and_datetimes():
+    call = OllamaToolCall(function=OllamaToolCallFunction(name="lookup", arguments={"item": "flour", "limit": 2}))
+    message = OllamaMessage(role="assistant", content="", tool_calls=[call])
+    details = ModelDetails(format="gguf", family="f", parameter_size="7B", quantization_level="Q4_0", families=["f"])
+    model = ModelInfo(name="n", model="n", modified_at="t", size=1, digest="d", details=details,
+                      expires_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+    assert serialization.to_dict(message)["tool_calls"] == [{"function": {"name": "lookup", "arguments": {"item": "flour", "limit": 2}}}]
+    assert serialization.to_dict(TagsResponse(models=[model]))["models"][0] == {
+        "name": "n", "model": "n", "modified_at": "t", "size": 1, "digest": "d",
+        "details": {"format": "gguf", "family": "f", "parameter_size": "7B", "quantization_level": "Q4_0", "families": ["f"]},
+        "expires_at": "2026-01-01T00:00:00+00:00",
+    }
+
+def test_matches_asdict_apart_from_omitted_fields():
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        label: Optional[str] = None
+
+    @dataclasses.dataclass
+    class Shape:
+        points: List[Point]
+        closed: bool = False
+
+    shape = Shape(points=[Point(1, "a"), Point(2)], closed=True)
+    expected = dataclasses.asdict(shape)
+    del expected["points"][1]["label"]
+    assert serialization.to_dict(shape) == expected
+    assert serialization.serializer_for(Shape) is serialization.serializer_for(Shape)
+
+def test_stdlib_encoder_produces_the_same_json():
+    value = {"content": "crème", "n": [1, 2.5, None, True]}
+    assert json.loads(serialization._stdlib_dumps(value)) == json.loads(serialization.dumps(value))
+    assert serialization._stdlib_dumps(value) == '{"content":"crème","n":[1,2.5,null,true]}'.encode()
+
+@pytest.mark.parametrize("path", ['/ollama/api/tags', '/ollama/api/version'])
+def test_precomputed_bodies_support_etags(client, path):
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers["ETag"]
+    assert client.get(path).data == first.data
+
+    cached = client.get(path, headers={"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert client.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
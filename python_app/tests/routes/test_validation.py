@@ -0,0 +1,79 @@
+import asyncio
+import json
+import pytest
+from python_app.app import app
+from python_app.routes.request_models import CurlChatRequest, OllamaChatRequest, OllamaMessage, OllamaToolCall
+from python_app.routes.validation import (MissingField, PayloadTooLarge, RequestLimits, ValidationError, parse,
+                                          parse_json)
+from python_app.tests.routes.test_asgi_app import application, call_asgi
+
+def test_builds_nested_request_objects():
+    chat = parse(OllamaChatRequest, {
+        "model": "llama3", "stream": True, "options": {"temperature": 1}, "format": {"type": "object"}, "tools": [],
+        "messages": [
+            {"role": "user", "content": "what's in the pantry?"},
+            {"role": "assistant", "tool_calls": [{"function": {"name": "list_pantry", "arguments": {"unit": "g"}}}]},
+        ],
+    })
+
+    assert chat.stream is True and chat.options.temperature == 1.0 and chat.format == {"type": "object"}
+    assert chat.messages[0] == OllamaMessage(role="user", content="what's in the pantry?")
+    assert isinstance(chat.messages[1].tool_calls[0], OllamaToolCall)
+    assert chat.messages[1].tool_calls[0].function.arguments == {"unit": "g"}
+    assert chat.messages[1].content == "" and chat.keep_alive is None
+
+def test_defaults_are_not_shared_between_requests():
+    first, second = parse(OllamaChatRequest, {}), parse(OllamaChatRequest, {})
+    first.messages.append(OllamaMessage(role="user"))
+    assert second.messages == []
+
+@pytest.mark.parametrize("payload, error", [
+    ({"messages": [{"role": "user", "content": 5}]}, "messages[0].content: expected a string"),
+    ({"messages": [{"role": "user"}, {"content": "x"}]}, "messages[1].role: is required"),
+    ({"messages": {"role": "user"}}, "messages: expected an array"),
+    ({"messages": [], "stream": "yes"}, "stream: expected a boolean"),
+    ({"options": {"temperature": True}}, "options.temperature: expected a number"),
+    ({"keep_alive": [5]}, "keep_alive: expected a number"),
+    ({"messages": [{"role": "assistant", "tool_calls": [{"function": {"name": "f", "arguments": "{}"}}]}]},
+     "messages[0].tool_calls[0].function.arguments: expected an object"),
+    (["not", "an", "object"], "expected an object"),
+])
+def test_errors_name_the_offending_value(payload, error):
+    with pytest.raises(ValidationError) as raised:
+        parse(OllamaChatRequest, payload)
+    assert str(raised.value) == error
+
+def test_limits_are_checked_before_parsing():
+    limits = RequestLimits(max_body_bytes=64, max_messages=2, max_content_chars=5)
+    with pytest.raises(PayloadTooLarge):
+        parse_json(CurlChatRequest, b'{"message": "' + b"x" * 100 + b'"}', limits)
+    with pytest.raises(ValidationError, match=r"^messages: more than 2 items$"):
+        parse(OllamaChatRequest, {"messages": [{"role": "user"}] * 3}, limits)
+    with pytest.raises(ValidationError, match=r"^message: more than 5 characters$"):
+        parse(CurlChatRequest, {"message": "too long"}, limits)
+    with pytest.raises(MissingField):
+        parse_json(CurlChatRequest, b'{"memory_id": "abc"}', limits)
+    with pytest.raises(ValidationError, match="invalid JSON"):
+        parse_json(CurlChatRequest, b'{"message": ', limits)
+
+def test_flask_routes_reject_bad_payloads():
+    limits = app.config['REQUEST_LIMITS']
+    with app.test_client() as client:
+        response = client.post('/ollama/api/chat', json={"messages": [{"role": "user", "content": ["hi"]}]})
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Request parsing error: messages[0].content: expected a string"
+
+        response = client.post('/curl/chat', json={"message": 42})
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Invalid request format: message: expected a string"
+
+        response = client.post('/curl/chat', data=b'{"message": "' + b"x" * limits.max_body_bytes + b'"}',
+                               content_type='application/json')
+        assert response.status_code == 413
+
+def test_asgi_rejects_oversized_body(application):
+    application.limits = RequestLimits(max_body_bytes=32)
+    status, body = asyncio.run(call_asgi(application, 'POST', '/ollama/api/chat',
+                                         {"messages": [{"role": "user", "content": "x" * 64}]}))
+    assert status == 413
+    assert "larger than 32 bytes" in json.loads(body)["error"]
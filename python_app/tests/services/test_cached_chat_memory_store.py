@@ -0,0 +1,165 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from python_app.models import Base
+from python_app.models.chat_memory_model import ChatMessageModel
+from python_app.services.cached_chat_memory_store import CachedChatMemoryStore
+from python_app.services.chat_memory_store import PythonChatMemoryStore
+
+@pytest.fixture
+def session_factory():
+    # StaticPool shares the one in-memory database between the store's sessions and the test's
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.drop_all(engine)
+
+@pytest.fixture
+def store(session_factory):
+    # A long interval keeps the background flusher out of the way; tests flush explicitly
+    store = CachedChatMemoryStore(session_factory, capacity=2, flush_interval_seconds=60, flush_threshold=1000)
+    yield store
+    store.close()
+
+def stored_messages(session_factory, memory_id):
+    with session_factory() as session:
+        return PythonChatMemoryStore(session).get_messages(memory_id)
+
+def message(content):
+    return {"role": "user", "content": content}
+
+def test_writes_are_served_from_memory_before_flush(store, session_factory):
+    store.update_messages("m1", [message("a")])
+    store.append_messages("m1", [message("b")])
+    assert store.get_messages("m1") == [message("a"), message("b")]
+    assert stored_messages(session_factory, "m1") == []
+    assert store.stats().hits == 1
+
+def test_flush_coalesces_writes_per_conversation(store, session_factory):
+    store.update_messages("m1", [message("a")])
+    store.append_messages("m1", [message("b")])
+    store.append_messages("m1", [message("c")])
+    store.append_messages("m2", [message("x")])
+    assert store.flush() == 2
+    assert stored_messages(session_factory, "m1") == [message("a"), message("b"), message("c")]
+    assert stored_messages(session_factory, "m2") == [message("x")]
+    assert store.stats().flushes == 1
+
+def test_cold_read_overlays_pending_appends(store, session_factory):
+    with session_factory() as session:
+        PythonChatMemoryStore(session).append_messages("m1", [message("stored")])
+    store.append_messages("m1", [message("pending")])
+    assert store.get_messages("m1") == [message("stored"), message("pending")]
+    assert store.get_messages("m1", last_n=1) == [message("pending")]
+    assert store.stats().misses == 1
+
+def test_delete_is_written_behind(store, session_factory):
+    with session_factory() as session:
+        PythonChatMemoryStore(session).append_messages("m1", [message("stored")])
+    store.delete_messages("m1")
+    assert store.get_messages("m1") == []
+    store.flush()
+    with session_factory() as session:
+        assert session.query(ChatMessageModel).filter_by(memory_id="m1").count() == 0
+
+def test_lru_evicts_but_keeps_pending_writes(store, session_factory):
+    for memory_id in ["m1", "m2", "m3"]:
+        store.update_messages(memory_id, [message(memory_id)])
+    assert store.stats().evictions == 1
+    # m1 was evicted from the cache but its write is still queued
+    assert store.get_messages("m1") == [message("m1")]
+    store.flush()
+    assert stored_messages(session_factory, "m1") == [message("m1")]
+
+def test_size_threshold_triggers_background_flush(session_factory):
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60, flush_threshold=2)
+    try:
+        store.append_messages("m1", [message("a")])
+        store.append_messages("m2", [message("b")])
+        for _ in range(200):
+            if store.stats().flushes:
+                break
+            store._flusher.join(0.01)
+        assert store.stats().flushes == 1
+        assert stored_messages(session_factory, "m2") == [message("b")]
+    finally:
+        store.close()
+
+def test_close_flushes_queued_writes(session_factory):
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60)
+    store.append_messages("m1", [message("a")])
+    store.close()
+    assert stored_messages(session_factory, "m1") == [message("a")]
+    with pytest.raises(RuntimeError):
+        store.append_messages("m1", [message("b")])
+
+@pytest.fixture
+def poisoned(monkeypatch):
+    # The database rejects every write to the "poison" conversation
+    append_messages = PythonChatMemoryStore.append_messages
+    def append_unless_poisoned(self, memory_id, messages):
+        if memory_id == "poison":
+            raise ValueError("rejected")
+        return append_messages(self, memory_id, messages)
+    monkeypatch.setattr(PythonChatMemoryStore, "append_messages", append_unless_poisoned)
+
+def test_flush_writes_other_conversations_past_a_failing_one(session_factory, poisoned):
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60, max_flush_attempts=3)
+    try:
+        store.append_messages("m1", [message("a")])
+        store.append_messages("poison", [message("x")])
+        store.append_messages("m2", [message("b")])
+        assert store.flush() == 2
+        assert stored_messages(session_factory, "m1") == [message("a")]
+        assert stored_messages(session_factory, "m2") == [message("b")]
+        assert store.stats().flush_failures == 1
+        # Only the failed conversation is queued again
+        store.append_messages("poison", [message("y")])
+        store.append_messages("m1", [message("c")])
+        assert store.flush() == 1
+        assert stored_messages(session_factory, "m1") == [message("a"), message("c")]
+        assert store.get_messages("poison") == [message("x"), message("y")]
+    finally:
+        store.close()
+
+def test_flush_drops_a_conversation_that_keeps_failing(session_factory, poisoned, caplog):
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60, max_flush_attempts=2)
+    try:
+        for attempt in range(2):
+            store.append_messages("poison", [message("x")])
+            store.append_messages("m1", [message(str(attempt))])
+            assert store.flush() == 1
+        assert store.stats().dropped_conversations == 1
+        assert "Dropping queued chat memory writes for poison" in caplog.text
+        assert store.flush() == 0
+        assert store.get_messages("poison") == []
+    finally:
+        store.close()
+
+def test_flush_keeps_every_write_queued_while_nothing_can_be_written(session_factory, monkeypatch):
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60, max_flush_attempts=1)
+    try:
+        store.append_messages("m1", [message("a")])
+        store.append_messages("m2", [message("b")])
+        original = PythonChatMemoryStore.append_messages
+        def unavailable(self, memory_id, messages):
+            raise ValueError("database unavailable")
+        monkeypatch.setattr(PythonChatMemoryStore, "append_messages", unavailable)
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                store.flush()
+        assert store.stats().dropped_conversations == 0
+        monkeypatch.setattr(PythonChatMemoryStore, "append_messages", original)
+        assert store.flush() == 2
+        assert stored_messages(session_factory, "m1") == [message("a")]
+    finally:
+        store.close()
+
+def test_delete_notifies_on_delete(session_factory):
+    deleted = []
+    store = CachedChatMemoryStore(session_factory, flush_interval_seconds=60, on_delete=deleted.append)
+    store.update_messages("m1", [message("a")])
+    store.delete_messages("m1")
+    store.close()
+    assert deleted == ["m1"]
@@ -1,10 +1,11 @@
 import pytest
 import uuid
 import json # Added import for json
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
 from python_app.models import Base # Assuming Base is in python_app/models/__init__.py
-from python_app.models.chat_memory_model import ChatMemoryModel
+from python_app.models.chat_memory_model import ChatMemoryModel, ChatMessageModel
+from python_app.models.migrations import migrate_chat_memory_blobs
 from python_app.services.chat_memory_store import PythonChatMemoryStore
 
 @pytest.fixture(scope="function") # New DB and session for each test function
@@ -30,10 +31,9 @@ def test_update_messages_new_id(chat_memory_store: PythonChatMemoryStore, db_ses
     chat_memory_store.update_messages(memory_id, messages_data)
     
     # Verify directly in DB
-    entry = db_session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
-    assert entry is not None
-    assert entry.memory_id == memory_id
-    assert json.loads(entry.json_messages) == messages_data
+    rows = db_session.query(ChatMessageModel).filter_by(memory_id=memory_id).order_by(ChatMessageModel.seq).all()
+    assert [row.seq for row in rows] == [0]
+    assert [json.loads(row.json_message) for row in rows] == messages_data
 
 def test_get_messages_existing_id(chat_memory_store: PythonChatMemoryStore, db_session: Session):
     memory_id = "test_mem_2"
@@ -60,9 +60,21 @@ def test_update_messages_existing_id(chat_memory_store: PythonChatMemoryStore, d
     updated_messages_data = [{"role": "user", "content": "First message"}, {"role": "ai", "content": "Second message"}]
     chat_memory_store.update_messages(memory_id, updated_messages_data) # This updates the existing entry
     
-    entry = db_session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
-    assert entry is not None # Ensure entry still exists
-    assert json.loads(entry.json_messages) == updated_messages_data
+    rows = db_session.query(ChatMessageModel).filter_by(memory_id=memory_id).order_by(ChatMessageModel.seq).all()
+    assert [json.loads(row.json_message) for row in rows] == updated_messages_data
+    # The first message was kept in place and only the new one appended
+    assert rows[0].id < rows[1].id
+
+def test_update_messages_rewrites_a_history_edited_in_the_middle(chat_memory_store: PythonChatMemoryStore, db_session: Session):
+    memory_id = "test_mem_edited"
+    a, b, c, d = ({"role": "user", "content": text} for text in "abcd")
+    chat_memory_store.update_messages(memory_id, [a, b, c])
+    edited = {"role": "user", "content": "EDITED"}
+    chat_memory_store.update_messages(memory_id, [a, edited, c, d])
+
+    rows = db_session.query(ChatMessageModel).filter_by(memory_id=memory_id).order_by(ChatMessageModel.seq).all()
+    assert [json.loads(row.json_message) for row in rows] == [a, edited, c, d]
+    assert [row.seq for row in rows] == [0, 1, 2, 3]
 
 def test_delete_messages_existing_id(chat_memory_store: PythonChatMemoryStore, db_session: Session):
     memory_id = "test_mem_4"
@@ -75,6 +87,7 @@ def test_delete_messages_existing_id(chat_memory_store: PythonChatMemoryStore, d
     
     entry = db_session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first()
     assert entry is None
+    assert db_session.query(ChatMessageModel).filter_by(memory_id=memory_id).count() == 0
 
 def test_delete_messages_non_existing_id(chat_memory_store: PythonChatMemoryStore):
     # Should not raise an error
@@ -82,3 +95,73 @@ def test_delete_messages_non_existing_id(chat_memory_store: PythonChatMemoryStor
         chat_memory_store.delete_messages("non_existent_mem_del")
     except Exception as e:
         pytest.fail(f"Deleting non-existing memory ID raised an exception: {e}")
+
+def test_get_messages_existing_id_migrates_legacy_blob(chat_memory_store: PythonChatMemoryStore, db_session: Session):
+    memory_id = "test_mem_legacy"
+    messages_data = [{"role": "user", "content": "one"}, {"role": "ai", "content": "two"}]
+    db_session.add(ChatMemoryModel(id=uuid.uuid4(), memory_id=memory_id, json_messages=json.dumps(messages_data)))
+    db_session.commit()
+
+    assert chat_memory_store.get_messages(memory_id) == messages_data
+    assert db_session.query(ChatMemoryModel).filter_by(memory_id=memory_id).first() is None
+    assert db_session.query(ChatMessageModel).filter_by(memory_id=memory_id).count() == 2
+
+def test_append_messages(chat_memory_store: PythonChatMemoryStore):
+    memory_id = "test_mem_append"
+    chat_memory_store.append_messages(memory_id, [{"role": "user", "content": "a"}])
+    chat_memory_store.append_messages(memory_id, [{"role": "ai", "content": "b"}, {"role": "user", "content": "c"}])
+    assert [m["content"] for m in chat_memory_store.get_messages(memory_id)] == ["a", "b", "c"]
+    assert chat_memory_store.count_messages(memory_id) == 3
+
+def test_concurrent_append_takes_the_next_seq(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    Base.metadata.create_all(engine)
+    other_writer = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'chat.db'}"))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def append_first(conn, cursor, statement, parameters, context, executemany):
+        # Another worker appends to the same conversation just before this append writes
+        if statement.startswith("INSERT INTO chat_message") and not getattr(append_first, "done", False):
+            append_first.done = True
+            with other_writer() as session:
+                PythonChatMemoryStore(session).append_messages("m1", [{"role": "user", "content": "a"}])
+
+    with sessionmaker(bind=engine)() as session:
+        store = PythonChatMemoryStore(session)
+        store.append_messages("m1", [{"role": "ai", "content": "b"}, {"role": "user", "content": "c"}])
+        assert [m["content"] for m in store.get_messages("m1")] == ["a", "b", "c"]
+
+def test_legacy_lookup_stops_once_the_table_is_empty(chat_memory_store: PythonChatMemoryStore, db_session: Session):
+    chat_memory_store.append_messages("m1", [{"role": "user", "content": "a"}])
+    legacy_queries = []
+    event.listen(db_session.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: legacy_queries.append(statement) if "chat_memory " in statement else None)
+
+    chat_memory_store.get_messages("m1")
+    chat_memory_store.append_messages("m1", [{"role": "user", "content": "b"}])
+    assert legacy_queries == []
+
+def test_get_last_n_messages(chat_memory_store: PythonChatMemoryStore):
+    memory_id = "test_mem_last_n"
+    chat_memory_store.append_messages(memory_id, [{"role": "user", "content": str(i)} for i in range(10)])
+    assert [m["content"] for m in chat_memory_store.get_messages(memory_id, last_n=3)] == ["7", "8", "9"]
+    assert len(chat_memory_store.get_messages(memory_id, last_n=50)) == 10
+
+def test_update_messages_with_different_history_rewrites(chat_memory_store: PythonChatMemoryStore):
+    memory_id = "test_mem_rewrite"
+    chat_memory_store.update_messages(memory_id, [{"role": "user", "content": "a"}, {"role": "ai", "content": "b"}])
+    # A sliding window dropped the oldest message, so this is not an extension of what is stored
+    window = [{"role": "ai", "content": "b"}, {"role": "user", "content": "c"}]
+    chat_memory_store.update_messages(memory_id, window)
+    assert chat_memory_store.get_messages(memory_id) == window
+
+def test_migrate_chat_memory_blobs(db_session: Session):
+    for i in range(3):
+        messages = [{"role": "user", "content": f"conversation {i}"}]
+        db_session.add(ChatMemoryModel(id=uuid.uuid4(), memory_id=f"legacy_{i}", json_messages=json.dumps(messages)))
+    db_session.commit()
+
+    assert migrate_chat_memory_blobs(db_session, batch_size=2) == 3
+    assert db_session.query(ChatMemoryModel).count() == 0
+    assert PythonChatMemoryStore(db_session).get_messages("legacy_1") == [{"role": "user", "content": "conversation 1"}]
+    assert migrate_chat_memory_blobs(db_session) == 0
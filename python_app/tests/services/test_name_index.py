@@ -0,0 +1,108 @@
+import uuid
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.services.name_index import NameIndexRow, PantryNameIndex, TrigramNameIndex, name_trigrams, normalize_name
+from python_app.services.pantry_service import LineItem, PantryEntry, PantryService, StorageRequest, UseFoodRequest
+
+@pytest.fixture
+def adapter():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield SqlAlchemyDurablePantryAdapter(session)
+
+def row(name, entry_id=None):
+    return NameIndexRow(entry_id=entry_id or uuid.uuid4(), name=name, normalized_name=normalize_name(name))
+
+def test_normalize_name():
+    assert normalize_name("Roma Tomatoes!") == "roma tomato"
+    assert normalize_name("  Crème  Fraîche ") == "creme fraiche"
+    assert normalize_name("Cherries") == "cherry"
+    assert normalize_name("glass") == "glass"
+
+def test_name_trigrams_are_padded_per_word():
+    assert name_trigrams("egg") == {"  e", " eg", "egg", "gg "}
+    assert name_trigrams("") == set()
+
+def test_lookup_ranks_closest_names_first():
+    index = TrigramNameIndex()
+    index.add([row("tomato"), row("potato"), row("tomato paste"), row("milk")])
+
+    [matches] = index.lookup_batch(["tomatoes"], k=3)
+    assert [match.name for match in matches] == ["tomato", "tomato paste", "potato"]
+    assert matches[0].score == 1.0
+    assert all(match.score < 1.0 for match in matches[1:])
+
+def test_lookup_respects_min_score_and_unknown_names():
+    index = TrigramNameIndex()
+    index.add([row("tomato"), row("milk")])
+
+    close, unknown = index.lookup_batch(["tomatto", "xyz"], min_score=0.5)
+    assert [match.name for match in close] == ["tomato"]
+    assert unknown == []
+    assert TrigramNameIndex().lookup_batch(["tomato"]) == [[]]
+
+def test_replace_and_remove_entries():
+    index = TrigramNameIndex()
+    flour, sugar = row("flour"), row("sugar")
+    index.add([flour, sugar])
+
+    index.add([row("rye flour", entry_id=flour.entry_id)])
+    index.remove([sugar.entry_id])
+
+    assert len(index) == 1
+    assert index.lookup_batch(["sugar"], min_score=0.1) == [[]]
+    [[match]] = index.lookup_batch(["rye flour"], k=1)
+    assert (match.entry_id, match.name) == (flour.entry_id, "rye flour")
+
+def test_index_compacts_dead_slots():
+    index = TrigramNameIndex()
+    rows = [row(f"item {i}") for i in range(10)]
+    index.add(rows)
+    index.remove(entry.entry_id for entry in rows[:8])
+
+    assert len(index._rows) == 2
+    assert {match.name for match in index.lookup_batch(["item 9"], k=5)[0]} == {"item 8", "item 9"}
+
+def test_sync_fetches_only_new_rows(adapter, mocker):
+    name_index = PantryNameIndex()
+    adapter.save_all([PantryEntry(name="tomato", amount=1.0, unit="kg")])
+    name_index.sync(adapter)
+    assert len(name_index.index) == 1
+
+    fetch = mocker.spy(adapter, "find_name_index_rows")
+    name_index.sync(adapter)
+    fetch.assert_not_called()
+
+    adapter.save_all([PantryEntry(name="basil", amount=1.0, unit="bunch")])
+    name_index.sync(adapter)
+    assert fetch.call_args.kwargs["since_version"] is not None
+    assert [row.name for row in fetch.spy_return] == ["basil"]
+    assert len(name_index.index) == 2
+
+def test_save_food_merges_into_similar_existing_entry(adapter):
+    service = PantryService(adapter, name_index=PantryNameIndex(auto_merge_threshold=0.6))
+    service.save_food(StorageRequest(items=[LineItem(name="tomato", amount=1.0, unit="kg")]))
+
+    service.save_food(StorageRequest(items=[
+        LineItem(name="Tomatoes", amount=2.0, unit="kg"),
+        LineItem(name="basil", amount=1.0, unit="bunch"),
+    ]))
+    service.use_food(UseFoodRequest(items=[LineItem(name="tomatos", amount=0.5, unit="kg")]))
+
+    assert sorted((entry.name, entry.amount) for entry in adapter.find_all()) == [("basil", 1.0), ("tomato", 1.5)]
+
+def test_save_food_does_not_merge_two_items_into_one_entry(adapter):
+    service = PantryService(adapter, name_index=PantryNameIndex(auto_merge_threshold=0.6))
+    service.save_food(StorageRequest(items=[LineItem(name="onion", amount=1.0, unit="pcs")]))
+
+    # "red onion" alone would merge into "onion", but the request sets "onion" itself too
+    service.save_food(StorageRequest(items=[
+        LineItem(name="red onion", amount=2.0, unit="pcs"),
+        LineItem(name="onion", amount=3.0, unit="pcs"),
+    ]))
+
+    assert sorted((entry.name, entry.amount) for entry in adapter.find_all()) == [("onion", 3.0), ("red onion", 2.0)]
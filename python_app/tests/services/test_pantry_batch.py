@@ -0,0 +1,60 @@
+import dataclasses
+import uuid
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.services.pantry_batch import PantryBatch, ids_from_values, new_ids
+from python_app.services.pantry_service import LineItem, PantryEntry
+
+@pytest.fixture
+def adapter():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield SqlAlchemyDurablePantryAdapter(session)
+
+def test_domain_types_are_slotted():
+    entry = PantryEntry(name="flour", amount=1.0, unit="kg")
+    assert not hasattr(entry, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        LineItem(name="flour", amount=1.0, unit="kg").amount = 2.0
+
+def test_new_ids_are_version_4_uuids():
+    ids = [uuid.UUID(bytes=value) for value in new_ids(100).tolist()]
+    assert len(set(ids)) == 100
+    assert all(value.version == 4 and value.variant == uuid.RFC_4122 for value in ids)
+
+def test_ids_keep_trailing_zero_bytes():
+    entry_id = uuid.UUID(bytes=bytes(range(1, 15)) + b"\x00\x00")
+    for values in ([entry_id], [entry_id.hex]):
+        assert [uuid.UUID(bytes=value) for value in ids_from_values(values).tolist()] == [entry_id]
+
+def test_round_trip_through_entries():
+    entries = [PantryEntry(name="crème fraîche", amount=0.2, unit="l", version=3), PantryEntry(name="egg", amount=6.0, unit="pcs")]
+    batch = PantryBatch.from_entries(entries)
+
+    assert len(batch) == 2
+    assert batch.units == ["l", "pcs"]
+    assert list(batch.entries()) == entries
+    assert [entry.version for entry in batch.entries()] == [3, None]
+    assert batch.entry(0).name == "crème fraîche"
+
+def test_take_and_totals():
+    batch = PantryBatch.from_columns(["flour", "milk", "sugar"], [500.0, 1.0, 250.0], ["g", "l", "g"])
+    assert batch.totals_by_unit() == {"g": 750.0, "l": 1.0}
+
+    grams = batch.take(batch.unit_codes == batch.units.index("g"))
+    assert grams.names() == ["flour", "sugar"]
+    assert grams.ids.tolist() == batch.ids[[0, 2]].tolist()
+    assert batch.take(np.array([1])).unit_column() == ["l"]
+
+def test_adapter_reads_and_saves_batches(adapter):
+    saved = adapter.save_batch(PantryBatch.from_columns(["flour", "milk"], [500.0, 1.0], ["g", "l"]))
+    assert sorted(entry.version for entry in saved.entries()) == [1, 1]
+
+    loaded = adapter.find_all_batch()
+    assert sorted(loaded.entries(), key=lambda entry: entry.name) == sorted(saved.entries(), key=lambda entry: entry.name)
+    assert len(adapter.find_all_batch().take(np.array([], dtype=np.int64))) == 0
@@ -1,7 +1,7 @@
 import pytest
 import uuid
 from unittest.mock import Mock # Using unittest.mock.Mock as per instruction
-from python_app.services.pantry_service import PantryService, PantryEntry, LineItem, StorageRequest, UseFoodRequest, DurablePantry
+from python_app.services.pantry_service import PantryService, PantryEntry, LineItem, StorageRequest, UseFoodRequest, DurablePantry, UseOutcome, UseStatus, ConcurrentModificationError
 # pytest-mock provides 'mocker' fixture, but instructions specified unittest.mock.Mock
 
 @pytest.fixture
@@ -84,11 +84,20 @@ def test_save_food_update_item(pantry_service, mock_durable_pantry):
     args, _ = mock_durable_pantry.save_all.call_args
     assert args[0][0].amount == 10.0
 
-def test_save_food_raises_value_error_on_unit_mismatch(pantry_service, mock_durable_pantry):
+def test_save_food_converts_to_stored_unit(pantry_service, mock_durable_pantry):
     existing_item = PantryEntry(id=uuid.uuid4(), name="flour", amount=500.0, unit="g")
     mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
+    mock_durable_pantry.save_all.side_effect = lambda entries: entries
     
-    request_item = LineItem(name="flour", amount=1.0, unit="kg") # Different unit
+    saved_entries = pantry_service.save_food(StorageRequest(items=[LineItem(name="flour", amount=1.5, unit="kg")]))
+    
+    assert saved_entries == [PantryEntry(id=existing_item.id, name="flour", amount=1500.0, unit="g")]
+
+def test_save_food_raises_value_error_on_unconvertible_unit(pantry_service, mock_durable_pantry):
+    existing_item = PantryEntry(id=uuid.uuid4(), name="flour", amount=500.0, unit="g")
+    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
+    
+    request_item = LineItem(name="flour", amount=1.0, unit="pcs") # A count can't become a mass
     request = StorageRequest(items=[request_item])
     
     with pytest.raises(ValueError) as excinfo:
@@ -100,12 +109,11 @@ def test_save_food_raises_value_error_on_unit_mismatch(pantry_service, mock_dura
 
 def test_use_food_item_exists_reduces_quantity(pantry_service, mock_durable_pantry):
     item_id = uuid.uuid4()
-    existing_item = PantryEntry(id=item_id, name="milk", amount=1.0, unit="liter")
-    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item] # Corrected
-    
     use_request = UseFoodRequest(items=[LineItem(name="milk", amount=0.5, unit="liter")])
-    
-    mock_durable_pantry.save_all.side_effect = lambda x: x
+    mock_durable_pantry.use_all.return_value = [
+        UseOutcome(item=use_request.items[0], status=UseStatus.USED,
+                   entry=PantryEntry(id=item_id, name="milk", amount=0.5, unit="liter"))
+    ]
     
     updated_entries = pantry_service.use_food(use_request)
     
@@ -113,60 +121,97 @@ def test_use_food_item_exists_reduces_quantity(pantry_service, mock_durable_pant
     assert updated_entries[0].id == item_id
     assert updated_entries[0].amount == 0.5
     
-    mock_durable_pantry.find_all_where_names_exist.assert_called_once_with(["milk"])
-    mock_durable_pantry.save_all.assert_called_once()
+    # The stock check and decrement are left to the store, in one atomic call
+    mock_durable_pantry.use_all.assert_called_once_with(use_request.items)
+    mock_durable_pantry.find_all_where_names_exist.assert_not_called()
+    mock_durable_pantry.save_all.assert_not_called()
 
 def test_use_food_item_depletes(pantry_service, mock_durable_pantry):
     item_id = uuid.uuid4()
-    existing_item = PantryEntry(id=item_id, name="egg", amount=2.0, unit="pcs")
-    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item] # Corrected
-    
     use_request = UseFoodRequest(items=[LineItem(name="egg", amount=2.0, unit="pcs")])
-    
-    mock_durable_pantry.save_all.side_effect = lambda x: x
+    mock_durable_pantry.use_all.return_value = [
+        UseOutcome(item=use_request.items[0], status=UseStatus.USED,
+                   entry=PantryEntry(id=item_id, name="egg", amount=0.0, unit="pcs"))
+    ]
     
     updated_entries = pantry_service.use_food(use_request)
     
     assert len(updated_entries) == 1
     assert updated_entries[0].id == item_id
     assert updated_entries[0].amount == 0.0
-    
-    mock_durable_pantry.find_all_where_names_exist.assert_called_once_with(["egg"])
-    mock_durable_pantry.save_all.assert_called_once()
 
 def test_use_food_item_not_found(pantry_service, mock_durable_pantry):
-    mock_durable_pantry.find_all_where_names_exist.return_value = []
-    
     use_request = UseFoodRequest(items=[LineItem(name="sugar", amount=100.0, unit="g")])
+    mock_durable_pantry.use_all.return_value = [UseOutcome(item=use_request.items[0], status=UseStatus.NOT_FOUND)]
     
     # Service logic changed: no ValueError, just logs and skips.
     updated_entries = pantry_service.use_food(use_request)
     
     assert len(updated_entries) == 0 # No items should be processed or returned
-    mock_durable_pantry.find_all_where_names_exist.assert_called_once_with(["sugar"])
-    # save_all is called with an empty list if all items are skipped
-    mock_durable_pantry.save_all.assert_called_once_with([])
+    mock_durable_pantry.use_all.assert_called_once_with(use_request.items)
+
+def test_use_food_retries_in_stored_unit_on_unit_mismatch(pantry_service, mock_durable_pantry):
+    existing_item = PantryEntry(id=uuid.uuid4(), name="milk", amount=1.0, unit="liter")
+    use_request = UseFoodRequest(items=[LineItem(name="milk", amount=250.0, unit="ml")])
+    converted = LineItem(name="milk", amount=0.25, unit="liter")
+    used_entry = PantryEntry(id=existing_item.id, name="milk", amount=0.75, unit="liter")
+    mock_durable_pantry.use_all.side_effect = [
+        [UseOutcome(item=use_request.items[0], status=UseStatus.UNIT_MISMATCH, entry=existing_item)],
+        [UseOutcome(item=converted, status=UseStatus.USED, entry=used_entry)],
+    ]
+    
+    assert pantry_service.use_food(use_request) == [used_entry]
+    assert mock_durable_pantry.use_all.call_args_list[1].args == ([converted],)
 
 def test_use_food_raises_value_error_on_unit_mismatch(pantry_service, mock_durable_pantry):
     existing_item = PantryEntry(id=uuid.uuid4(), name="milk", amount=1.0, unit="liter")
-    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
-    
-    use_request = UseFoodRequest(items=[LineItem(name="milk", amount=0.5, unit="ml")]) # Different unit
+    use_request = UseFoodRequest(items=[LineItem(name="milk", amount=0.5, unit="pcs")]) # Not convertible
+    mock_durable_pantry.use_all.return_value = [
+        UseOutcome(item=use_request.items[0], status=UseStatus.UNIT_MISMATCH, entry=existing_item)
+    ]
     
     with pytest.raises(ValueError) as excinfo:
         pantry_service.use_food(use_request)
         
     assert "Unit mismatch for milk" in str(excinfo.value)
-    mock_durable_pantry.save_all.assert_not_called()
+    mock_durable_pantry.use_all.assert_called_once()
 
 def test_use_food_raises_value_error_on_insufficient_quantity(pantry_service, mock_durable_pantry):
     existing_item = PantryEntry(id=uuid.uuid4(), name="rice", amount=500.0, unit="g")
-    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
-    
     use_request = UseFoodRequest(items=[LineItem(name="rice", amount=1000.0, unit="g")]) # Not enough
+    mock_durable_pantry.use_all.return_value = [
+        UseOutcome(item=use_request.items[0], status=UseStatus.INSUFFICIENT, entry=existing_item)
+    ]
     
     with pytest.raises(ValueError) as excinfo:
         pantry_service.use_food(use_request)
         
     assert "Not enough rice" in str(excinfo.value)
-    mock_durable_pantry.save_all.assert_not_called()
+
+def test_save_food_retries_concurrent_modification(mock_durable_pantry):
+    pantry_service = PantryService(durable_pantry=mock_durable_pantry, backoff_seconds=0)
+    existing_item = PantryEntry(id=uuid.uuid4(), name="flour", amount=1.0, unit="kg", version=3)
+    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
+    mock_durable_pantry.save_all.side_effect = [ConcurrentModificationError([existing_item]), [existing_item]]
+
+    result = pantry_service.save_food(StorageRequest(items=[LineItem(name="flour", amount=2.0, unit="kg")]))
+
+    assert result == [existing_item]
+    # The second attempt re-read the entry before writing again
+    assert mock_durable_pantry.find_all_where_names_exist.call_count == 2
+    stats = pantry_service.contention.stats()
+    assert (stats.writes, stats.conflicts, stats.retries, stats.exhausted) == (1, 1, 1, 0)
+    assert stats.hottest() == [("flour", 1)]
+
+def test_save_food_gives_up_after_max_attempts(mock_durable_pantry):
+    pantry_service = PantryService(durable_pantry=mock_durable_pantry, max_attempts=3, backoff_seconds=0)
+    existing_item = PantryEntry(id=uuid.uuid4(), name="flour", amount=1.0, unit="kg", version=3)
+    mock_durable_pantry.find_all_where_names_exist.return_value = [existing_item]
+    mock_durable_pantry.save_all.side_effect = ConcurrentModificationError([existing_item])
+
+    with pytest.raises(ConcurrentModificationError):
+        pantry_service.save_food(StorageRequest(items=[LineItem(name="flour", amount=2.0, unit="kg")]))
+
+    assert mock_durable_pantry.save_all.call_count == 3
+    stats = pantry_service.contention.stats()
+    assert (stats.conflicts, stats.retries, stats.exhausted) == (3, 2, 1)
@@ -0,0 +1,72 @@
+import math
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from python_app.adapters.durable_pantry_adapter import SqlAlchemyDurablePantryAdapter
+from python_app.models import Base
+from python_app.services.pantry_service import LineItem, PantryService, StorageRequest, UseFoodRequest
+from python_app.services.units import UnitConverter, compile_units, normalize_unit
+
+@pytest.fixture
+def converter():
+    return UnitConverter(densities={"Pancake Mix": 0.45})
+
+def test_normalize_unit():
+    assert normalize_unit(" Tablespoons ") == "tbsp"
+    assert normalize_unit("Fl.  Oz.") == "fl. oz"
+    assert normalize_unit("fluid ounces") == "fl oz"
+    assert normalize_unit("bunch") == "bunch"
+
+def test_compile_units_follows_paths_through_the_graph():
+    compiled = compile_units()
+    assert compiled["kg"] == (0, 1000.0)
+    assert compiled["cup"][1] == pytest.approx(236.5882365)
+    assert compiled["dozen"] == (2, 12.0)
+
+def test_compile_units_rejects_units_in_two_dimensions():
+    with pytest.raises(ValueError):
+        compile_units([("kg", "g", 1000.0), ("kg", "ml", 1000.0)])
+
+@pytest.mark.parametrize("amount, from_unit, to_unit, ingredient, expected", [
+    (1.5, "kg", "g", None, 1500.0),
+    (1000.0, "ml", "liter", None, 1.0),
+    (2.0, "tbsp", "tsp", None, 6.0),
+    (1.0, "lb", "g", None, 453.59237),
+    (2.0, "dozen", "pcs", "egg", 24.0),
+    (100.0, "ml", "g", "whole milk", 103.0),
+    (45.0, "g", "ml", "pancake mix", 100.0),
+    (3.0, "bunch", "bunch", "basil", 3.0),
+])
+def test_convert(converter, amount, from_unit, to_unit, ingredient, expected):
+    assert converter.convert(amount, from_unit, to_unit, ingredient) == pytest.approx(expected)
+
+@pytest.mark.parametrize("from_unit, to_unit, ingredient", [
+    ("pcs", "g", "egg"), # count to mass
+    ("ml", "g", "mystery powder"), # no density known
+    ("bunch", "g", "basil"), # unknown unit
+])
+def test_convert_refuses_incompatible_units(converter, from_unit, to_unit, ingredient):
+    assert converter.convert(1.0, from_unit, to_unit, ingredient) is None
+
+def test_convert_batch_marks_failures_with_nan(converter):
+    converted = converter.convert_batch([1.0, 2.0, 240.0], ["kg", "pcs", "ml"], ["g", "g", "cup"], ["rice", "egg", "water"])
+    assert converted[0] == 1000.0
+    assert math.isnan(converted[1])
+    assert converted[2] == pytest.approx(1.01442068)
+    assert len(converter.convert_batch(np.array([]), [], [])) == 0
+
+def test_pantry_service_uses_food_in_other_units():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        adapter = SqlAlchemyDurablePantryAdapter(session)
+        service = PantryService(adapter)
+        service.save_food(StorageRequest(items=[LineItem(name="milk", amount=1.0, unit="l")]))
+
+        service.use_food(UseFoodRequest(items=[LineItem(name="milk", amount=250.0, unit="ml")]))
+        service.save_food(StorageRequest(items=[LineItem(name="milk", amount=1500.0, unit="ml")]))
+        service.use_food(UseFoodRequest(items=[LineItem(name="milk", amount=2.0, unit="cups")]))
+
+        [milk] = adapter.find_all()
+        assert (milk.unit, milk.amount) == ("l", pytest.approx(1.5 - 2 * 0.2365882365))
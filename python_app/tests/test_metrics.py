@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+from sqlalchemy import create_engine, text
+from python_app.app import app
+from python_app.metrics import Histogram, MetricsRegistry, RequestTimings, STAGE_SECONDS, current_timings, instrument_engine, stage_timer, timed, track_request
+from python_app.routes.admission import AdmissionStats
+from python_app.tests.routes.test_asgi_app import application, call_asgi
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("example_seconds", "Example", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.labels("parse").observe(value)
+    assert list(histogram.render()) == [
+        'example_seconds_bucket{stage="parse",le="0.1"} 1',
+        'example_seconds_bucket{stage="parse",le="1.0"} 3',
+        'example_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'example_seconds_sum{stage="parse"} 6.05',
+        'example_seconds_count{stage="parse"} 4',
+    ]
+
+def test_registry_renders_help_type_and_stats_gauges():
+    registry = MetricsRegistry()
+    registry.histogram("example_seconds", "Example").observe(0.2)
+    registry.stats_gauges("example_admission", "Admission", lambda: AdmissionStats(admitted=3))
+    rendered = registry.render().splitlines()
+    assert rendered[:2] == ["# HELP example_seconds Example", "# TYPE example_seconds histogram"]
+    assert "example_admission_admitted 3" in rendered
+    assert "# TYPE example_admission_admitted untyped" in rendered
+
+def test_stage_timer_records_into_the_tracked_request():
+    count_before = STAGE_SECONDS.labels("test_stage").count
+    with track_request() as timings:
+        assert current_timings() is timings
+        with stage_timer("test_stage"):
+            time.sleep(0.01)
+        timed("test_stage")(lambda: None)()
+    assert current_timings() is None
+    assert timings.duration("test_stage") >= 10_000_000
+    assert timings.started("test_stage") >= timings.started_ns
+    assert timings.started("other") is None
+    assert STAGE_SECONDS.labels("test_stage").count == count_before + 2
+
+def test_stage_timer_outside_a_request_only_observes():
+    count_before = STAGE_SECONDS.labels("test_untracked").count
+    with stage_timer("test_untracked"):
+        pass
+    assert STAGE_SECONDS.labels("test_untracked").count == count_before + 1
+
+def test_instrumented_engine_times_statements_as_db():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with track_request() as timings, engine.connect() as connection:
+        connection.execute(text("select 1"))
+    assert timings.duration("db") > 0
+
+def test_request_timings_accumulate_repeated_stages():
+    timings = RequestTimings(started_ns=0)
+    timings.record("db", 10, 5)
+    timings.record("db", 30, 7)
+    assert (timings.started("db"), timings.duration("db")) == (10, 12)
+
+def test_ollama_reply_carries_timing_fields():
+    response = app.test_client().post('/ollama/api/chat', json={
+        "model": "test", "messages": [{"role": "user", "content": "metrics timing"}], "stream": False})
+    assert response.status_code == 200
+    reply = response.get_json()
+    assert reply["total_duration"] > 0
+    if "eval_duration" in reply: # not when the reply came from a cache
+        assert reply["load_duration"] + reply["eval_duration"] <= reply["total_duration"]
+        assert reply["eval_count"] > 0 and reply["prompt_eval_count"] > 0
+
+def test_metrics_endpoint_serves_stage_and_request_histograms():
+    client = app.test_client()
+    client.post('/ollama/api/chat', json={"model": "test", "messages": [{"role": "user", "content": "scrape me"}], "stream": False})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert 'stift_stage_duration_seconds_count{stage="parse"}' in body
+    assert 'stift_stage_duration_seconds_count{stage="orchestrator"}' in body
+    assert 'stift_http_request_duration_seconds_count{endpoint="/ollama/api/chat",method="POST",status="200"}' in body
+    assert 'stift_chat_memory_hits' in body
+
+def test_async_stream_reports_prompt_tokens(application):
+    payload = {"messages": [{"role": "user", "content": "hi"}], "stream": True}
+    status, body = asyncio.run(call_asgi(application, 'POST', '/ollama/api/chat', payload))
+    final = json.loads(body.decode().splitlines()[-1])
+    assert status == 200 and final["done"] is True
+    assert final["prompt_eval_count"] > 0 and final["eval_count"] > 0
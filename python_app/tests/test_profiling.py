@@ -0,0 +1,63 @@
+import threading
+import time
+import pytest
+from python_app.profiling import Profiler, ProfilerBusy, ProfilingSession
+
+def busy_work(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+def test_session_samples_only_watched_threads():
+    session = ProfilingSession(max_requests=1, max_seconds=5, interval_seconds=0.001).start()
+
+    def profiled_request():
+        assert session.request_started(threading.get_ident())
+        busy_work(0.1)
+        session.request_finished(threading.get_ident())
+
+    unprofiled = threading.Thread(target=busy_work, args=(0.1,))
+    unprofiled.start()
+    worker = threading.Thread(target=profiled_request)
+    worker.start()
+    report = session.wait()
+    worker.join()
+    unprofiled.join()
+    assert report.requests == 1 and report.samples > 0
+    functions = {samples.function.rsplit("(", 1)[1] for samples in report.functions}
+    assert "busy_work)" in functions and "profiled_request)" in functions
+    assert all("profiled_request" in stack for stack in report.stacks)
+
+def test_session_stops_taking_requests_at_its_limit():
+    session = ProfilingSession(max_requests=1, max_seconds=5)
+    assert session.request_started(1)
+    assert not session.request_started(2)
+    session.request_finished(1)
+    assert session.done
+
+def test_report_notes_when_an_event_loop_was_sampled():
+    session = ProfilingSession(max_requests=2, max_seconds=5)
+    session.request_started(1)
+    session.request_finished(1)
+    assert session.report().notes == []
+    session.request_started(2, event_loop=True)
+    session.request_finished(2)
+    assert "event loop" in session.report().notes[0]
+
+def test_session_ends_after_max_seconds():
+    report = ProfilingSession(max_seconds=0.05, interval_seconds=0.001).start().wait()
+    assert report.requests == 0 and report.samples == 0
+    assert report.duration_seconds >= 0.05
+
+def test_unarmed_profiler_takes_no_requests():
+    assert Profiler().request_started() is None
+
+def test_one_session_at_a_time():
+    profiler = Profiler()
+    profiler.start(max_requests=1)
+    with pytest.raises(ProfilerBusy):
+        profiler.start()
+    done = profiler.request_started()
+    done()
+    assert profiler.session.done
+    profiler.start(max_requests=1).stop()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+from sqlalchemy import create_engine, text
+from python_app import tracing
+from python_app.app import app
+from python_app.metrics import instrument_engine, stage_timer
+from python_app.tests.routes.test_asgi_app import application, call_asgi
+
+def test_stage_timers_nest_as_spans():
+    with tracing.trace_request() as trace:
+        with stage_timer("orchestrator"):
+            with stage_timer("prompt_build"):
+                pass
+            with stage_timer("model_call"):
+                pass
+        with tracing.span("after"):
+            pass
+    assert [(span.name, span.parent.name if span.parent else None) for span in trace.spans] == [
+        ("orchestrator", None), ("prompt_build", "orchestrator"), ("model_call", "orchestrator"), ("after", None)]
+    assert all(span.duration_ns is not None for span in trace.spans)
+    assert trace.format_tree().splitlines()[1].startswith("  prompt_build +")
+
+def test_no_spans_outside_a_trace():
+    assert tracing.start_span("untraced") is None
+    with stage_timer("untraced") as timer:
+        assert timer.span is None
+    assert tracing.outgoing_headers() == {}
+
+def test_sql_statements_become_db_spans():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with tracing.trace_request() as trace, stage_timer("pantry_store"), engine.connect() as connection:
+        connection.execute(text("select 1"))
+    db_spans = [span for span in trace.spans if span.name == "db"]
+    assert db_spans and db_spans[0].parent.name == "pantry_store"
+    assert trace.totals()["db"] > 0
+
+def test_trace_keeps_at_most_max_spans():
+    with tracing.trace_request(tracing.Trace(max_spans=2)) as trace:
+        for _ in range(3):
+            with tracing.span("step"):
+                pass
+    assert len(trace.spans) == 2 and trace.dropped == 1
+    assert trace.format_tree().endswith("1 more spans not kept")
+
+def test_incoming_trace_id():
+    assert tracing.incoming_trace_id({"X-Trace-Id": "abc-12345"}) == "abc-12345"
+    assert tracing.incoming_trace_id({"X-Trace-Id": "bad id\n"}) is None
+    traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    assert tracing.incoming_trace_id({"traceparent": traceparent}) == "0af7651916cd43dd8448eb211c80319c"
+    assert tracing.incoming_trace_id({"traceparent": "garbage"}) is None
+
+def test_outgoing_traceparent_names_the_current_span():
+    trace = tracing.Trace("0af7651916cd43dd8448eb211c80319c")
+    with tracing.trace_request(trace), tracing.span("model_call") as span:
+        assert tracing.outgoing_headers() == {"traceparent": f"00-{trace.trace_id}-{span.span_id}-01"}
+
+def test_log_records_carry_the_trace_id():
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    with tracing.trace_request(tracing.Trace("trace-under-test")):
+        tracing.TraceIdFilter().filter(record)
+    assert record.trace_id == "trace-under-test"
+    tracing.TraceIdFilter().filter(record)
+    assert record.trace_id == "-"
+
+def test_flask_response_echoes_the_callers_trace_id():
+    response = app.test_client().post('/curl/chat', json={"message": "trace me"}, headers={"X-Trace-Id": "caller-trace-1"})
+    assert response.status_code == 200
+    assert response.headers[tracing.TRACE_HEADER] == "caller-trace-1"
+
+def test_slow_flask_request_logs_its_span_tree(monkeypatch, caplog):
+    monkeypatch.setitem(app.config, 'TRACE_SLOW_REQUEST_MS', 0.000001)
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = app.test_client().post('/ollama/api/chat', json={
+            "model": "test", "messages": [{"role": "user", "content": "slow trace"}], "stream": False})
+        trace_id = response.headers[tracing.TRACE_HEADER]
+        response.close()
+    slow = [record.getMessage() for record in caplog.records if "Slow request" in record.getMessage()]
+    assert slow and trace_id in slow[0]
+    assert "session_setup" in slow[0] and "orchestrator" in slow[0]
+
+def test_asgi_response_carries_a_trace_id(application):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps({"message": "hi"}).encode(), 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/curl/chat', 'headers': [(b'x-trace-id', b'asgi-trace-1')]}
+    asyncio.run(application(scope, receive, send))
+    assert (b'x-trace-id', b'asgi-trace-1') in sent[0]['headers']
@@ -0,0 +1,174 @@
+"""Per-request span tracing with trace IDs that show up in response headers and log lines.
+
+`trace_request()` opens a trace for one request. Every `stage_timer` opened inside it (see
+python_app.metrics) also records a span, nested under the span that was open when it started:
+- parse and prompt_build
+- message_build, for the LangChain messages
+- chat_memory
+- model_call
+- pantry_store
+- db, one per SQL statement
+
+The trace ID comes from the caller's X-Trace-Id or W3C traceparent header when it sends a valid
+one, and is sent back as X-Trace-Id. Outgoing model calls pass it on as a traceparent. Requests
+slower than a threshold log their span tree, so a slow request shows where its time went.
+
+Outside a trace, recording a span is a single contextvar lookup.
+"""
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import random
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TRACE_HEADER = "X-Trace-Id"
+
+_TRACE_ID = re.compile(r"^[0-9A-Za-z-]{8,64}$")
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+@dataclasses.dataclass
+class Span:
+    name: str
+    span_id: str
+    parent: Optional["Span"]
+    started_ns: int
+    duration_ns: Optional[int] = None # None while the span is still open
+
+class Trace:
+    """The spans of one request, in the order they started; at most `max_spans` are kept."""
+    def __init__(self, trace_id: Optional[str] = None, max_spans: int = 256):
+        self.trace_id = trace_id or new_trace_id()
+        self.started_ns = time.perf_counter_ns()
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def _add(self, span: Span) -> bool:
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def duration_ns(self) -> int:
+        return time.perf_counter_ns() - self.started_ns
+
+    def totals(self) -> Dict[str, int]:
+        """Nanoseconds per span name, summed over finished spans."""
+        totals: Dict[str, int] = {}
+        for span in self.spans:
+            if span.duration_ns is not None:
+                totals[span.name] = totals.get(span.name, 0) + span.duration_ns
+        return totals
+
+    def format_tree(self) -> str:
+        """One line per span, indented under its parent, with its offset and duration in milliseconds."""
+        depths: Dict[int, int] = {}
+        lines = []
+        for span in self.spans:
+            depth = depths[id(span)] = depths.get(id(span.parent), -1) + 1 if span.parent is not None else 0
+            duration = f"{span.duration_ns / 1e6:.1f} ms" if span.duration_ns is not None else "open"
+            lines.append(f"{'  ' * depth}{span.name} +{(span.started_ns - self.started_ns) / 1e6:.1f} ms {duration}")
+        if self.dropped:
+            lines.append(f"... {self.dropped} more spans not kept")
+        return "\n".join(lines)
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+def incoming_trace_id(headers) -> Optional[str]:
+    """The caller's trace ID, from X-Trace-Id or a W3C traceparent header, if it is well-formed."""
+    value = headers.get(TRACE_HEADER) or headers.get(TRACE_HEADER.lower())
+    if value and _TRACE_ID.match(value):
+        return value
+    traceparent = headers.get("traceparent")
+    match = _TRACEPARENT.match(traceparent) if traceparent else None
+    return match.group(1) if match else None
+
+def activate(trace: Trace) -> Tuple[contextvars.Token, contextvars.Token]:
+    """Makes spans in this context (and tasks started from it) record into `trace`, until `deactivate`."""
+    return _current_trace.set(trace), _current_span.set(None)
+
+def deactivate(tokens: Tuple[contextvars.Token, contextvars.Token]):
+    trace_token, span_token = tokens
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+
+@contextlib.contextmanager
+def trace_request(trace: Optional[Trace] = None) -> Iterator[Trace]:
+    trace = trace or Trace()
+    tokens = activate(trace)
+    try:
+        yield trace
+    finally:
+        deactivate(tokens)
+
+def start_span(name: str, started_ns: Optional[int] = None) -> Optional[Span]:
+    """Opens a span under the current one; returns None (and does nothing else) outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    span = Span(name, _new_span_id(), _current_span.get(), started_ns or time.perf_counter_ns())
+    if not trace._add(span):
+        return None
+    _current_span.set(span)
+    return span
+
+def end_span(span: Span, duration_ns: Optional[int] = None):
+    span.duration_ns = duration_ns if duration_ns is not None else time.perf_counter_ns() - span.started_ns
+    # Set back rather than reset with a token: a span opened in a generator may be closed from another context
+    _current_span.set(span.parent)
+
+def record_span(name: str, started_ns: int, duration_ns: int):
+    """Adds an already finished span under the current one, for work timed by callbacks (SQL statements)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace._add(Span(name, _new_span_id(), _current_span.get(), started_ns, duration_ns))
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[Optional[Span]]:
+    """A span around code that isn't a metrics stage (stage_timer records both)."""
+    opened = start_span(name)
+    try:
+        yield opened
+    finally:
+        if opened is not None:
+            end_span(opened)
+
+def outgoing_headers() -> Dict[str, str]:
+    """A traceparent for calls to other services, so their logs can be matched to this request."""
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    trace_id = trace.trace_id if re.fullmatch(r"[0-9a-f]{32}", trace.trace_id) else new_trace_id()
+    parent = _current_span.get()
+    return {"traceparent": f"00-{trace_id}-{parent.span_id if parent is not None else _new_span_id()}-01"}
+
+def log_if_slow(trace: Trace, threshold_ms: float, description: str, logger: logging.Logger):
+    duration_ms = trace.duration_ns() / 1e6
+    if threshold_ms and duration_ms >= threshold_ms:
+        # Set again, as the request's own context may be gone by now, so the log line carries its trace ID
+        with trace_request(trace):
+            logger.warning(f"Slow request {description} took {duration_ms:.1f} ms, trace {trace.trace_id}:\n{trace.format_tree()}")
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to every record ("-" outside a trace), for formats like "[trace %(trace_id)s]"."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True